@@ -5,7 +5,16 @@ BEGIN
         source NVARCHAR(250) NOT NULL,
         format NVARCHAR(50) NOT NULL,
         destination NVARCHAR(250) NOT NULL,
-        projected_columns NVARCHAR(1000) NULL
+        projected_columns NVARCHAR(1000) NULL,
+        weight INT NOT NULL DEFAULT 1,
+        load_mode NVARCHAR(50) NOT NULL DEFAULT 'full',
+        key_columns NVARCHAR(1000) NULL,
+        [schema] NVARCHAR(4000) NULL,
+        order_column NVARCHAR(250) NULL,
+        is_unique BIT NOT NULL DEFAULT 0,
+        partition_columns NVARCHAR(1000) NULL,
+        cluster_by NVARCHAR(1000) NULL,
+        target_file_size_mb INT NULL
     );
 END;
 
@@ -21,6 +30,35 @@ BEGIN
         [arguments] [nvarchar](1000) NOT NULL DEFAULT '{"useRootDefaultLakehouse": true}',
         [dependencies] [nvarchar](1000) NULL,
         [group] [nvarchar](250) NOT NULL DEFAULT 'default',
+        [resource_class] [nvarchar](250) NULL,
+        [spark_profile] [nvarchar](250) NULL,
+        [is_enabled] bit NOT NULL DEFAULT 1
+    );
+END;
+
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='fact_lookup' AND xtype='U')
+BEGIN
+    CREATE TABLE [dbo].[fact_lookup](
+        [id] [int] IDENTITY(1,1) PRIMARY KEY,
+        [fact_name] [nvarchar](250) NOT NULL,
+        [dimension_name] [nvarchar](250) NOT NULL,
+        [fact_columns] [nvarchar](1000) NOT NULL,
+        [dimension_columns] [nvarchar](1000) NOT NULL,
+        [surrogate_key] [nvarchar](250) NOT NULL,
+        [is_enabled] bit NOT NULL DEFAULT 1
+    );
+END;
+
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='data_quality_rules' AND xtype='U')
+BEGIN
+    CREATE TABLE [dbo].[data_quality_rules](
+        [id] [int] IDENTITY(1,1) PRIMARY KEY,
+        [entity] [nvarchar](250) NOT NULL,
+        [rule_name] [nvarchar](250) NOT NULL,
+        [rule_type] [nvarchar](50) NOT NULL,
+        [column_name] [nvarchar](250) NOT NULL,
+        [rule_parameters] [nvarchar](1000) NULL,
+        [action] [nvarchar](50) NOT NULL DEFAULT 'quarantine',
         [is_enabled] bit NOT NULL DEFAULT 1
     );
 END;
@@ -17,9 +17,10 @@ sys.path.append(os.getcwd())
 
 import modules.fabric_functions as fabfunc
 import modules.misc_functions as miscfunc
+import modules.config_functions as configfunc
 import modules.auth_functions as authfunc
 
-feature_json = miscfunc.load_json(os.path.join(os.path.dirname(__file__), f'../environments/feature.json'))
+feature_json = configfunc.load_feature_definition()
 layers = feature_json.get("layers")
 dev_env_name = feature_json.get("feature_name")
 git_integration = feature_json.get("git_integration")
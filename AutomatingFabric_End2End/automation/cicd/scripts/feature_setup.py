@@ -18,6 +18,7 @@ sys.path.append(os.getcwd())
 
 import modules.fabric_functions as fabfunc
 import modules.misc_functions as miscfunc
+import modules.config_functions as configfunc
 import modules.auth_functions as authfunc
 import modules.devops_functions as devopsfunc
 
@@ -34,7 +35,7 @@ feature_name = args.feature_name
 feature_prefix = args.feature_prefix
 action = args.action.lower()
 
-feature_json = miscfunc.load_json(os.path.join(os.path.dirname(__file__), f'../environments/feature.json'))
+feature_json = configfunc.load_feature_definition()
 layers = feature_json.get("layers")
 permissions = feature_json.get("permissions")
 capacity_id = feature_json.get("capacity_id")
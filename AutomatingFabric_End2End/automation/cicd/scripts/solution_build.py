@@ -22,6 +22,7 @@ sys.path.append(os.getcwd())
 
 import modules.fabric_functions as fabfunc
 import modules.misc_functions as miscfunc
+import modules.config_functions as configfunc
 import modules.auth_functions as authfunc
 
 # Get arguments 
@@ -41,10 +42,8 @@ solution_path = args.solution_path
 
 is_devops_run = True if os.getenv("SYSTEM_TEAMFOUNDATIONCOLLECTIONURI") else False
 
-# Load JSON files and merge
-main_json = miscfunc.load_json(os.path.join(os.path.dirname(__file__), f'../environments/infrastructure.json'))
-env_json = miscfunc.load_json(os.path.join(os.path.dirname(__file__), f'../environments/infrastructure.{environment}.json'))
-env_definition = miscfunc.merge_json(main_json, env_json)
+# Load merged and validated environment definition (cached per file modification time)
+env_definition = configfunc.load_environment_definition(environment)
 
 env_credentials = authfunc.get_environment_credentials(environment, os.path.join(os.path.dirname(__file__), f'../../credentials/'))
 
@@ -0,0 +1,53 @@
+#---------------------------------------------------------
+# Default values
+#---------------------------------------------------------
+default_notebook_path = "../solution/prepare/AquaShack_Functions.Notebook/notebook-content.py"
+default_package_name = "aquashack_functions"
+default_version = "1.0.0"
+default_output_path = "dist"
+
+#---------------------------------------------------------
+# Main script
+#---------------------------------------------------------
+import os, sys, argparse
+
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+sys.path.append(os.getcwd())
+
+import modules.library_functions as libfunc
+import modules.misc_functions as miscfunc
+
+# Get arguments
+parser = argparse.ArgumentParser(description="Build a versioned wheel from the code cells of a functions notebook")
+parser.add_argument("--notebook_path", required=False, default=default_notebook_path, help="Path to the notebook-content.py file of the functions notebook.")
+parser.add_argument("--package_name", required=False, default=default_package_name, help="Name of the package to import in notebooks.")
+parser.add_argument("--version", required=False, default=default_version, help="Version of the package, e.g. the build number.")
+parser.add_argument("--output_path", required=False, default=default_output_path, help="Folder to write the wheel to.")
+parser.add_argument("--fabric_token", required=False, default=None, help="Microsoft Entra ID token for Fabric API. Only needed when uploading to an environment.")
+parser.add_argument("--workspace_id", required=False, default=None, help="Workspace of the environment to upload the wheel to.")
+parser.add_argument("--environment_id", required=False, default=None, help="Environment to upload and publish the wheel to. The wheel is only built if omitted.")
+
+args = parser.parse_args()
+
+miscfunc.print_header(f"Building {args.package_name} {args.version}")
+
+try:
+    source = libfunc.get_library_source(args.notebook_path, args.package_name, args.version)
+except SyntaxError as e:
+    miscfunc.print_error(f"Notebook {args.notebook_path} is not valid Python: {e}")
+    sys.exit(1)
+
+wheel_path = libfunc.build_wheel(source, args.package_name, args.version, args.output_path, f"Functions of {os.path.basename(os.path.dirname(os.path.abspath(args.notebook_path)))}")
+miscfunc.print_success(f"Built {wheel_path}")
+
+if args.environment_id:
+    import modules.fabric_functions as fabfunc
+
+    if not args.fabric_token or not args.workspace_id:
+        miscfunc.print_error("Both --fabric_token and --workspace_id are required to upload to an environment.")
+        sys.exit(1)
+
+    if fabfunc.upload_environment_library(args.fabric_token, args.workspace_id, args.environment_id, wheel_path, True) is None:
+        sys.exit(1)
+    if fabfunc.publish_environment(args.fabric_token, args.workspace_id, args.environment_id, True) is None:
+        sys.exit(1)
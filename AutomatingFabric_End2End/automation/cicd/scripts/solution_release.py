@@ -5,11 +5,12 @@ default_solution_path = "C:\\repos\\PeerInsights\\FabCon25\\solution"
 default_item_types_in_scope = "Notebook,DataPipeline"
 default_layers_in_scope = "prepare,ingest"
 default_environment = "tst"
+default_deploy_mode = "fabric-cicd" # Options: fabric-cicd/folder
 
 #---------------------------------------------------------
 # Main script
 #---------------------------------------------------------
-import os, sys, argparse
+import os, sys, argparse, glob
 from fabric_cicd import FabricWorkspace, publish_all_items, unpublish_all_orphan_items, change_log_level
 from datetime import datetime
 
@@ -24,7 +25,9 @@ sys.path.append(os.getcwd())
 
 import modules.fabric_functions as fabfunc
 import modules.misc_functions as miscfunc
+import modules.config_functions as configfunc
 import modules.auth_functions as authfunc
+import modules.runstate_functions as runfunc
 
 # Get arguments 
 parser = argparse.ArgumentParser(description="Fabric release arguments")
@@ -33,6 +36,9 @@ parser.add_argument("--env", required=False, default=default_environment, help="
 parser.add_argument("--layers", required=False, default=default_layers_in_scope, help="Comma seperated list of layers to deploy. Can also be single layer.")
 parser.add_argument("--item_types", required=False, default=default_item_types_in_scope, help="Comma seperated list of item types in scope. Must match Fabric ItemTypes exactly.")
 parser.add_argument("--solution_path", required=False, default=default_solution_path, help="Path the the solution repository where items are stored.")
+parser.add_argument("--resume", required=False, action="store_true", help="Resume an interrupted release by skipping layers released in the previous run.")
+parser.add_argument("--deploy_mode", required=False, default=default_deploy_mode, choices=["fabric-cicd", "folder"], help="fabric-cicd publishes items using fabric-cicd. folder deploys the item folders directly and skips items unchanged since the last release. Default is fabric-cicd.")
+parser.add_argument("--library_path", required=False, default=None, help="Folder with the wheels built by solution_build_library.py. Uploaded to the environments of the layers declaring a library.")
 
 args = parser.parse_args()
 fabric_token = args.fabric_token
@@ -40,13 +46,14 @@ environment = args.env
 included_layers_list = [layer.strip().lower() for layer in args.layers.split(",")]
 item_type_list = args.item_types.split(",")
 solution_path = args.solution_path
+resume = args.resume
+library_path = args.library_path
+deploy_mode = args.deploy_mode
 
 is_devops_run = True if os.getenv("SYSTEM_TEAMFOUNDATIONCOLLECTIONURI") else False
 
-# Load JSON files and merge
-main_json = miscfunc.load_json(os.path.join(os.path.dirname(__file__), f'../environments/infrastructure.json'))
-env_json = miscfunc.load_json(os.path.join(os.path.dirname(__file__), f'../environments/infrastructure.{environment}.json'))
-env_definition = miscfunc.merge_json(main_json, env_json)
+# Load merged and validated environment definition (cached per file modification time)
+env_definition = configfunc.load_environment_definition(environment)
 
 env_credentials = authfunc.get_environment_credentials(environment, os.path.join(os.path.dirname(__file__), f'../../credentials/'))
 
@@ -61,6 +68,13 @@ miscfunc.print_header(f"Releasing to {environment} environment") if not is_devop
 
 token_credential = authfunc.StaticTokenCredential(fabric_token)
 
+# Run-state journal of released layers. Used by --resume to skip layers already released and reuse their workspace IDs
+run_state_file = os.path.join(os.path.dirname(__file__), f'../../runstate/solution_release.jsonl')
+completed_steps = runfunc.start_run_state(run_state_file, resume)
+
+# Part hashes of items deployed in folder mode. Used to skip items whose definition is unchanged since the last release
+deploy_hash_file = os.path.join(os.path.dirname(__file__), f'../../runstate/solution_release_hashes.json')
+
 if env_definition:
     solution_name = env_definition.get("name")
     layers = env_definition.get("layers")
@@ -72,10 +86,16 @@ if env_definition:
 
     combined_environment_parameter = {}
     item_mapping = {}
+    workspace_ids = {}
     for layer, layer_definition in sorted_layers.items():
         if layer.lower() in included_layers_list:        
             workspace_name = solution_name.format(layer=layer, environment=environment)
-            workspace_id = fabfunc.get_workspace_by_name(fabric_token, workspace_name).get("id")
+            layer_step = runfunc.get_step_key(environment, layer)
+            if layer_step in completed_steps:
+                workspace_id = completed_steps[layer_step].get("workspace_id")
+            else:
+                workspace_id = fabfunc.get_workspace_by_name(fabric_token, workspace_name).get("id")
+            workspace_ids[layer] = workspace_id
 
             repo_dir = os.path.join(solution_path, layer.lower())
             
@@ -96,7 +116,8 @@ if env_definition:
         
         if layer.lower() in included_layers_list:        
             workspace_name = solution_name.format(layer=layer, environment=environment)
-            workspace_id = fabfunc.get_workspace_by_name(fabric_token, workspace_name).get("id")
+            workspace_id = workspace_ids[layer]
+            layer_step = runfunc.get_step_key(environment, layer)
 
             miscfunc.print_info(f"Releasing {layer} to {environment} in workspace {workspace_name}!", True) if not is_devops_run else None
 
@@ -113,8 +134,15 @@ if env_definition:
             combined_environment_parameter = {**target_workspace.environment_parameter, **combined_environment_parameter}
             target_workspace.environment_parameter = combined_environment_parameter
 
-            # Publish all identity supported items from the repository to the target workspace
-            publish_all_items(target_workspace)
+            if layer_step in completed_steps:
+                miscfunc.print_warning(f"Skipped release of {layer} to workspace {workspace_name}! Completed in previous run.", True)
+            elif deploy_mode == "folder":
+                # Deploy the item folders with the find_replace values of the environment, skipping unchanged items
+                replacements = {token: values[environment] for token, values in combined_environment_parameter.get("find_replace", {}).items() if environment in values}
+                fabfunc.deploy_items_from_folder(fabric_token, workspace_id, repo_dir, replacements, deploy_hash_file, item_type_list)
+            else:
+                # Publish all identity supported items from the repository to the target workspace
+                publish_all_items(target_workspace)
 
             # Support deployment to multiple layers in the same environment by adding the guid mappings to the environment parameter dictionary
             if combined_environment_parameter:
@@ -124,9 +152,27 @@ if env_definition:
 
             combined_environment_parameter["find_replace"][item_details.logical_id] = {environment: item_details.guid}
 
-            # Unpublish all items that are not in the repository but are in the target workspace
-            unpublish_all_orphan_items(target_workspace)
+            if layer_step not in completed_steps:
+                # Unpublish all items that are not in the repository but are in the target workspace
+                unpublish_all_orphan_items(target_workspace)
+
+                # Notebooks import the functions library from the workspace default environment, so the library is released with them
+                for environment_item in (layer_definition.get("items") or {}).get("Environment", []):
+                    library = environment_item.get("library")
+                    if not library or not library_path:
+                        continue
+
+                    wheel_paths = sorted(glob.glob(os.path.join(library_path, f"{library.get('package_name')}-*.whl")), key=os.path.getmtime)
+                    fabric_environment = fabfunc.get_item_by_name(fabric_token, workspace_id, environment_item.get("item_name"), "Environment")
+                    if not wheel_paths or not fabric_environment:
+                        miscfunc.print_error(f"Library {library.get('package_name')} or environment {environment_item.get('item_name')} not found! Release of {layer} has failed.", True)
+                        sys.exit(1)
+
+                    if fabfunc.replace_environment_library(fabric_token, workspace_id, fabric_environment["id"], wheel_paths[-1], True) is None \
+                            or fabfunc.publish_environment(fabric_token, workspace_id, fabric_environment["id"], True) is None:
+                        sys.exit(1)
 
-            miscfunc.print_info(f"Release to workspace {workspace_name} completed! Environment: {environment}, layer: {layer} ", True)
+                runfunc.record_step(run_state_file, layer_step, {"workspace_id": workspace_id, "workspace_name": workspace_name})
+                miscfunc.print_info(f"Release to workspace {workspace_name} completed! Environment: {environment}, layer: {layer} ", True)
 else:
     miscfunc.print_error(f"No environment definition found for environment {environment}! Release of {environment} has been skipped.", True)
\ No newline at end of file
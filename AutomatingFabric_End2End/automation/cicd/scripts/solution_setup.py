@@ -7,7 +7,7 @@ default_environments = "dev,tst,prd"
 #---------------------------------------------------------
 # Main script
 #---------------------------------------------------------
-import os, sys, argparse, re
+import os, sys, argparse, re, tempfile
 from datetime import datetime
 
 start_time = datetime.now()
@@ -17,9 +17,12 @@ sys.path.append(os.getcwd())
 
 import modules.fabric_functions as fabfunc
 import modules.misc_functions as miscfunc
+import modules.config_functions as configfunc
 import modules.auth_functions as authfunc
 import modules.azure_functions as azfunc
 import modules.devops_functions as devopsfunc
+import modules.runstate_functions as runfunc
+import modules.library_functions as libfunc
 
 # Get arguments
 parser = argparse.ArgumentParser(description="Fabric solution setup arguments")
@@ -27,11 +30,13 @@ parser.add_argument("--environments", required=False, default=default_environmen
 parser.add_argument("--fabric_token", required=False, default=None, help="Microsoft Entra ID token for Fabric API based on signed in user. Default is None.")
 parser.add_argument("--management_token", required=False, default=None, help="Microsoft Entra ID token for Azure Management based on signed in user. Default is None.")
 parser.add_argument("--action", required=False, default=action, help="Indicates the action to perform (Create/Delete). Default is Create.")
+parser.add_argument("--resume", required=False, action="store_true", help="Resume an interrupted Create run by skipping steps completed in the previous run.")
 
 args = parser.parse_args()
 environments = args.environments.split(",")
 fabric_token = args.fabric_token
 action = args.action.lower()
+resume = args.resume
 
 fabric_upn_token = None
 # if fabric_token:
@@ -63,14 +68,18 @@ if response == "y":
 yaml_file = os.path.join(os.path.dirname(__file__), f'../../cicd/parameters/parameter.yml') # Set to None when skipping creation of yml paramater file. Also see https://microsoft.github.io/fabric-cicd/
 all_environments = {}
 
+# Run-state journal of completed steps. Used by --resume to skip completed steps and rehydrate their IDs
+run_state_file = os.path.join(os.path.dirname(__file__), f'../../runstate/solution_setup.jsonl')
+run_state_item_keys = ["id", "sql_endpoint_id", "sql_endpoint_connectionstring", "sql_database_fqdn", "sql_database_name",
+                       "pbi_connection_name", "pbi_connection_id", "pbi_connection_clusterid"] # Secrets such as connection strings with passwords are never journaled
+
 if action == "create":
     # Create Fabric solution in the specified environments
+    completed_steps = runfunc.start_run_state(run_state_file, resume)
 
     for environment in environments:
-        # Load JSON files and merge
-        main_json = miscfunc.load_json(os.path.join(os.path.dirname(__file__), f'../environments/infrastructure.json'))
-        env_json = miscfunc.load_json(os.path.join(os.path.dirname(__file__), f'../environments/infrastructure.{environment}.json'))
-        env_definition = miscfunc.merge_json(main_json, env_json)
+        # Load merged and validated environment definition (cached per file modification time)
+        env_definition = configfunc.load_environment_definition(environment)
 
         if env_definition:
             env_credentials = authfunc.get_environment_credentials(environment, os.path.join(os.path.dirname(__file__), f'../../credentials/'))
@@ -83,33 +92,64 @@ if action == "create":
             solution_name = env_definition.get("name")
             layers = env_definition.get("layers")
             default_capacityid = env_definition.get("generic").get("capacity_id")
+            # SPARK_PROFILES of the functions notebook is the single source of the profiles, for the notebooks and the environments alike
+            spark_profiles_notebook = env_definition.get("generic").get("spark_profiles_notebook")
+            spark_profiles = libfunc.get_notebook_constant(os.path.join(os.path.dirname(__file__), spark_profiles_notebook), "SPARK_PROFILES") if spark_profiles_notebook else None
+            spark_profiles = spark_profiles or {}
             
             for layer, layer_definition in layers.items():
                 print("")
                 workspace_name = solution_name.format(layer=layer, environment=environment)
-                workspace = fabfunc.create_workspace(fabric_token, workspace_name, "Workspace automatically created from setup script.")
-                workspace_id = workspace.get("id")
-                
+                layer_step = runfunc.get_step_key(environment, layer)
+                workspace_step = runfunc.get_step_key(environment, layer, "Workspace")
+                permissions = layer_definition.get("permissions") or env_definition.get("generic", {}).get("permissions")
+
+                if layer_step in completed_steps:
+                    # Rehydrate IDs from the previous run and skip the layer
+                    layer_definition.update(completed_steps[layer_step])
+                    for item_type, items in (layer_definition.get("items") or {}).items():
+                        for item in items:
+                            item.update(completed_steps.get(runfunc.get_step_key(environment, layer, item_type, item.get("item_name")), {}))
+                    miscfunc.print_info(f"→ Setting up workspace {workspace_name}... ", bold=True, end="")
+                    miscfunc.print_warning(f"Skipped! Completed in previous run ({layer_definition.get('workspace_id')}).", bold=True)
+                    continue
+
+                if workspace_step in completed_steps:
+                    workspace_id = completed_steps[workspace_step].get("workspace_id")
+                    miscfunc.print_info(f"→ Setting up workspace {workspace_name}... ", bold=True, end="")
+                    miscfunc.print_warning(f"Skipped! Completed in previous run ({workspace_id}).", bold=True)
+                else:
+                    workspace = fabfunc.create_workspace(fabric_token, workspace_name, "Workspace automatically created from setup script.")
+                    workspace_id = workspace.get("id")
+
+                    capacity_id = layer_definition.get("capacity_id", default_capacityid)
+                    fabfunc.assign_workspace_to_capacity(fabric_token, workspace_id, capacity_id)
+                    
+                    print(f"  → Assigning workspace permissions... ", end="")
+                    miscfunc.print_success("Done!")
+                    
+                    if permissions:
+                        for permission, definitions in permissions.items():
+                            for definition in definitions:
+                                fabfunc.add_workspace_user(fabric_token, workspace_id, permission, definition.get("type"), definition.get("id"))
+
+                    runfunc.record_step(run_state_file, workspace_step, {"workspace_id": workspace_id, "workspace_name": workspace_name})
+
                 # Update layer_definition
                 layer_definition["workspace_id"] = workspace_id
                 layer_definition["workspace_name"] = workspace_name
 
-                capacity_id = layer_definition.get("capacity_id", default_capacityid)
-                fabfunc.assign_workspace_to_capacity(fabric_token, workspace_id, capacity_id)
-                
-                print(f"  → Assigning workspace permissions... ", end="")
-                permissions = layer_definition.get("permissions") or env_definition.get("generic", {}).get("permissions")
-                miscfunc.print_success("Done!")
-                
-                if permissions:
-                    for permission, definitions in permissions.items():
-                        for definition in definitions:
-                            fabfunc.add_workspace_user(fabric_token, workspace_id, permission, definition.get("type"), definition.get("id"))
-
                 if layer_definition.get("items"):
                     print(f"  → Creating workspace items...")
                     for item_type, items in layer_definition.get("items").items():
                         for item in items:
+                            item_step = runfunc.get_step_key(environment, layer, item_type, item.get("item_name"))
+                            if item_step in completed_steps:
+                                item.update(completed_steps[item_step])
+                                print(f"    • Creating {item_type} {item.get('item_name')}... ", end="")
+                                miscfunc.print_warning(f"Skipped! Completed in previous run ({item.get('id')}).")
+                                continue
+
                             item_result = fabfunc.create_item(fabric_token, workspace_id, item.get("item_name"), item_type, None, True, True)
                             
                             if not item_result:
@@ -136,6 +176,26 @@ if action == "create":
                                             if conn:
                                                 fabfunc.sql_execute_nonquery(conn, sql_script)
                                                 conn.close
+                            elif item_type == "Environment" and (item.get("spark_profile") or item.get("library")):
+                                is_staged = True
+                                if item.get("spark_profile"):
+                                    spark_profile = spark_profiles.get(item.get("spark_profile"))
+                                    if spark_profile is None:
+                                        miscfunc.print_error(f"      - Spark profile {item.get('spark_profile')} is not defined in SPARK_PROFILES of spark_profiles_notebook!")
+                                        is_staged = False
+                                    else:
+                                        is_staged = fabfunc.update_environment_spark_properties(fabric_token, workspace_id, item["id"], spark_profile, True) is not None
+
+                                # Notebooks without an environment of their own import the functions library from the workspace default environment
+                                if is_staged and item.get("library"):
+                                    library = item.get("library")
+                                    notebook_path = os.path.join(os.path.dirname(__file__), library.get("notebook"))
+                                    source = libfunc.get_library_source(notebook_path, library.get("package_name"), "1.0.0")
+                                    wheel_path = libfunc.build_wheel(source, library.get("package_name"), "1.0.0", tempfile.mkdtemp())
+                                    is_staged = fabfunc.replace_environment_library(fabric_token, workspace_id, item["id"], wheel_path, True) is not None
+
+                                if is_staged:
+                                    fabfunc.publish_environment(fabric_token, workspace_id, item["id"], True)
         
                             if env_credentials is not None and item.get("connection_name") and item_type in {"Lakehouse", "SQLDatabase"} and (item.get("sql_database_fqdn") or item.get("sql_endpoint_connectionstring")):
                                 connection = item.get("connection_name").format(layer=layer, environment=environment)
@@ -161,7 +221,13 @@ if action == "create":
                                     item["pbi_connection_name"] = connection
                                     item["pbi_connection_id"] = datasource.get("id")
                                     item["pbi_connection_clusterid"] = datasource.get("clusterId")
+
+                            runfunc.record_step(run_state_file, item_step, {key: item[key] for key in run_state_item_keys if key in item})
                     
+                # After the items, so the settings can refer to an environment of the layer as the workspace default
+                if layer_definition.get("spark_settings"):
+                    fabfunc.update_workspace_spark_settings(fabric_token, workspace_id, layer_definition.get("spark_settings"), True)
+
                 if layer_definition.get("private_endpoints"):
                     print("  → Creating private endpoints... ")
                     for private_endpoint in layer_definition.get("private_endpoints"):
@@ -195,9 +261,9 @@ if action == "create":
                         git_layer_props.get("devops_folder", git_default_props.get("devops_folder")))
                     
                     if connect_response is not None:
-                        init_response = fabfunc.initialize_workspace_git_connection(fabric_upn_token, workspace.get('id'))
+                        init_response = fabfunc.initialize_workspace_git_connection(fabric_upn_token, workspace_id)
                         if init_response and init_response.get("requiredAction") != "None" and init_response.get("remoteCommitHash"):
-                            fabfunc.update_workspace_from_git(fabric_upn_token, workspace.get('id'), init_response["remoteCommitHash"])
+                            fabfunc.update_workspace_from_git(fabric_upn_token, workspace_id, init_response["remoteCommitHash"])
 
                 wsicon_default = env_definition.get("generic").get("workspace_icon")
                 wsicon_layer = layer_definition.get("workspace_icon")
@@ -209,7 +275,9 @@ if action == "create":
                     icon_path = os.path.join(os.path.dirname(__file__), wsicon_layer if wsicon_layer else wsicon_default)
                     if os.path.exists(icon_path):
                         base64_str = miscfunc.image_to_base64(icon_path)
-                        fabfunc.set_workspace_icon(fabric_upn_token, workspace.get('id'), cluster_base_url, base64_str)
+                        fabfunc.set_workspace_icon(fabric_upn_token, workspace_id, cluster_base_url, base64_str)
+
+                runfunc.record_step(run_state_file, layer_step, {"workspace_id": workspace_id, "workspace_name": workspace_name})
 
         else:
             miscfunc.print_warning(f"No environment definition found for {environment}... Skipping setup!")
@@ -260,10 +328,11 @@ else:
             credential = authfunc.create_credentials_from_user()
             fabric_token = credential.get_token("https://api.fabric.microsoft.com/.default").token
 
-        # Load JSON files and merge
-        main_json = miscfunc.load_json(os.path.join(os.path.dirname(__file__), f'../environments/infrastructure.json'))
-        env_json = miscfunc.load_json(os.path.join(os.path.dirname(__file__), f'../environments/infrastructure.{environment}.json'))
-        env_definition = miscfunc.merge_json(main_json, env_json)
+        # Load merged and validated environment definition (cached per file modification time)
+        env_definition = configfunc.load_environment_definition(environment)
+        if not env_definition:
+            miscfunc.print_warning(f"No environment definition found for {environment}... Skipping deletion!")
+            continue
     
         miscfunc.print_header(f"Deleting {environment} environment")
         
@@ -0,0 +1,80 @@
+#---------------------------------------------------------
+# Default values
+#---------------------------------------------------------
+default_solution_path = "../solution"
+default_functions_notebook = "prepare/AquaShack_Functions.Notebook/notebook-content.py"
+
+#---------------------------------------------------------
+# Main script
+#---------------------------------------------------------
+import os, sys, argparse, ast, glob, time
+
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+sys.path.append(os.getcwd())
+
+import modules.misc_functions as miscfunc
+
+# Get arguments
+parser = argparse.ArgumentParser(description="Offline validation of notebook DAGs used with runMultiple")
+parser.add_argument("--solution_path", required=False, default=default_solution_path, help="Path the the solution repository where items are stored.")
+parser.add_argument("--functions_notebook", required=False, default=default_functions_notebook, help="Path of the notebook defining validate_dag, relative to the solution path.")
+parser.add_argument("--durations", required=False, default=None, help="Optional JSON file with expected seconds per activity name, e.g. exported from the run log.")
+
+args = parser.parse_args()
+start_time = time.perf_counter()
+
+def get_dag_literals(source):
+    # Cells using magics such as %run are not valid Python and never hold a DAG literal
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return []
+
+    return [
+        ast.literal_eval(node.value)
+        for node in tree.body
+        if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == "DAG" for target in node.targets) and isinstance(node.value, ast.Dict)
+    ]
+
+# Load the pure Python validation cell from the functions notebook
+functions_path = os.path.join(args.solution_path, args.functions_notebook)
+validation_cell = next((cell["source"] for cell in miscfunc.read_notebook_cells(functions_path) if cell["type"] == "code" and "def validate_dag(" in cell["source"]), None)
+if validation_cell is None:
+    miscfunc.print_error(f"No cell defining validate_dag found in {functions_path}")
+    sys.exit(1)
+
+dag_functions = {}
+exec(validation_cell, dag_functions)
+
+durations = miscfunc.load_json(args.durations) if args.durations else {}
+notebook_files = sorted(glob.glob(os.path.join(args.solution_path, "**", "*.Notebook", "notebook-content.py"), recursive=True))
+known_notebooks = [os.path.basename(os.path.dirname(file)).removesuffix(".Notebook") for file in notebook_files]
+
+miscfunc.print_header("Validating notebook DAGs")
+error_count = 0
+dag_count = 0
+
+for notebook_file in notebook_files:
+    notebook_name = os.path.basename(os.path.dirname(notebook_file)).removesuffix(".Notebook")
+
+    for cell in miscfunc.read_notebook_cells(notebook_file):
+        if cell["type"] != "code" or "DAG" not in cell["source"]:
+            continue
+
+        for dag in get_dag_literals(cell["source"]):
+            dag_count += 1
+            errors = dag_functions["validate_dag"](dag, known_notebooks)
+
+            if errors:
+                error_count += len(errors)
+                miscfunc.print_error(f"{notebook_name}: DAG is invalid")
+                for error in errors:
+                    miscfunc.print_error(f"  - {error}")
+            else:
+                length, path = dag_functions["get_critical_path"](dag, durations)
+                miscfunc.print_success(f"{notebook_name}: DAG with {len(dag['activities'])} activities is valid. Critical path {length:.0f}s: {' → '.join(path)}")
+
+miscfunc.print_info(f"Validated {dag_count} DAG(s) in {len(notebook_files)} notebooks in {(time.perf_counter() - start_time) * 1000:.0f} ms")
+
+if error_count:
+    sys.exit(1)
@@ -0,0 +1,66 @@
+#---------------------------------------------------------
+# Default values
+#---------------------------------------------------------
+default_environments = 5
+default_layers = 5
+default_items = "100,200,400,800"
+default_repeat = 3
+
+#---------------------------------------------------------
+# Main script
+#---------------------------------------------------------
+import os, sys, argparse, uuid, time
+
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../..'))
+sys.path.append(os.getcwd())
+
+import modules.misc_functions as miscfunc
+
+# Get arguments
+parser = argparse.ArgumentParser(description="Benchmark of parameter yml generation on synthetic environments")
+parser.add_argument("--environments", required=False, type=int, default=default_environments, help="Number of synthetic environments. First one is primary.")
+parser.add_argument("--layers", required=False, type=int, default=default_layers, help="Number of layers per environment.")
+parser.add_argument("--items", required=False, default=default_items, help="Comma seperated list of items per item type and layer to benchmark.")
+parser.add_argument("--repeat", required=False, type=int, default=default_repeat, help="Number of runs per size. Best run is reported.")
+
+args = parser.parse_args()
+item_type_list = ["Lakehouse", "SQLDatabase", "Notebook", "DataPipeline"]
+
+def generate_environments(environment_count, layer_count, item_count):
+    all_environments = {}
+    for env_no in range(environment_count):
+        layers = {}
+        for layer_no in range(layer_count):
+            items = {}
+            for item_type in item_type_list:
+                items[item_type] = []
+                for item_no in range(item_count):
+                    item = {"item_name": f"{item_type}{item_no}", "id": str(uuid.uuid4())}
+                    if item_type == "Lakehouse":
+                        item["sql_endpoint_id"] = str(uuid.uuid4())
+                    if item_type in {"Lakehouse", "SQLDatabase"}:
+                        item["pbi_connection_id"] = str(uuid.uuid4())
+                    items[item_type].append(item)
+            layers[f"Layer{layer_no}"] = {"workspace_id": str(uuid.uuid4()), "items": items}
+        all_environments[f"env{env_no}"] = {"layers": layers}
+    return all_environments
+
+miscfunc.print_header("Benchmarking parameter yml generation")
+miscfunc.print_info(f"{'Items/type':>12} {'Total items':>12} {'Generate (s)':>14} {'Write (s)':>11} {'YAML size':>12}", bold=True)
+
+for item_count in [int(count) for count in args.items.split(",")]:
+    all_environments = generate_environments(args.environments, args.layers, item_count)
+    total_items = args.environments * args.layers * len(item_type_list) * item_count
+
+    generate_times = []
+    write_times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        yml_data = miscfunc.create_parameter_yml(all_environments)
+        generate_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        yml_string = miscfunc.generate_yaml_string(yml_data)
+        write_times.append(time.perf_counter() - start)
+
+    print(f"{item_count:>12} {total_items:>12} {min(generate_times):>14.4f} {min(write_times):>11.4f} {len(yml_string):>12}")
@@ -0,0 +1,112 @@
+#---------------------------------------------------------
+# Default values
+#---------------------------------------------------------
+default_customers = 10000
+default_products = 1000
+default_transactions = 1000000
+default_files = 8
+default_work_path = "../local_run"
+
+#---------------------------------------------------------
+# Main script
+#---------------------------------------------------------
+import os, sys, argparse, json, shutil, time
+
+invocation_path = os.getcwd()
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.getcwd())
+
+import local_functions as localfunc
+import modules.misc_functions as miscfunc
+
+# Get arguments
+parser = argparse.ArgumentParser(description="Local benchmark of Landing to Base and Base to Curated on synthetic data")
+parser.add_argument("--customers", required=False, type=int, default=default_customers, help="Number of synthetic customers.")
+parser.add_argument("--products", required=False, type=int, default=default_products, help="Number of synthetic products.")
+parser.add_argument("--transactions", required=False, type=int, default=default_transactions, help="Number of synthetic transactions.")
+parser.add_argument("--files", required=False, type=int, default=default_files, help="Number of Landing files per entity.")
+parser.add_argument("--cores", required=False, default="*", help="Cores of the local Spark master.")
+parser.add_argument("--metadata", required=False, default=None, help="Optional JSON file with landing_to_base rows replacing the sample metadata.")
+parser.add_argument("--work_path", required=False, default=default_work_path, help="Folder for Landing files and tables, relative to the local folder. It is emptied before the run.")
+parser.add_argument("--output", required=False, default=None, help="Optional JSON file to write the results to, e.g. to compare runs in CI.")
+
+args = parser.parse_args()
+metadata_path = os.path.join(invocation_path, args.metadata) if args.metadata else None
+output_path = os.path.join(invocation_path, args.output) if args.output else None
+prepare_folder = os.path.join(localfunc.solution_folder, "prepare")
+
+# Landing files are read relative to the working directory, like Files/ is relative to the default lakehouse in Fabric
+work_path = os.path.abspath(args.work_path)
+marker_file = os.path.join(work_path, ".aquashack_local")
+if os.path.exists(work_path) and os.listdir(work_path) and not os.path.exists(marker_file):
+    miscfunc.print_error(f"{work_path} is not empty and was not created by this benchmark. Choose another --work_path.")
+    sys.exit(1)
+
+shutil.rmtree(work_path, ignore_errors=True)
+os.makedirs(work_path)
+open(marker_file, 'w').close()
+os.chdir(work_path)
+
+miscfunc.print_header("AquaShack local benchmark")
+spark = localfunc.create_spark_session(os.path.join(work_path, "warehouse"), args.cores)
+functions = localfunc.load_functions()
+
+for database in ["Landing", "Base", "Curated"]:
+    spark.sql(f"CREATE DATABASE IF NOT EXISTS {database}")
+
+start_time = time.perf_counter()
+generated_rows = localfunc.generate_sales_data(spark, work_path, args.customers, args.products, args.transactions, args.files)
+miscfunc.print_info(f"Generated Landing files in {time.perf_counter() - start_time:.1f}s: {generated_rows}")
+
+landing_to_base = miscfunc.load_json(metadata_path) if metadata_path else localfunc.sample_landing_to_base
+localfunc.create_landing_metadata(spark, landing_to_base)
+
+stages = [
+    ("Landing to Base", "Base", ["1_AquaShack_Landing_To_Base"]),
+    ("Base to Curated", "Curated", ["3_AquaShack_Load_Dimension_Customer", "3_AquaShack_Load_Dimension_Product", "3_AquaShack_Load_Dimension_Date", "4_AquaShack_Load_Fact_Sales"])
+]
+
+results = {"parameters": vars(args), "stages": {}}
+
+for stage_name, database, notebooks in stages:
+    miscfunc.print_info(f"\n{stage_name}", bold=True)
+
+    stage_start = time.perf_counter()
+    for notebook in notebooks:
+        localfunc.run_notebook(os.path.join(prepare_folder, f"{notebook}.Notebook", "notebook-content.py"), functions)
+    stage_seconds = time.perf_counter() - stage_start
+
+    entities = [row.asDict() for row in spark.table(f"{database}.{functions.RUN_LOG_TABLE}").orderBy("logged_at").collect()]
+
+    miscfunc.print_info(f"{'Entity':<24} {'Operation':<20} {'Rows':>12} {'Files':>7} {'Seconds':>9} {'Rows/s':>12}", bold=True)
+    for entity in entities:
+        rows_per_second = (entity["num_output_rows"] or 0) / entity["duration_seconds"] if entity["duration_seconds"] else 0
+        entity["rows_per_second"] = round(rows_per_second, 1)
+        print(f"{entity['entity']:<24} {entity['operation'] or '':<20} {entity['num_output_rows'] or 0:>12} {entity['num_files'] or 0:>7} {entity['duration_seconds']:>9.2f} {rows_per_second:>12.0f}")
+
+    if spark.catalog.tableExists(f"{database}.{functions.DQ_RESULTS_TABLE}"):
+        for rule in spark.table(f"{database}.{functions.DQ_RESULTS_TABLE}").where("failed_rows > 0").collect():
+            miscfunc.print_warning(f"{rule['entity']}: {rule['failed_rows']} of {rule['total_rows']} rows failed {rule['rule_name']} ({rule['action']})")
+
+    total_rows = sum(entity["num_output_rows"] or 0 for entity in entities)
+    miscfunc.print_success(f"{stage_name}: {total_rows} rows in {stage_seconds:.1f}s ({total_rows / stage_seconds:.0f} rows/s)")
+
+    results["stages"][stage_name] = {
+        "seconds": round(stage_seconds, 3),
+        "rows": total_rows,
+        "files": sum(entity["num_files"] or 0 for entity in entities),
+        "entities": [{key: entity[key] for key in ("entity", "operation", "num_output_rows", "num_files", "duration_seconds", "rows_per_second")} for entity in entities]
+    }
+
+if output_path:
+    with open(output_path, 'w') as file:
+        json.dump(results, file, indent=4)
+    miscfunc.print_info(f"\nResults written to {output_path}")
+
+spark.stop()
+
+# A stage loading no rows means the run proved nothing, so the smoke test in the pipeline fails
+empty_stages = [stage_name for stage_name, stage in results["stages"].items() if not stage["rows"]]
+if empty_stages:
+    miscfunc.print_error(f"No rows were loaded by: {', '.join(empty_stages)}")
+    sys.exit(1)
@@ -0,0 +1,263 @@
+import os, sys, time, types
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import modules.library_functions as libfunc
+import modules.misc_functions as mf
+
+solution_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../solution')
+functions_notebook = os.path.join(solution_folder, 'prepare/AquaShack_Functions.Notebook/notebook-content.py')
+
+
+class _FileInfo:
+    def __init__(self, path):
+        stat = os.stat(path)
+        self.path = f"file:{os.path.abspath(path)}"
+        self.name = os.path.basename(path)
+        self.isDir = os.path.isdir(path)
+        self.isFile = not self.isDir
+        self.size = 0 if self.isDir else stat.st_size
+        self.modifyTime = int(stat.st_mtime * 1000)
+
+
+def _local_path(path):
+    return path[len("file:"):] if path.startswith("file:") else path
+
+
+class FakeNotebookUtils(types.ModuleType):
+    """
+    Minimal local stand-in for notebookutils covering what AquaShack_Functions uses: fs.ls, fs.exists, fs.mkdirs, fs.put and runtime.context.
+    Paths are local, relative to the working directory like Files/... is relative to the default lakehouse in Fabric.
+    """
+    def __init__(self, notebook_name = "local"):
+        super().__init__("notebookutils")
+        self.fs = types.SimpleNamespace(ls=self._ls, exists=self._exists, mkdirs=self._mkdirs, put=self._put, head=self._head)
+        self.runtime = types.SimpleNamespace(context={"currentNotebookName": notebook_name, "rootActivityId": f"local-{int(time.time())}"})
+
+    def _ls(self, path):
+        path = _local_path(path)
+        if os.path.isfile(path):
+            return [_FileInfo(path)]
+        return [_FileInfo(os.path.join(path, name)) for name in sorted(os.listdir(path))]
+
+    def _exists(self, path):
+        return os.path.exists(_local_path(path))
+
+    def _mkdirs(self, path):
+        os.makedirs(_local_path(path), exist_ok=True)
+        return True
+
+    def _put(self, path, content, overwrite = False):
+        path = _local_path(path)
+        if os.path.exists(path) and not overwrite:
+            raise FileExistsError(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content)
+        return True
+
+    def _head(self, path, max_bytes = 65536):
+        with open(_local_path(path), 'r') as file:
+            return file.read(max_bytes)
+
+
+def create_spark_session(warehouse_path, cores = "*", app_name = "aquashack-local"):
+    """
+    Creates a local Spark session with Delta Lake. Tables are created in warehouse_path and registered in the in-memory catalog of the session.
+
+    Args:
+        warehouse_path (str): The folder holding the tables.
+        cores (str, optional): Cores of the local master, e.g. "4". Defaults to all cores.
+        app_name (str, optional): The name of the Spark application.
+
+    Returns:
+        pyspark.sql.SparkSession: The Spark session.
+    """
+    from pyspark.sql import SparkSession
+    from delta import configure_spark_with_delta_pip
+
+    builder = (SparkSession.builder
+        .appName(app_name)
+        .master(f"local[{cores}]")
+        .config("spark.sql.extensions", "io.delta.sql.DeltaSparkSessionExtension")
+        .config("spark.sql.catalog.spark_catalog", "org.apache.spark.sql.delta.catalog.DeltaCatalog")
+        .config("spark.sql.warehouse.dir", os.path.abspath(warehouse_path))
+        .config("spark.scheduler.mode", "FAIR")
+        .config("spark.sql.shuffle.partitions", "8")
+        .config("spark.ui.enabled", "false"))
+
+    spark = configure_spark_with_delta_pip(builder).getOrCreate()
+    spark.sparkContext.setLogLevel("WARN")
+    return spark
+
+
+def load_functions(notebook_path = functions_notebook, notebook_name = "local"):
+    """
+    Loads AquaShack_Functions as the aquashack_functions module, the same way the library built by solution_build_library.py is imported in Fabric.
+    The notebookutils shim is installed first, so the module resolves it instead of the Fabric runtime.
+
+    Args:
+        notebook_path (str, optional): The path to the functions notebook. Defaults to AquaShack_Functions of the solution.
+        notebook_name (str, optional): The notebook name reported by the shim, e.g. in the run log.
+
+    Returns:
+        module: The aquashack_functions module.
+    """
+    sys.modules["notebookutils"] = FakeNotebookUtils(notebook_name)
+
+    source = libfunc.get_library_source(notebook_path, "aquashack_functions", "0.0.0-local")
+    module = types.ModuleType("aquashack_functions")
+    module.__file__ = notebook_path
+    exec(compile(source, notebook_path, "exec"), module.__dict__)
+    sys.modules["aquashack_functions"] = module
+    return module
+
+
+def _display(df):
+    df.show(20, truncate=False) if hasattr(df, "show") else print(df)
+
+
+def run_notebook(notebook_path, functions_module, parameters = None):
+    """
+    Runs a solution notebook locally cell by cell. %%sql cells are run with spark.sql, %run AquaShack_functions and the
+    aquashack_functions import expose the functions module, and other magics are skipped.
+
+    Args:
+        notebook_path (str): The path to the notebook-content.py file.
+        functions_module (module): The functions module. See load_functions.
+        parameters (dict, optional): Values overriding the settings of the notebook, like parameters of a notebook activity.
+
+    Returns:
+        dict: The namespace of the notebook after the run.
+    """
+    notebook_name = os.path.basename(os.path.dirname(os.path.abspath(notebook_path))).removesuffix(".Notebook")
+    sys.modules["notebookutils"].runtime.context["currentNotebookName"] = notebook_name
+    spark = functions_module.spark._resolve()
+
+    namespace = {"__name__": "__main__", "spark": spark, "notebookutils": sys.modules["notebookutils"], "display": _display}
+
+    for index, cell in enumerate(mf.read_notebook_cells(notebook_path)):
+        source = cell["source"]
+        if cell["type"] != "code" or not source.strip():
+            continue
+
+        first_line = source.lstrip().splitlines()[0]
+        if first_line.startswith("# MAGIC %%sql"):
+            spark.sql("\n".join(line[len("# MAGIC"):] for line in source.splitlines()[1:] if line.startswith("# MAGIC")))
+        elif first_line.startswith("%run AquaShack_functions") or first_line.startswith("from aquashack_functions import"):
+            namespace.update({name: getattr(functions_module, name) for name in functions_module.__all__})
+        elif first_line.startswith("%") or first_line.startswith("# MAGIC"):
+            mf.print_warning(f"  Skipping magic cell {index} of {notebook_name}: {first_line}")
+            continue
+        else:
+            exec(compile(source, f"{notebook_name}[{index}]", "exec"), namespace)
+
+        namespace.update(parameters or {})
+
+    return namespace
+
+
+def generate_sales_data(spark, files_root = ".", customers = 1000, products = 100, transactions = 100000, files = 4, seed = 42, invalid_fraction = 0.001):
+    """
+    Generates synthetic Landing files for the sample metadata: Customers (csv), Products (parquet) and Transactions (csv) under Files/data/Sales.
+    Every entity is written as a folder of files, so the number of files can be scaled as well.
+
+    Args:
+        spark (pyspark.sql.SparkSession): The Spark session.
+        files_root (str, optional): The folder holding the Files folder. Defaults to the working directory.
+        customers (int, optional): Number of customers.
+        products (int, optional): Number of products.
+        transactions (int, optional): Number of transactions, dated 2022-2023 like the date dimension.
+        files (int, optional): Number of files per entity.
+        seed (int, optional): Seed of the random values.
+        invalid_fraction (float, optional): Fraction of transactions with Quantity 0, quarantined by the QuantityPositive sample rule.
+
+    Returns:
+        dict: Rows generated per entity.
+    """
+    from pyspark.sql import functions as F
+
+    sales_path = os.path.join(files_root, "Files/data/Sales")
+
+    (spark.range(customers)
+        .select(
+            (F.col("id") + 1).alias("CustomerID"),
+            F.concat(F.lit("First"), (F.col("id") % 997).cast("string")).alias("FirstName"),
+            F.concat(F.lit("Last"), (F.col("id") % 1009).cast("string")).alias("LastName"))
+        .repartition(files)
+        .write.mode("overwrite").options(delimiter=';', header=True).csv(os.path.join(sales_path, "Customers/Customers.csv")))
+
+    (spark.range(products)
+        .select(
+            (F.col("id") + 1).cast("int").alias("ProductId"),
+            F.concat(F.lit("Manufacturer"), (F.col("id") % 17).cast("string")).alias("Manufacturer"),
+            F.concat(F.lit("Product"), F.col("id").cast("string")).alias("ProductName"),
+            F.round(F.rand(seed) * 500 + 5, 2).alias("Price"))
+        .repartition(files)
+        .write.mode("overwrite").parquet(os.path.join(sales_path, "Products/Products.parquet")))
+
+    (spark.range(transactions)
+        .select(
+            (F.col("id") + 1).alias("TransactionID"),
+            (F.floor(F.rand(seed) * customers) + 1).cast("int").alias("CustomerId"),
+            (F.floor(F.rand(seed + 1) * products) + 1).cast("int").alias("ProductID"),
+            F.when(F.rand(seed + 5) < invalid_fraction, F.lit(0)).otherwise(F.floor(F.rand(seed + 2) * 5) + 1).cast("int").alias("Quantity"),
+            F.round(F.rand(seed + 3) * 1000 + 1, 2).alias("TotalPrice"),
+            F.date_add(F.lit("2022-01-01"), F.floor(F.rand(seed + 4) * 730).cast("int")).alias("TransactionDate"))
+        .repartition(files)
+        .write.mode("overwrite").options(delimiter=';', header=True).csv(os.path.join(sales_path, "Transactions/Transactions.csv")))
+
+    return {"sales_customers": customers, "sales_products": products, "sales_transactions": transactions}
+
+
+# Sample metadata of 0_1_Setup_Store with the defaults of Metadata.sql
+sample_landing_to_base = [
+    {"source": "Files/data/Sales/Customers/Customers.csv", "format": "csv", "destination": "sales_customers", "projected_columns": '["CustomerID", "FirstName", "LastName"]'},
+    {"source": "Files/data/Sales/Products/Products.parquet", "format": "parquet", "destination": "sales_products", "projected_columns": '[]'},
+    {"source": "Files/data/Sales/Transactions/Transactions.csv", "format": "csv", "destination": "sales_transactions", "projected_columns": '[]'}
+]
+
+sample_fact_lookup = [
+    ("Transactions", "Customer", '["CustomerId"]', '["CustomerID"]', "DWID_Customer"),
+    ("Transactions", "Product", '["ProductID"]', '["ProductsId"]', "DWID_Product")
+]
+
+sample_data_quality_rules = [
+    ("sales_transactions", "TransactionIdNotNull", "not_null", "TransactionID", None, "quarantine"),
+    ("sales_transactions", "QuantityPositive", "range", "Quantity", '{"min": 1}', "quarantine"),
+    ("sales_transactions", "CustomerExists", "referential", "CustomerId", '{"table": "Base.sales_customers", "column": "CustomerID"}', "warn"),
+    ("sales_customers", "CustomerIdUnique", "unique", "CustomerID", None, "warn"),
+    ("sales_customers", "CustomerIdNumeric", "regex", "CustomerID", '{"pattern": "^[0-9]+$"}', "quarantine")
+]
+
+landing_to_base_schema = "id int, source string, format string, destination string, projected_columns string, weight int, load_mode string, key_columns string, schema string, order_column string, is_unique boolean, partition_columns string, cluster_by string, target_file_size_mb int"
+
+
+def create_landing_metadata(spark, landing_to_base = sample_landing_to_base, fact_lookup = sample_fact_lookup, data_quality_rules = sample_data_quality_rules, database = "Landing"):
+    """
+    Creates the landing_to_base, fact_lookup and data_quality_rules metadata tables the notebooks read in Fabric through the SQL database shortcuts.
+
+    Args:
+        spark (pyspark.sql.SparkSession): The Spark session.
+        landing_to_base (list, optional): One dict per entity with the columns of landing_to_base. Defaults to the sample metadata.
+        fact_lookup (list, optional): One tuple per lookup with fact_name, dimension_name, fact_columns, dimension_columns and surrogate_key. Defaults to the sample metadata.
+        data_quality_rules (list, optional): One tuple per rule with entity, rule_name, rule_type, column_name, rule_parameters and action. Defaults to the sample metadata.
+        database (str, optional): The database holding the metadata. Defaults to "Landing".
+    """
+    defaults = {"weight": 1, "load_mode": "full", "key_columns": None, "schema": None, "order_column": None, "is_unique": False, "partition_columns": None, "cluster_by": None, "target_file_size_mb": None}
+    rows = [
+        (index + 1, entity["source"], entity["format"], entity["destination"], entity.get("projected_columns"),
+         *[entity.get(column, default) for column, default in defaults.items()])
+        for index, entity in enumerate(landing_to_base)
+    ]
+
+    spark.sql(f"CREATE DATABASE IF NOT EXISTS {database}")
+    spark.createDataFrame(rows, landing_to_base_schema).write.format("delta").mode("overwrite").saveAsTable(f"{database}.landing_to_base")
+
+    lookup_rows = [(index + 1, *lookup, True) for index, lookup in enumerate(fact_lookup)]
+    spark.createDataFrame(lookup_rows, "id int, fact_name string, dimension_name string, fact_columns string, dimension_columns string, surrogate_key string, is_enabled boolean") \
+        .write.format("delta").mode("overwrite").saveAsTable(f"{database}.fact_lookup")
+
+    rule_rows = [(index + 1, *rule, True) for index, rule in enumerate(data_quality_rules)]
+    spark.createDataFrame(rule_rows, "id int, entity string, rule_name string, rule_type string, column_name string, rule_parameters string, action string, is_enabled boolean") \
+        .write.format("delta").mode("overwrite").saveAsTable(f"{database}.data_quality_rules")
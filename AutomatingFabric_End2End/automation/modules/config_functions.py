@@ -0,0 +1,217 @@
+import copy, json, os
+import modules.misc_functions as mf
+
+environments_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../cicd/environments')
+
+# Minimal schema format: {"type": <python type>, "required": [keys], "properties": {key: schema}, "values": schema for other dict values, "items": schema for list elements}
+permissions_schema = {
+    "type": dict,
+    "values": {"type": list, "items": {"type": dict, "required": ["type", "id"], "properties": {"type": {"type": str}, "id": {"type": str}}}}
+}
+
+git_integration_schema = {
+    "type": dict,
+    "values": {"type": str}
+}
+
+item_schema = {
+    "type": dict,
+    "required": ["item_name"],
+    "properties": {
+        "item_name": {"type": str},
+        "connection_name": {"type": str},
+        "sql_script": {"type": str},
+        "spark_profile": {"type": str},
+        "library": {
+            "type": dict,
+            "required": ["notebook", "package_name"],
+            "properties": {"notebook": {"type": str}, "package_name": {"type": str}}
+        }
+    }
+}
+
+infrastructure_schema = {
+    "type": dict,
+    "required": ["name", "generic", "layers"],
+    "properties": {
+        "name": {"type": str},
+        "generic": {
+            "type": dict,
+            "properties": {
+                "capacity_id": {"type": str},
+                "is_primary": {"type": bool},
+                "environment_name": {"type": str},
+                "workspace_icon": {"type": str},
+                "permissions": permissions_schema,
+                "git_integration": git_integration_schema,
+                "spark_profiles_notebook": {"type": str}
+            }
+        },
+        "layers": {
+            "type": dict,
+            "properties": {"merge_type": {"type": int}},
+            "values": {
+                "type": dict,
+                "properties": {
+                    "capacity_id": {"type": str},
+                    "workspace_icon": {"type": str},
+                    "permissions": permissions_schema,
+                    "git_integration": git_integration_schema,
+                    "spark_settings": {"type": dict},
+                    "items": {"type": dict, "values": {"type": list, "items": item_schema}},
+                    "private_endpoints": {
+                        "type": list,
+                        "items": {"type": dict, "required": ["name", "id"], "properties": {"name": {"type": str}, "id": {"type": str}, "auto_approve": {"type": bool}}}
+                    }
+                }
+            }
+        }
+    }
+}
+
+feature_schema = {
+    "type": dict,
+    "required": ["feature_name", "capacity_id", "layers"],
+    "properties": {
+        "feature_name": {"type": str},
+        "capacity_id": {"type": str},
+        "permissions": permissions_schema,
+        "git_integration": git_integration_schema,
+        "layers": {"type": dict, "values": {"type": dict, "properties": {"git_folder": {"type": str}, "spark_settings": {"type": dict}}}}
+    }
+}
+
+_json_cache = {}        # file_path -> (mtime_ns, data)
+_definition_cache = {}  # (file_path, ...) -> (mtime_ns, ..., definition)
+
+
+def _get_mtime(file_path):
+    return os.stat(file_path).st_mtime_ns if os.path.exists(file_path) else None
+
+
+def validate_json(data, schema, path = "$"):
+    """
+    Validates JSON data against a minimal schema.
+
+    Args:
+        data: The parsed JSON data to validate.
+        schema (dict): The schema to validate against. Supports the keys 'type', 'required', 'properties', 'values' and 'items'.
+        path (str, optional): The path of data used in error messages. Defaults to "$".
+
+    Returns:
+        list: A list of error messages. Empty if data is valid.
+    """
+    errors = []
+    expected_type = schema.get("type")
+
+    if expected_type and (not isinstance(data, expected_type) or (expected_type is int and isinstance(data, bool))):
+        return [f"{path} must be of type {expected_type.__name__}, found {type(data).__name__}"]
+
+    if isinstance(data, dict):
+        for key in schema.get("required", []):
+            if key not in data:
+                errors.append(f"{path}.{key} is required")
+
+        properties = schema.get("properties", {})
+        for key, value in data.items():
+            if key in properties:
+                errors.extend(validate_json(value, properties[key], f"{path}.{key}"))
+            elif "values" in schema:
+                errors.extend(validate_json(value, schema["values"], f"{path}.{key}"))
+
+    elif isinstance(data, list) and "items" in schema:
+        for index, value in enumerate(data):
+            errors.extend(validate_json(value, schema["items"], f"{path}[{index}]"))
+
+    return errors
+
+
+def load_json_cached(file_path):
+    """
+    Loads a JSON file. The parsed content is cached and only re-read when the file modification time changes.
+
+    Args:
+        file_path (str): The path to the JSON file.
+
+    Returns:
+        dict or None: The parsed JSON content, or None if the file does not exist. The cached object is returned and must not be modified.
+    """
+    file_path = os.path.abspath(file_path)
+    mtime = _get_mtime(file_path)
+
+    if mtime is None:
+        print(f"Json file not found: {file_path}")
+        return None
+
+    cached = _json_cache.get(file_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(file_path, 'r') as file:
+        data = json.load(file)
+
+    _json_cache[file_path] = (mtime, data)
+    return data
+
+
+def _load_validated(cache_key, mtimes, build_definition, schema):
+    cached = _definition_cache.get(cache_key)
+    if cached and cached[0] == mtimes:
+        definition = cached[1]
+    else:
+        definition = build_definition()
+
+        if definition is not None:
+            errors = validate_json(definition, schema)
+            if errors:
+                mf.print_error(f"Invalid definition in {', '.join(os.path.basename(path) for path in cache_key)}:")
+                for error in errors:
+                    mf.print_error(f"  - {error}")
+                definition = None
+
+        _definition_cache[cache_key] = (mtimes, definition)
+
+    return copy.deepcopy(definition) # Callers add IDs etc. to the definition, so never hand out the cached object
+
+
+def load_environment_definition(environment, folder_path = environments_folder):
+    """
+    Loads the infrastructure definition of an environment by merging infrastructure.json with infrastructure.{environment}.json.
+    Parsed files and the merged, schema-validated definition are cached keyed by the file modification times,
+    so repeated calls for the same environment neither re-read, re-merge nor re-validate the files.
+
+    Args:
+        environment (str): The name of the environment, e.g. "dev", "tst" or "prd".
+        folder_path (str, optional): The folder holding the infrastructure files. Defaults to automation/cicd/environments.
+
+    Returns:
+        dict or None: A copy of the merged environment definition which the caller is free to modify.
+                      Returns None if a file is missing or the definition is invalid.
+    """
+    main_path = os.path.abspath(os.path.join(folder_path, 'infrastructure.json'))
+    env_path = os.path.abspath(os.path.join(folder_path, f'infrastructure.{environment}.json'))
+
+    return _load_validated(
+        (main_path, env_path),
+        (_get_mtime(main_path), _get_mtime(env_path)),
+        lambda: mf.merge_json(load_json_cached(main_path), load_json_cached(env_path)),
+        infrastructure_schema)
+
+
+def load_feature_definition(folder_path = environments_folder):
+    """
+    Loads the schema-validated feature definition from feature.json. See load_environment_definition for caching.
+
+    Args:
+        folder_path (str, optional): The folder holding feature.json. Defaults to automation/cicd/environments.
+
+    Returns:
+        dict or None: A copy of the feature definition. Returns None if the file is missing or the definition is invalid.
+    """
+    feature_path = os.path.abspath(os.path.join(folder_path, 'feature.json'))
+
+    return _load_validated(
+        (feature_path,),
+        (_get_mtime(feature_path),),
+        lambda: load_json_cached(feature_path),
+        feature_schema)
@@ -3,6 +3,8 @@ import base64
 import pyodbc
 import time 
 import json, struct
+import os, hashlib
+from concurrent.futures import ThreadPoolExecutor
 import modules.misc_functions as mf
 
 fabric_baseurl = "https://api.fabric.microsoft.com/v1"
@@ -785,6 +787,219 @@ def get_lakehouse_sqlendpoint(access_token, workspace_id, lakehouse_id):
             time.sleep(2)
 
 
+def build_definition_part(part_path, file_path, replacements:dict = None):
+    """
+    Builds an item definition part from a file on disk. The file is streamed through an incremental base64 encoder, 
+    so it is never held in memory as a whole next to its encoded payload. Token replacements are applied in a single pass.
+
+    Args:
+        part_path (str): The path of the part within the item definition, e.g. "notebook-content.py" or "definition/model.bim".
+        file_path (str): The path to the file on disk.
+        replacements (dict, optional): Tokens to replace in a text file mapped to their replacement values. Defaults to None.
+
+    Returns:
+        dict: The definition part with path, payload and payloadType.
+    """
+    return {
+        "path": part_path,
+        "payload": mf.file_to_base64(file_path, replacements),
+        "payloadType": "InlineBase64"
+    }
+
+
+def get_definition_parts(item_type, definition):
+    """
+    Returns the definition parts for an item definition.
+
+    Args:
+        item_type (str): The type of the item, such as "DataPipeline" or "Notebook".
+        definition (str or list): Either a base64-encoded string holding the single part of a DataPipeline or Notebook 
+            or a list of definition parts as returned by build_definition_part.
+
+    Returns:
+        list: The list of definition parts.
+    """
+    if isinstance(definition, list):
+        return definition
+
+    item_path = ""
+    if item_type == "DataPipeline":
+        item_path = "pipeline-content.json"
+    elif item_type == "Notebook":
+        item_path = "notebook-content.py"
+
+    return [
+        {
+            "path": item_path,
+            "payload": definition,
+            "payloadType": "InlineBase64"
+        }
+    ]
+
+
+def get_file_hash(file_path, replacements:dict = None):
+    """
+    Computes the SHA-256 hash of a file by streaming it from disk, after applying token replacements if given.
+
+    Args:
+        file_path (str): The path to the file.
+        replacements (dict, optional): Tokens to replace in a text file mapped to their replacement values. Defaults to None.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest.
+    """
+    file_hash = hashlib.sha256()
+    for chunk in (mf.iter_replaced_lines(file_path, replacements) if replacements else mf.iter_file_chunks(file_path)):
+        file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+TEXT_PART_EXTENSIONS = {".json", ".py", ".sql", ".platform", ".ipynb", ".pbir", ".pbism", ".tmdl", ".bim", ".yml", ".yaml", ".txt", ".md", ".r", ".scala", ".kql", ".csv", ".xml", ".dax", ".m"}
+
+
+def get_part_replacements(file_path, replacements:dict = None):
+    """
+    Returns the token replacements to apply to a definition part. Replacements only apply to text parts, 
+    so binary parts such as images in the StaticResources of a report are deployed as is.
+
+    Args:
+        file_path (str): The path to the part file.
+        replacements (dict, optional): Tokens to replace mapped to their replacement values. Defaults to None.
+
+    Returns:
+        dict: The replacements for a text part, or None for a binary part.
+    """
+    return replacements if os.path.splitext(file_path)[1].lower() in TEXT_PART_EXTENSIONS or os.path.basename(file_path) == ".platform" else None
+
+
+def get_item_folder_properties(item_folder):
+    """
+    Resolves the display name and item type of an item folder in a Fabric git repository, e.g. "My Notebook.Notebook".
+    The .platform file is used when present. Otherwise the folder name is split on its last dot.
+
+    Args:
+        item_folder (str): The path to the item folder.
+
+    Returns:
+        tuple: (item_name, item_type)
+    """
+    platform_file = os.path.join(item_folder, ".platform")
+    if os.path.exists(platform_file):
+        with open(platform_file, "r", encoding="utf-8") as file:
+            metadata = json.load(file).get("metadata", {})
+        if metadata.get("displayName") and metadata.get("type"):
+            return metadata.get("displayName"), metadata.get("type")
+
+    item_name, _, item_type = os.path.basename(os.path.normpath(item_folder)).rpartition(".")
+    return item_name, item_type
+
+
+def build_item_definition_from_folder(item_folder, replacements:dict = None, previous_part_hashes:dict = None, max_workers:int = 8):
+    """
+    Builds the definition of an item from its folder in a Fabric git repository, e.g. "*.Notebook", "*.DataPipeline" or "*.SemanticModel".
+    All files in the folder (except .platform) become definition parts. Parts are hashed, and - unless all hashes match 
+    previous_part_hashes - encoded in parallel using a thread pool. Replacements are applied to text parts only, see get_part_replacements.
+
+    Args:
+        item_folder (str): The path to the item folder.
+        replacements (dict, optional): Tokens to replace in the text part files mapped to their replacement values. Defaults to None.
+        previous_part_hashes (dict, optional): Part hashes from the previous deployment keyed by part path. Defaults to None.
+        max_workers (int, optional): The number of threads used for hashing and encoding. Defaults to 8.
+
+    Returns:
+        dict: A dictionary with the keys item_name, item_type, part_hashes (dict of part path to hash), 
+              is_changed (bool) and parts (list of definition parts, or None if the item is unchanged).
+    """
+    item_name, item_type = get_item_folder_properties(item_folder)
+
+    part_files = {}
+    for root, _, files in os.walk(item_folder):
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
+            part_path = os.path.relpath(file_path, item_folder).replace(os.sep, "/")
+            if part_path != ".platform":
+                part_files[part_path] = file_path
+
+    part_paths = sorted(part_files)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        part_hashes = dict(zip(part_paths, executor.map(lambda part_path: get_file_hash(part_files[part_path], get_part_replacements(part_files[part_path], replacements)), part_paths)))
+        is_changed = part_hashes != (previous_part_hashes or {})
+        parts = list(executor.map(lambda part_path: build_definition_part(part_path, part_files[part_path], get_part_replacements(part_files[part_path], replacements)), part_paths)) if is_changed else None
+
+    return {
+        "item_name": item_name,
+        "item_type": item_type,
+        "part_hashes": part_hashes,
+        "is_changed": is_changed,
+        "parts": parts
+    }
+
+
+def deploy_items_from_folder(access_token, workspace_id, folder_path, replacements:dict = None, hash_file:str = None, item_types:list = None, max_workers:int = 8):
+    """
+    Deploys all items found in a repository folder to a workspace with one create or update call per item.
+    Each subfolder named "<item name>.<item type>" is deployed using all of its definition parts. Items whose parts are unchanged
+    since the last deployment recorded in hash_file are skipped.
+
+    Args:
+        access_token (str): The OAuth 2.0 access token for authenticating the API request.
+        workspace_id (str): The unique identifier of the target workspace.
+        folder_path (str): The repository folder holding the item folders, e.g. "solution/prepare".
+        replacements (dict, optional): Tokens to replace in the part files mapped to their replacement values. Defaults to None.
+        hash_file (str, optional): A JSON file recording the part hashes of deployed items. If None, all items are deployed.
+        item_types (list, optional): Item types to deploy, e.g. ["Notebook", "DataPipeline"]. If None, all item types are deployed.
+        max_workers (int, optional): The number of threads used for hashing and encoding parts. Defaults to 8.
+
+    Returns:
+        dict: A dictionary of item ids keyed by "<item type>/<item name>" for all items created, updated or skipped.
+    """
+    deployed_hashes = mf.load_json(hash_file) if hash_file and os.path.exists(hash_file) else {}
+    existing_items = {}
+    deployed_items = {}
+
+    item_folders = sorted(
+        os.path.join(folder_path, name) for name in os.listdir(folder_path)
+        if os.path.isdir(os.path.join(folder_path, name)) and "." in name
+    )
+
+    for item_folder in item_folders:
+        item_name, item_type = get_item_folder_properties(item_folder)
+        if item_types and item_type not in item_types:
+            continue
+
+        item_key = f"{item_type}/{item_name}"
+        hash_key = f"{workspace_id}/{item_key}"
+
+        if item_type not in existing_items:
+            existing_items[item_type] = {item["displayName"]: item["id"] for item in list_items(access_token, workspace_id, item_type)}
+        item_id = existing_items[item_type].get(item_name)
+
+        definition = build_item_definition_from_folder(item_folder, replacements, deployed_hashes.get(hash_key) if item_id else None, max_workers)
+
+        if not definition["is_changed"]:
+            print(f"    • Deploying {item_type} {item_name}... ", end="")
+            mf.print_warning("Skipped! Definition is unchanged.")
+            deployed_items[item_key] = item_id
+            continue
+
+        if item_id:
+            result = update_item_definition(access_token, workspace_id, item_id, item_name, item_type, definition["parts"], True)
+        else:
+            result = create_item(access_token, workspace_id, item_name, item_type, definition["parts"], True)
+            item_id = result.get("id") if result else None
+
+        if result is not None and item_id:
+            deployed_items[item_key] = item_id
+            deployed_hashes[hash_key] = definition["part_hashes"]
+
+            if hash_file:
+                with open(hash_file, "w") as file:
+                    json.dump(deployed_hashes, file, indent=4)
+
+    return deployed_items
+
+
 def create_item(access_token, workspace_id, item_name, item_type, definition_base64, print_progress = False, print_output = True):
     """
     Creates a new item in a specified Microsoft Fabric workspace.
@@ -794,8 +1009,8 @@ def create_item(access_token, workspace_id, item_name, item_type, definition_bas
         workspace_id (str): The unique identifier of the workspace where the item will be created.
         item_name (str): The name of the item to be created in the workspace.
         item_type (str): The type of the item, such as "Lakehouse", "DataPipeline" or "Notebook".
-        definition_base64 (str or None): A base64-encoded string containing the item's definition, if required. 
-            If None, the definition is not included in the request.
+        definition_base64 (str, list or None): A base64-encoded string containing the item's definition, if required, 
+            or a list of definition parts as returned by build_definition_part. If None, the definition is not included in the request.
         print_progress (bool, optional): A flag to print progress during the create operation. Default is `False`.
         print_output (bool, optional): A flag to indicate if function show print any output at all (progress or standard). Default is `True`.
 
@@ -814,20 +1029,8 @@ def create_item(access_token, workspace_id, item_name, item_type, definition_bas
     }
     
     if definition_base64 is not None:
-        item_path = ""
-        if item_type == "DataPipeline":
-            item_path = "pipeline-content.json"
-        elif item_type == "Notebook":
-            item_path = "notebook-content.py"
-
         body["definition"] = {
-            "parts": [
-                {
-                    "path": item_path,
-                    "payload": definition_base64,
-                    "payloadType": "InlineBase64"
-                }
-            ]
+            "parts": get_definition_parts(item_type, definition_base64)
         }
     
     print(f"    • Creating {item_type} {item_name}... ", end='') if print_progress and print_output else None
@@ -879,8 +1082,8 @@ def update_item_definition(access_token, workspace_id, item_id, item_name, item_
         item_id (str): The unique identifier of the item to update.
         item_name (str): The name of the item to be updated, used for progress reporting.
         item_type (str): The type of the item (e.g., "DataPipeline", "Notebook").
-        definition_base64 (str or None): A base64-encoded string containing the item's updated definition.
-            If `None`, the update will not proceed, and `None` will be returned.
+        definition_base64 (str, list or None): A base64-encoded string containing the item's updated definition
+            or a list of definition parts as returned by build_definition_part. If `None`, the update will not proceed, and `None` will be returned.
         print_progress (bool, optional): A flag to print progress during the update operation. Default is `False`.
 
     Returns:
@@ -894,21 +1097,9 @@ def update_item_definition(access_token, workspace_id, item_id, item_name, item_
     }
 
     if definition_base64 is not None:
-        item_path = ""
-        if item_type == "DataPipeline":
-            item_path = "pipeline-content.json"
-        elif item_type == "Notebook":
-            item_path = "notebook-content.py"
-
         body = {
             "definition": {
-                "parts": [
-                    {
-                        "path": item_path,
-                        "payload": definition_base64,
-                        "payloadType": "InlineBase64"
-                    }
-                ]
+                "parts": get_definition_parts(item_type, definition_base64)
             }
         }
 
@@ -1621,4 +1812,196 @@ def update_workspace_spark_settings(access_token, workspace_id, settings_definit
     except requests.exceptions.RequestException as e:
         mf.print_error(f"Failed! Error: {e}") if print_output == True else None
         print(response.json())
-        return None
\ No newline at end of file
+        return None
+
+
+def upload_environment_library(access_token, workspace_id, environment_id, file_path, print_output = False):
+    """
+    Uploads a custom library, e.g. a wheel, to the staging libraries of a Microsoft Fabric environment.
+    The library is not available to notebooks before the environment is published. See publish_environment.
+
+    Args:
+        access_token (str): The OAuth access token for authentication.
+        workspace_id (str): The unique identifier of the workspace.
+        environment_id (str): The unique identifier of the environment.
+        file_path (str): The path to the library file.
+        print_output (bool, optional): If True, prints status messages. Defaults to False.
+
+    Returns:
+        dict or None: The JSON response from the API if successful, otherwise None.
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+
+    try:
+        print(f"  → Uploading {os.path.basename(file_path)} to environment... ", end="") if print_output == True else None
+        with open(file_path, 'rb') as file:
+            response = requests.post(f"{fabric_baseurl}/workspaces/{workspace_id}/environments/{environment_id}/staging/libraries", headers=headers, files={"file": (os.path.basename(file_path), file)})
+        response.raise_for_status()
+        mf.print_success("Done!") if print_output == True else None
+        return response.json() if response.content else {}
+    except requests.exceptions.RequestException as e:
+        mf.print_error(f"Failed! Error: {e}") if print_output == True else None
+        return None
+
+def get_environment_staging_libraries(access_token, workspace_id, environment_id):
+    """
+    Gets the staging libraries of a Microsoft Fabric environment.
+
+    Args:
+        access_token (str): The OAuth access token for authentication.
+        workspace_id (str): The unique identifier of the workspace.
+        environment_id (str): The unique identifier of the environment.
+
+    Returns:
+        dict or None: The JSON response from the API, i.e. customLibraries and environmentYml, if successful. Empty if the environment has no libraries, otherwise None.
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+
+    try:
+        response = requests.get(f"{fabric_baseurl}/workspaces/{workspace_id}/environments/{environment_id}/staging/libraries", headers=headers)
+        if response.status_code == 404:
+            return {} # No libraries staged
+        response.raise_for_status()
+        return response.json() if response.content else {}
+    except requests.exceptions.RequestException as e:
+        mf.print_error(f"Failed to get environment libraries! Error: {e}")
+        return None
+
+def delete_environment_library(access_token, workspace_id, environment_id, library_name, print_output = False):
+    """
+    Deletes a custom library from the staging libraries of a Microsoft Fabric environment.
+
+    Args:
+        access_token (str): The OAuth access token for authentication.
+        workspace_id (str): The unique identifier of the workspace.
+        environment_id (str): The unique identifier of the environment.
+        library_name (str): The file name of the library, e.g. "aquashack_functions-1.0.1-py3-none-any.whl".
+        print_output (bool, optional): If True, prints status messages. Defaults to False.
+
+    Returns:
+        dict or None: The JSON response from the API if successful, otherwise None.
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+
+    try:
+        print(f"  → Deleting {library_name} from environment... ", end="") if print_output == True else None
+        response = requests.delete(f"{fabric_baseurl}/workspaces/{workspace_id}/environments/{environment_id}/staging/libraries", headers=headers, params={"libraryToDelete": library_name})
+        response.raise_for_status()
+        mf.print_success("Done!") if print_output == True else None
+        return response.json() if response.content else {}
+    except requests.exceptions.RequestException as e:
+        mf.print_error(f"Failed! Error: {e}") if print_output == True else None
+        return None
+
+def replace_environment_library(access_token, workspace_id, environment_id, file_path, print_output = False):
+    """
+    Uploads a wheel to the staging libraries of a Microsoft Fabric environment, after deleting other versions of the same package.
+    The library is not available to notebooks before the environment is published. See publish_environment.
+
+    Args:
+        access_token (str): The OAuth access token for authentication.
+        workspace_id (str): The unique identifier of the workspace.
+        environment_id (str): The unique identifier of the environment.
+        file_path (str): The path to the wheel, named {package}-{version}-{tags}.whl.
+        print_output (bool, optional): If True, prints status messages. Defaults to False.
+
+    Returns:
+        dict or None: The JSON response from the upload if successful, otherwise None.
+    """
+    file_name = os.path.basename(file_path)
+    package_prefix = f"{file_name.split('-')[0]}-"
+
+    libraries = get_environment_staging_libraries(access_token, workspace_id, environment_id)
+    if libraries is None:
+        return None
+
+    # Two versions of a package in one environment fail the publish
+    for library_name in (libraries.get("customLibraries") or {}).get("wheelFiles") or []:
+        if library_name.startswith(package_prefix) and library_name != file_name:
+            if delete_environment_library(access_token, workspace_id, environment_id, library_name, print_output) is None:
+                return None
+
+    return upload_environment_library(access_token, workspace_id, environment_id, file_path, print_output)
+
+def get_item_by_name(access_token, workspace_id, item_name, item_type):
+    """
+    Gets an item of a specific type in a Microsoft Fabric workspace by its display name.
+
+    Args:
+        access_token (str): The OAuth 2.0 access token for authenticating the API request.
+        workspace_id (str): The unique identifier of the workspace.
+        item_name (str): The display name of the item.
+        item_type (str): The type of the item, e.g. "Environment".
+
+    Returns:
+        dict or None: The item, or None if not found.
+    """
+    return next((item for item in list_items(access_token, workspace_id, item_type) if item.get("displayName") == item_name), None)
+
+def update_environment_spark_properties(access_token, workspace_id, environment_id, spark_properties, print_output = False):
+    """
+    Updates the Spark properties of the staging compute settings of a Microsoft Fabric environment.
+    The properties are not applied to sessions before the environment is published. See publish_environment.
+
+    Args:
+        access_token (str): The OAuth access token for authentication.
+        workspace_id (str): The unique identifier of the workspace.
+        environment_id (str): The unique identifier of the environment.
+        spark_properties (dict): The Spark properties to set, e.g. {"spark.sql.shuffle.partitions": "200"}.
+        print_output (bool, optional): If True, prints status messages. Defaults to False.
+
+    Returns:
+        dict or None: The JSON response from the API if successful, otherwise None.
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+
+    body = {
+        "sparkProperties": [{"key": key, "value": str(value)} for key, value in spark_properties.items()]
+    }
+
+    try:
+        print(f"  → Updating environment spark properties... ", end="") if print_output == True else None
+        response = requests.patch(f"{fabric_baseurl}/workspaces/{workspace_id}/environments/{environment_id}/staging/sparkcompute?beta=false", headers=headers, json=body)
+        response.raise_for_status()
+        mf.print_success("Done!") if print_output == True else None
+        return response.json() if response.content else {}
+    except requests.exceptions.RequestException as e:
+        mf.print_error(f"Failed! Error: {e}") if print_output == True else None
+        return None
+
+def publish_environment(access_token, workspace_id, environment_id, print_output = False):
+    """
+    Publishes the staged libraries and settings of a Microsoft Fabric environment. Publishing continues in Fabric after the call returns.
+
+    Args:
+        access_token (str): The OAuth access token for authentication.
+        workspace_id (str): The unique identifier of the workspace.
+        environment_id (str): The unique identifier of the environment.
+        print_output (bool, optional): If True, prints status messages. Defaults to False.
+
+    Returns:
+        dict or None: The JSON response from the API if successful, otherwise None.
+    """
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+
+    try:
+        print(f"  → Publishing environment... ", end="") if print_output == True else None
+        response = requests.post(f"{fabric_baseurl}/workspaces/{workspace_id}/environments/{environment_id}/staging/publish", headers=headers)
+        response.raise_for_status()
+        mf.print_success("Done!") if print_output == True else None
+        return response.json() if response.content else {}
+    except requests.exceptions.RequestException as e:
+        mf.print_error(f"Failed! Error: {e}") if print_output == True else None
+        return None
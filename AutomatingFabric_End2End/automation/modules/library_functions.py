@@ -0,0 +1,139 @@
+import ast, base64, hashlib, io, os, zipfile
+import modules.misc_functions as mf
+
+# Notebooks get spark and notebookutils as globals from the session. A library gets lazy proxies instead,
+# so importing it neither starts a Spark session nor imports notebookutils before they are used.
+library_header = '''"""
+{package_name} {version}
+
+Generated from {notebook_name} by solution_build_library.py. Do not edit, change the notebook instead.
+"""
+__version__ = "{version}"
+
+
+class _LazyGlobal:
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = None
+
+    def _resolve(self):
+        if self._value is None:
+            self._value = self._factory()
+        return self._value
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+
+def _get_spark():
+    from pyspark.sql import SparkSession
+    return SparkSession.builder.getOrCreate()
+
+
+def _get_notebookutils():
+    import notebookutils
+    return notebookutils
+
+
+spark = _LazyGlobal(_get_spark)
+notebookutils = _LazyGlobal(_get_notebookutils)
+
+'''
+
+# Like %run, a star import exposes everything the notebook defines, except the session globals the importing notebook already has
+library_footer = '''
+
+__all__ = [name for name in list(globals()) if not name.startswith("_") and name not in ("spark", "notebookutils")]
+'''
+
+
+def get_library_source(notebook_path, package_name, version):
+    """
+    Builds the source of a Python module from the code cells of a notebook. Cells using magics, e.g. %run or %%sql, are left out.
+
+    Args:
+        notebook_path (str): The path to the notebook-content.py file.
+        package_name (str): The name of the package, e.g. "aquashack_functions".
+        version (str): The version of the package, e.g. "1.0.0".
+
+    Returns:
+        str: The module source.
+    """
+    notebook_name = os.path.basename(os.path.dirname(os.path.abspath(notebook_path)))
+    cells = [
+        cell["source"] for cell in mf.read_notebook_cells(notebook_path)
+        if cell["type"] == "code" and cell["source"] and not any(line.lstrip().startswith(("%", "# MAGIC")) for line in cell["source"].splitlines())
+    ]
+
+    source = library_header.format(package_name=package_name, version=version, notebook_name=notebook_name) + "\n\n".join(cells) + library_footer
+    compile(source, f"{package_name}/__init__.py", "exec") # Fail the build on syntax errors rather than on import in Fabric
+    return source
+
+
+def get_notebook_constant(notebook_path, name):
+    """
+    Reads a constant defined in a code cell of a notebook without running the notebook, e.g. SPARK_PROFILES.
+    The assigned expression may only use literals and str(), so the notebook remains the single source of truth for the value.
+
+    Args:
+        notebook_path (str): The path to the notebook-content.py file.
+        name (str): The name of the constant.
+
+    Returns:
+        The value of the constant, or None if the notebook does not define it.
+    """
+    for cell in mf.read_notebook_cells(notebook_path):
+        if cell["type"] != "code" or name not in cell["source"]:
+            continue
+
+        try:
+            tree = ast.parse(cell["source"])
+        except SyntaxError:
+            continue # Cells using magics such as %run are not valid Python
+
+        for node in tree.body:
+            if isinstance(node, (ast.Assign, ast.AnnAssign)) and any(isinstance(target, ast.Name) and target.id == name for target in (node.targets if isinstance(node, ast.Assign) else [node.target])):
+                return eval(compile(ast.Expression(node.value), notebook_path, "eval"), {"__builtins__": {}, "str": str})
+
+    return None
+
+
+def _get_record_hash(data):
+    return "sha256=" + base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=").decode()
+
+
+def build_wheel(source, package_name, version, output_path, summary = ""):
+    """
+    Builds a pure Python wheel holding a single package with the given source as __init__.py.
+
+    Args:
+        source (str): The source of the package.
+        package_name (str): The name of the package, e.g. "aquashack_functions".
+        version (str): The version of the package, e.g. "1.0.0".
+        output_path (str): The folder to write the wheel to.
+        summary (str, optional): One line description of the package. Defaults to "".
+
+    Returns:
+        str: The path of the wheel file.
+    """
+    dist_info = f"{package_name}-{version}.dist-info"
+    files = {
+        f"{package_name}/__init__.py": source.encode("utf-8"),
+        f"{dist_info}/METADATA": f"Metadata-Version: 2.1\nName: {package_name}\nVersion: {version}\nSummary: {summary}\nRequires-Python: >=3.10\n".encode("utf-8"),
+        f"{dist_info}/WHEEL": b"Wheel-Version: 1.0\nGenerator: solution_build_library\nRoot-Is-Purelib: true\nTag: py3-none-any\n"
+    }
+
+    record = io.StringIO()
+    for file_name, data in files.items():
+        record.write(f"{file_name},{_get_record_hash(data)},{len(data)}\n")
+    record.write(f"{dist_info}/RECORD,,\n")
+    files[f"{dist_info}/RECORD"] = record.getvalue().encode("utf-8")
+
+    os.makedirs(output_path, exist_ok=True)
+    wheel_path = os.path.join(output_path, f"{package_name}-{version}-py3-none-any.whl")
+
+    with zipfile.ZipFile(wheel_path, "w", zipfile.ZIP_DEFLATED) as wheel:
+        for file_name, data in files.items():
+            wheel.writestr(file_name, data)
+
+    return wheel_path
@@ -1,4 +1,4 @@
-import json, os
+import json, os, io, re
 import base64
 from collections import OrderedDict
 
@@ -13,6 +13,15 @@ cgreen = '\033[32m'
 cgreen_bold = '\033[1;32m'
 cblue_bold = '\033[1;34m'
 
+def _to_hashable(value):
+    """Converts a JSON value into a hashable equivalent, ignoring the key order of objects."""
+    if isinstance(value, dict):
+        return frozenset((key, _to_hashable(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_to_hashable(item) for item in value)
+    return (type(value).__name__, value) # Keeps e.g. 1, 1.0 and True apart like JSON serialization does
+
+
 def merge_json(parent, child, inherited_merge_type=1):
     """Recursively merge child JSON into parent, respecting 'merge_type' at all levels."""
 
@@ -39,7 +48,7 @@ def merge_json(parent, child, inherited_merge_type=1):
                 merged[key] = parent_value  # Keep parent list (No Override)
             elif current_merge_type == 2:
                 # Ensure uniqueness in the list (works for objects, strings, numbers, etc.)
-                merged[key] = list({json.dumps(item, sort_keys=True): item for item in parent_value + child_value}.values())
+                merged[key] = list({_to_hashable(item): item for item in parent_value + child_value}.values())
             else:
                 merged[key] = child_value  # Replace list if merge_type is not 2
 
@@ -94,6 +103,106 @@ def load_json(file_path):
         print(f"Json file not found: {file_path}")
 
 
+def read_notebook_cells(file_path):
+    """
+    Reads the cells of a notebook in Fabric source format (notebook-content.py).
+
+    Args:
+        file_path (str): The path to the notebook-content.py file.
+
+    Returns:
+        list: One dict per cell with 'type' ("code" or "markdown") and 'source'. Metadata and attachments are left out.
+    """
+    cells = []
+    current = None
+
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.rstrip('\r\n')
+            marker = re.fullmatch(r"# (CELL|MARKDOWN|METADATA|ATTACHMENTS) \*+", line)
+            if marker:
+                current = {"type": "code" if marker.group(1) == "CELL" else "markdown", "lines": []} if marker.group(1) in ("CELL", "MARKDOWN") else None
+                if current:
+                    cells.append(current)
+            elif current is not None:
+                current["lines"].append(line[2:] if current["type"] == "markdown" and line.startswith("# ") else line)
+
+    return [{"type": cell["type"], "source": "\n".join(cell["lines"]).strip("\n")} for cell in cells]
+
+
+def iter_file_chunks(file_path, chunk_size:int = 1024 * 1024):
+    """
+    Reads a file from disk in binary chunks.
+
+    Args:
+        file_path (str): The path to the file.
+        chunk_size (int, optional): The number of bytes per chunk. Defaults to 1 MB.
+
+    Yields:
+        bytes: The next chunk of the file.
+    """
+    with open(file_path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+
+def iter_replaced_lines(file_path, replacements:dict, encoding:str = "utf-8"):
+    """
+    Reads a text file line by line and replaces all tokens in a single pass per line.
+
+    Args:
+        file_path (str): The path to the text file.
+        replacements (dict): Tokens to replace mapped to their replacement values, e.g. {"@WebConnectionID": "<guid>"}.
+            Longer tokens take precedence over tokens they start with. Tokens must not span multiple lines.
+        encoding (str, optional): The encoding of the file. Defaults to "utf-8".
+
+    Yields:
+        bytes: The next line with tokens replaced, encoded using the file encoding.
+    """
+    pattern = re.compile("|".join(re.escape(token) for token in sorted(replacements, key=len, reverse=True)))
+
+    with open(file_path, "r", encoding=encoding, newline="") as file:
+        for line in file:
+            yield pattern.sub(lambda match: replacements[match.group(0)], line).encode(encoding)
+
+
+def iter_base64_chunks(chunks):
+    """
+    Incrementally base64-encodes a stream of byte chunks. The concatenated output equals base64 of the concatenated input.
+
+    Args:
+        chunks (iterable of bytes): The chunks to encode.
+
+    Yields:
+        str: The next base64-encoded chunk.
+    """
+    remainder = b""
+    for chunk in chunks:
+        data = remainder + chunk
+        cut = len(data) - len(data) % 3 # Only encode whole 3-byte groups to avoid padding mid-stream
+        remainder = data[cut:]
+        if cut:
+            yield base64.b64encode(data[:cut]).decode("utf-8")
+
+    if remainder:
+        yield base64.b64encode(remainder).decode("utf-8")
+
+
+def file_to_base64(file_path, replacements:dict = None):
+    """
+    Converts a file to a Base64-encoded string by streaming it from disk, optionally replacing tokens on the way.
+
+    Args:
+        file_path (str): The path to the file.
+        replacements (dict, optional): Tokens to replace in a text file. See iter_replaced_lines. Defaults to None.
+
+    Returns:
+        str: The Base64-encoded string representation of the file.
+    """
+    chunks = iter_replaced_lines(file_path, replacements) if replacements else iter_file_chunks(file_path)
+    return "".join(iter_base64_chunks(chunks))
+
+
 def image_to_base64(file_path):
     """
     Converts an image file to a Base64-encoded string.
@@ -105,38 +214,49 @@ def image_to_base64(file_path):
         str: The Base64-encoded string representation of the image.
     """
     if os.path.exists(file_path):
-        with open(file_path, "rb") as image_file:
-            base64_str = base64.b64encode(image_file.read()).decode("utf-8")
-        return base64_str
+        return file_to_base64(file_path)
 
-def generate_yaml_string(data):
+def write_yaml(stream, data):
     """
-    Generates a YAML-formatted string from a dictionary with properly formatted comments.
+    Streams a dictionary as YAML with properly formatted comments to a writable text stream.
 
     Args:
-        data (dict): The data to convert to a YAML string.
+        stream (io.TextIOBase): The stream to write to, e.g. an open file or an io.StringIO.
+        data (dict): The data to write.
 
-    Returns:
-        str: A string containing the YAML representation of the data.
+    Notes:
+        Each section in the dictionary is written as a top-level YAML key. Comments for each key 
+        are inserted where specified in the 'comment' field in the dictionary.
     """
-    yaml_string = ""
-    
     for section, items in data.items():
-        yaml_string += f"{section}:\n"
+        stream.write(f"{section}:\n")
 
         for key, value in items.items():
             # Check if there's a comment for this key in the current section
             if 'comment' in value:
-                yaml_string += f"    # {value['comment']}\n"
+                stream.write(f"    # {value['comment']}\n")
             
             # Write the key-value pairs
-            yaml_string += f"    \"{key}\":\n"
+            stream.write(f"    \"{key}\":\n")
             for sub_key, sub_value in value.items():
                 if sub_key != 'comment':  # Don't write the comment as part of the key-value pairs
-                    yaml_string += f"        {sub_key}: {sub_value}\n"
-            yaml_string += "\n"
-    
-    return yaml_string
+                    stream.write(f"        {sub_key}: {sub_value}\n")
+            stream.write("\n")
+
+
+def generate_yaml_string(data):
+    """
+    Generates a YAML-formatted string from a dictionary with properly formatted comments.
+
+    Args:
+        data (dict): The data to convert to a YAML string.
+
+    Returns:
+        str: A string containing the YAML representation of the data.
+    """
+    buffer = io.StringIO()
+    write_yaml(buffer, data)
+    return buffer.getvalue()
 
 
 def save_yaml(file_path, data):
@@ -146,96 +266,104 @@ def save_yaml(file_path, data):
     Args:
         file_path (str): The path to the YAML file to save.
         data (dict): The data to write to the file.
-
-    Notes:
-        Each section in the dictionary is written as a top-level YAML key. Comments for each key 
-        are inserted where specified in the 'comment' field in the dictionary.
     """
     with open(file_path, 'w') as file:
-        for section, items in data.items():
-            file.write(f"{section}:\n")
-
-            for key, value in items.items():
-                # Check if there's a comment for this key in the current section
-                if 'comment' in value:
-                    file.write(f"    # {value['comment']}\n")
-                
-                # Write the key-value pairs
-                file.write(f"    \"{key}\":\n")
-                for sub_key, sub_value in value.items():
-                    if sub_key != 'comment':  # Don't write the comment as part of the key-value pairs
-                        file.write(f"        {sub_key}: {sub_value}\n")
-                file.write("\n")
+        write_yaml(file, data)
+
+
+def build_environment_index(env_data):
+    """
+    Indexes all items of an environment by layer, item type and item name.
+
+    Args:
+        env_data (dict): The environment definition including the IDs resolved during setup.
+
+    Returns:
+        dict: A dictionary mapping (layer_name, item_type, item_name) to the item definition. If an item name occurs
+              more than once for the same layer and item type, the first occurrence is kept.
+    """
+    index = {}
+
+    for layer_name, layer_data in (env_data.get("layers") or {}).items():
+        if not isinstance(layer_data, dict):
+            continue # Skip attributes such as merge_type
+
+        for item_type, items in (layer_data.get("items") or {}).items():
+            for item in items:
+                index.setdefault((layer_name, item_type, item.get("item_name")), item)
+
+    return index
+
 
 def create_parameter_yml(all_environments):
     """
     Creates and returns a dictionary structure for a YAML file.
 
+    Every non-primary environment is indexed once by (layer, item_type, item_name), so mapping the primary
+    environment runs in linear time of the number of items times the number of environments.
+
     Args:
         all_environments (dict): Dict of all environments and their properties to be used for deriving the parameter yml file.
 
     Returns:
-        dict: The parameter dictionary with predefined sections ('find_replace' and 'spark_pool') and their mapped items
+        dict: The parameter dictionary with the 'find_replace' section and its mapped items
     """
-    yml_data = {
-            "find_replace": {},
-            "spark_pool": {}
-        }
+    find_replace = {}
+
+    def map_key(key, env, value, comment):
+        if key:
+            entry = find_replace.setdefault(key, {})
+            entry[env] = value
+            entry["comment"] = comment
     
     # Extract first environment as primary
     primary_env = next(env for env in all_environments if all_environments[env].get("is_primary", True))
     primary_layers = all_environments[primary_env]["layers"]
 
+    # Index all other environments once
+    env_indexes = {
+        env: (env_data.get("layers") or {}, build_environment_index(env_data))
+        for env, env_data in all_environments.items() 
+        if env != primary_env and env_data
+    }
+
     # Build output dictionary
     for layer_name, layer_data in primary_layers.items(): 
+        if not isinstance(layer_data, dict):
+            continue # Skip attributes such as merge_type
+
         primary_id = layer_data["workspace_id"]
-        yml_data["find_replace"][primary_id] = {}
         
-        for env, env_data in all_environments.items():
-            if env == primary_env or not env_data:
-                continue  # Skip primary environment
-            
-            env_layer = env_data["layers"].get(layer_name)
+        for env, (env_layers, _) in env_indexes.items():
+            env_layer = env_layers.get(layer_name)
             if env_layer:
-                yml_item = { env : env_layer["workspace_id"] }
-                yml_data = add_item(yml_data, "find_replace", primary_id, yml_item, comment=f"Workspace Guids - {layer_name}")
-
-
-        if "items" in layer_data:
-            for item_type, items in layer_data["items"].items():
-                for item in items:
-                    item_id = item.get("id")
-                    item_name = item.get("item_name")
-                    pbi_connection_id = item.get("pbi_connection_id")
-                    sql_endpoint_id = item.get("sql_endpoint_id")
-
-                    # Add item entry at root level
-                    yml_data["find_replace"][item_id] = {}
-
-                    # Map items across environments
-                    for env, env_data in all_environments.items():
-                        if env == primary_env or not env_data:
-                            continue # Skip primary environment
-
-                        if layer_name in env_data.get("layers"):
-                            env_layer = env_data.get("layers").get(layer_name)
-                            if "items" in env_layer and item_type in env_layer["items"]:
-                                for env_item in env_layer["items"][item_type]:
-                                    if env_item["item_name"] == item_name:
-                                        yml_item = { env : env_item["id"] }
-                                        yml_data = add_item(yml_data, "find_replace", item_id, yml_item, comment=f"{item_type} Guid - {item_name}")
-
-                                    if env_item.get("sql_endpoint_id"):
-                                        yml_item = { env : env_item.get("sql_endpoint_id") }
-                                        yml_data = add_item(yml_data, "find_replace", sql_endpoint_id, yml_item, comment=f"SQL Analytics Endpoint Guid - {item_name}")
-
-                                    if env_item.get("pbi_connection_id"):
-                                        yml_item = { env : env_item.get("pbi_connection_id") }
-                                        yml_data = add_item(yml_data, "find_replace", pbi_connection_id, yml_item, comment=f"SQL Connection Guid - {item_name}")
-                                        
+                map_key(primary_id, env, env_layer["workspace_id"], f"Workspace Guids - {layer_name}")
+
+        for item_type, items in (layer_data.get("items") or {}).items():
+            for item in items:
+                item_id = item.get("id")
+                item_name = item.get("item_name")
+
+                # Reserve the position of the item entry at root level
+                if item_id:
+                    find_replace[item_id] = {}
+
+                # Map items across environments
+                for env, (_, env_index) in env_indexes.items():
+                    env_item = env_index.get((layer_name, item_type, item_name))
+                    if env_item is None:
+                        continue
+
+                    map_key(item_id, env, env_item["id"], f"{item_type} Guid - {item_name}")
+
+                    if env_item.get("sql_endpoint_id"):
+                        map_key(item.get("sql_endpoint_id"), env, env_item.get("sql_endpoint_id"), f"SQL Analytics Endpoint Guid - {item_name}")
+
+                    if env_item.get("pbi_connection_id"):
+                        map_key(item.get("pbi_connection_id"), env, env_item.get("pbi_connection_id"), f"SQL Connection Guid - {item_name}")
     
     filtered_data = {
-        key: value for key, value in yml_data.get("find_replace").items() if value
+        key: value for key, value in find_replace.items() if value
     }
 
     sorted_items = sorted(filtered_data.items(), key=lambda x: get_yml_item_sortorder(x[1].get("comment", "")))
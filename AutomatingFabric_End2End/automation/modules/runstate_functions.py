@@ -0,0 +1,88 @@
+import json, os
+from datetime import datetime, timezone
+
+def get_step_key(*parts):
+    """
+    Builds the key used to identify a step in a run-state journal.
+
+    Args:
+        *parts (str): The parts identifying the step, e.g. environment, layer, item type and item name.
+
+    Returns:
+        str: The step key, e.g. "dev/Store/Lakehouse/Landing".
+    """
+    return "/".join(str(part) for part in parts)
+
+
+def load_run_state(file_path):
+    """
+    Loads all completed steps from a run-state journal (JSON lines).
+
+    Args:
+        file_path (str): The path to the run-state journal file.
+
+    Returns:
+        dict: A dictionary of completed steps keyed by step key, holding the data recorded for each step.
+              If a step was recorded more than once, the latest record wins. Returns an empty dict if the journal does not exist.
+    """
+    completed_steps = {}
+
+    if not os.path.exists(file_path):
+        return completed_steps
+
+    with open(file_path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue # A partially written line from an interrupted run is ignored
+
+            completed_steps[record["step"]] = record.get("data") or {}
+
+    return completed_steps
+
+
+def start_run_state(file_path, resume:bool = False):
+    """
+    Starts a run-state journal. When resuming, completed steps from the previous run are loaded.
+    Otherwise the journal is reset so the run starts from scratch.
+
+    Args:
+        file_path (str): The path to the run-state journal file.
+        resume (bool, optional): If True, completed steps from the existing journal are returned. Defaults to False.
+
+    Returns:
+        dict: A dictionary of completed steps keyed by step key. Empty unless resuming.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+
+    if resume:
+        return load_run_state(file_path)
+
+    open(file_path, 'w').close()
+    return {}
+
+
+def record_step(file_path, step_key, data:dict = None):
+    """
+    Appends a completed step to the run-state journal. The record is flushed to disk immediately
+    so it survives the script being interrupted right after.
+
+    Args:
+        file_path (str): The path to the run-state journal file.
+        step_key (str): The key identifying the step. See get_step_key.
+        data (dict, optional): The resulting IDs and properties of the step needed when resuming.
+    """
+    record = {
+        "step": step_key,
+        "completed_at": datetime.now(timezone.utc).isoformat(),
+        "data": data or {}
+    }
+
+    with open(file_path, 'a') as file:
+        file.write(json.dumps(record) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
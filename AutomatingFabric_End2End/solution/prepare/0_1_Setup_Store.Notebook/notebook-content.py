@@ -257,30 +257,36 @@ sql_script = """
     TRUNCATE TABLE source_ingest_conn;
     TRUNCATE TABLE source_ingest_obj;
     TRUNCATE TABLE notebook_orchestrator;
+    TRUNCATE TABLE fact_lookup;
+    TRUNCATE TABLE data_quality_rules;
 
     INSERT INTO landing_to_base
         (source,
         format,
         destination,
-        projected_columns)
+        projected_columns,
+        cluster_by)
                 
     SELECT 
         'Files/data/Sales/Customers/Customers.csv',
         'csv',
         'sales_customers',
-        '["CustomerID", "FirstName", "LastName"]'
+        '["CustomerID", "FirstName", "LastName"]',
+        NULL
     UNION
     SELECT 
         'Files/data/Sales/Products/Products.parquet',
         'parquet',
         'sales_products',
-        '[]'
+        '[]',
+        NULL
     UNION
     SELECT 
         'Files/data/Sales/Transactions/Transactions.csv',
         'csv',
         'sales_transactions',
-        '[]';
+        '[]',
+        '["TransactionDate"]';
 
     SET IDENTITY_INSERT source_ingest_conn ON;
 
@@ -320,15 +326,45 @@ sql_script = """
         ,[retry_count]
         ,[retry_interval]
         ,[dependencies]
-        ,[group])
+        ,[group]
+        ,[spark_profile])
     
-    SELECT '3_AquaShack_Load_Dimension_Customer', '3_AquaShack_Load_Dimension_Customer', 300, 1, 10, null, 'default'
+    SELECT '3_AquaShack_Load_Dimension_Customer', '3_AquaShack_Load_Dimension_Customer', 300, 1, 10, null, 'default', 'small-dims'
     UNION
-    SELECT '3_AquaShack_Load_Dimension_Product', '3_AquaShack_Load_Dimension_Product', 300, 1, 10, null, 'default' 
+    SELECT '3_AquaShack_Load_Dimension_Product', '3_AquaShack_Load_Dimension_Product', 300, 1, 10, null, 'default', 'small-dims' 
     UNION
-    SELECT '3_AquaShack_Load_Dimension_Date', '3_AquaShack_Load_Dimension_Date', 300, 1, 10, null, 'default'
+    SELECT '3_AquaShack_Load_Dimension_Date', '3_AquaShack_Load_Dimension_Date', 300, 1, 10, null, 'default', 'small-dims'
     UNION
-    SELECT '4_AquaShack_Load_Fact_Sales', '4_AquaShack_Load_Fact_Sales', 600, 1, 10, '["3_AquaShack_Load_Dimension_CustomerS", "3_AquaShack_Load_Dimension_Product", "3_AquaShack_Load_Dimension_Date"]', 'default';
+    SELECT '4_AquaShack_Load_Fact_Sales', '4_AquaShack_Load_Fact_Sales', 600, 1, 10, '["3_AquaShack_Load_Dimension_Customer", "3_AquaShack_Load_Dimension_Product", "3_AquaShack_Load_Dimension_Date"]', 'default', 'large-fact';
+
+    INSERT INTO fact_lookup
+        ([fact_name]
+        ,[dimension_name]
+        ,[fact_columns]
+        ,[dimension_columns]
+        ,[surrogate_key])
+
+    SELECT 'Transactions', 'Customer', '["CustomerId"]', '["CustomerID"]', 'DWID_Customer'
+    UNION
+    SELECT 'Transactions', 'Product', '["ProductID"]', '["ProductsId"]', 'DWID_Product';
+
+    INSERT INTO data_quality_rules
+        ([entity]
+        ,[rule_name]
+        ,[rule_type]
+        ,[column_name]
+        ,[rule_parameters]
+        ,[action])
+
+    SELECT 'sales_transactions', 'TransactionIdNotNull', 'not_null', 'TransactionID', NULL, 'quarantine'
+    UNION
+    SELECT 'sales_transactions', 'QuantityPositive', 'range', 'Quantity', '{"min": 1}', 'quarantine'
+    UNION
+    SELECT 'sales_transactions', 'CustomerExists', 'referential', 'CustomerId', '{"table": "Base.sales_customers", "column": "CustomerID"}', 'warn'
+    UNION
+    SELECT 'sales_customers', 'CustomerIdUnique', 'unique', 'CustomerID', NULL, 'warn'
+    UNION
+    SELECT 'sales_customers', 'CustomerIdNumeric', 'regex', 'CustomerID', '{"pattern": "^[0-9]+$"}', 'quarantine';
 """
 
 print("\n→ Populating sample metadata in Fabric SQL Database... ", end="")
@@ -371,6 +407,8 @@ sql_database_id = fabric.resolve_item_id("Metadata", "SQLDatabase", STORE_WORKSP
 
 create_sqldb_shortcut(landing_item_id, sql_database_id=sql_database_id, table_name='landing_to_base', path="Tables/dbo/landing_to_base")
 create_sqldb_shortcut(landing_item_id, sql_database_id=sql_database_id, table_name='notebook_orchestrator', path="Tables/dbo/notebook_orchestrator")
+create_sqldb_shortcut(landing_item_id, sql_database_id=sql_database_id, table_name='fact_lookup', path="Tables/dbo/fact_lookup")
+create_sqldb_shortcut(landing_item_id, sql_database_id=sql_database_id, table_name='data_quality_rules', path="Tables/dbo/data_quality_rules")
 
 # METADATA ********************
 
@@ -71,10 +71,24 @@ import sempy.fabric as fabric
 import requests
 import json
 import base64
+import re
+import time
 from sempy.fabric.exceptions import FabricHTTPException
 
 client = fabric.FabricRestClient()
 
+def _get_pipeline_definition(workspace_id, item_name):
+    item_id = fabric.resolve_item_id(item_name, "DataPipeline", workspace_id)
+    definition = client.post(f"https://api.fabric.microsoft.com/v1/workspaces/{workspace_id}/items/{item_id}/getDefinition").json()
+    return next((part for part in definition["definition"]["parts"] if part["path"] == "pipeline-content.json"), None).get("payload")
+
+
+def _replace_definition_tokens(definition_base64, replacements: dict):
+    # Decode once, replace all tokens in a single pass and encode once. Longer tokens take precedence over tokens they start with.
+    pattern = re.compile("|".join(re.escape(token) for token in sorted(replacements, key=len, reverse=True)))
+    definition_str = pattern.sub(lambda match: replacements[match.group(0)], base64.b64decode(definition_base64).decode("utf-8"))
+    return base64.b64encode(definition_str.encode("utf-8")).decode("utf-8")
+
 def _create_datapipeline_connection(fabric_token, connection_name):
     
     credential_value = json.dumps({
@@ -335,15 +349,8 @@ _add_connection_role_assignment(WEB_CONNECTION_ID, SPN_OBJECT_ID, "ServicePrinci
 
 # CELL ********************
 
-# Child data pipeline
-child_pipeline_id = fabric.resolve_item_id(TEMPLATE_CHILD, "DataPipeline", INGEST_WORKSPACE)
-child_def = client.post(f"https://api.fabric.microsoft.com/v1/workspaces/{INGEST_WORKSPACE}/items/{child_pipeline_id}/getDefinition").json()
-definition_base64 = next((part for part in child_def["definition"]["parts"] if part["path"] == "pipeline-content.json"), None).get("payload")
-
-definition_bytes = base64.b64decode(definition_base64)
-definition_str = definition_bytes.decode("utf-8")  # Convert bytes to string
-definition_bytes = base64.b64encode(definition_str.encode("utf-8"))  
-definition_base64 = definition_bytes.decode("utf-8") 
+# Child data pipeline. The template definition is cloned as is.
+definition_base64 = _get_pipeline_definition(INGEST_WORKSPACE, TEMPLATE_CHILD)
 
 child_pipeline_name = f"Ingest - AzureSqlDb - Child"
 child_pipeline_id = _create_datapipeline(INGEST_WORKSPACE, child_pipeline_name, definition_base64)
@@ -358,23 +365,19 @@ child_pipeline_id = _create_datapipeline(INGEST_WORKSPACE, child_pipeline_name,
 # CELL ********************
 
 # Parent data pipeline
-parent_pipeline_id = fabric.resolve_item_id(TEMPLATE_PARENT, "DataPipeline", INGEST_WORKSPACE)
-parent_def = client.post(f"https://api.fabric.microsoft.com/v1/workspaces/{INGEST_WORKSPACE}/items/{parent_pipeline_id}/getDefinition").json()
-definition_base64 = next((part for part in parent_def["definition"]["parts"] if part["path"] == "pipeline-content.json"), None).get("payload")
-
-definition_bytes = base64.b64decode(definition_base64)
-definition_str = definition_bytes.decode("utf-8")  # Convert bytes to string
-definition_str = definition_str.replace("@SourceConnectionName", SOURCE_CONNECTION_NAME)
-definition_str = definition_str.replace("@MetaConnectionID", META_CONNECTION_ID)
-definition_str = definition_str.replace("@WebConnectionID", WEB_CONNECTION_ID)
-definition_str = definition_str.replace("@DataPipelineConnectionID", DATAPIPELINE_CONNECTION.get("id"))
-definition_str = definition_str.replace("@ChildPipelineName", child_pipeline_name)
-definition_str = definition_str.replace("@MetaInitialCatalog", META_INITIALCATALOG)
-definition_str = definition_str.replace("@DestinationWorkspaceID", STORE_WORKSPACE)
-definition_str = definition_str.replace("@DestinationLakehouseID", LANDING_LAKEHOUSE)
-definition_str = definition_str.replace("Inactive", "Active")
-definition_bytes = base64.b64encode(definition_str.encode("utf-8"))  
-definition_base64 = definition_bytes.decode("utf-8") 
+definition_base64 = _replace_definition_tokens(
+    _get_pipeline_definition(INGEST_WORKSPACE, TEMPLATE_PARENT),
+    {
+        "@SourceConnectionName": SOURCE_CONNECTION_NAME,
+        "@MetaConnectionID": META_CONNECTION_ID,
+        "@WebConnectionID": WEB_CONNECTION_ID,
+        "@DataPipelineConnectionID": DATAPIPELINE_CONNECTION.get("id"),
+        "@ChildPipelineName": child_pipeline_name,
+        "@MetaInitialCatalog": META_INITIALCATALOG,
+        "@DestinationWorkspaceID": STORE_WORKSPACE,
+        "@DestinationLakehouseID": LANDING_LAKEHOUSE,
+        "Inactive": "Active"
+    })
 
 parent_pipeline_name = f"Ingest - AzureSqlDb - Parent"
 parent_pipeline_id = _create_datapipeline(INGEST_WORKSPACE, parent_pipeline_name, definition_base64)
@@ -395,22 +398,17 @@ parent_pipeline_id = _create_datapipeline(INGEST_WORKSPACE, parent_pipeline_name
 # CELL ********************
 
 # Controller data pipeline
-pipeline_id = fabric.resolve_item_id(TEMPLATE_CONTROLLER, "DataPipeline", INGEST_WORKSPACE)
-pipeline_def = client.post(f"https://api.fabric.microsoft.com/v1/workspaces/{INGEST_WORKSPACE}/items/{pipeline_id}/getDefinition").json()
-definition_base64 = next((part for part in pipeline_def["definition"]["parts"] if part["path"] == "pipeline-content.json"), None).get("payload")
-
-definition_bytes = base64.b64decode(definition_base64)
-definition_str = definition_bytes.decode("utf-8")  # Convert bytes to string
-definition_str = definition_str.replace("@WebConnectionID", WEB_CONNECTION_ID)
-definition_str = definition_str.replace("@DataPipelineConnectionID", DATAPIPELINE_CONNECTION.get("id"))
-definition_str = definition_str.replace("@ParentPipelineName", parent_pipeline_name)
-definition_str = definition_str.replace("@DestinationWorkspaceID", STORE_WORKSPACE)
-definition_str = definition_str.replace("@DestinationLakehouseID", LANDING_LAKEHOUSE)
-definition_str = definition_str.replace("@SourceConnectionName", SOURCE_CONNECTION_NAME)
-definition_str = definition_str.replace("Inactive", "Active")
-
-definition_bytes = base64.b64encode(definition_str.encode("utf-8"))  
-definition_base64 = definition_bytes.decode("utf-8") 
+definition_base64 = _replace_definition_tokens(
+    _get_pipeline_definition(INGEST_WORKSPACE, TEMPLATE_CONTROLLER),
+    {
+        "@WebConnectionID": WEB_CONNECTION_ID,
+        "@DataPipelineConnectionID": DATAPIPELINE_CONNECTION.get("id"),
+        "@ParentPipelineName": parent_pipeline_name,
+        "@DestinationWorkspaceID": STORE_WORKSPACE,
+        "@DestinationLakehouseID": LANDING_LAKEHOUSE,
+        "@SourceConnectionName": SOURCE_CONNECTION_NAME,
+        "Inactive": "Active"
+    })
 
 controller_pipeline_name = f"Controller - Full"
 result = _create_datapipeline(INGEST_WORKSPACE, controller_pipeline_name, definition_base64)
@@ -53,14 +53,14 @@
 
 # ### **Dependencies**  
 # 
-# This notebook builds upon functions defined in **AquaShack_functions**. When calling other notebooks using `%run`, the command must be placed in the top code cell.  
+# This notebook builds upon functions defined in **AquaShack_functions**. The functions are packaged into the versioned `aquashack_functions` wheel by `solution_build_library.py` and imported from the environment attached to the notebook, so the functions notebook is no longer executed with `%run` in every notebook.  
 # 
-# Alternatively, this step can be omitted by packaging **AquaShack functions** into a Python wheel and importing them as a custom library.  
+# When developing interactively without the library, the import can be replaced by `%run AquaShack_functions` placed in the top code cell.  
 
 
 # CELL ********************
 
-%run AquaShack_functions
+from aquashack_functions import *
 
 # METADATA ********************
 
@@ -82,6 +82,8 @@ destination_lakehose = 'Base'
 date_dimension_start_date = '2022-01-01'
 date_dimension_end_date = '2023-12-31'
 
+max_parallelism = 4 # Total weight of entities processed concurrently
+
 # METADATA ********************
 
 # META {
@@ -126,7 +128,9 @@ meta_data
 
 # #### **Processing**  
 # First, the date dimension is created.  
-# Then, we loop over the metadata to process the tables defined in metadata.  
+# Then, the tables defined in metadata are processed concurrently by `run_entities_in_parallel`. The run report holds the result and duration per entity.  
+# Entities with `load_mode` = `streaming` are caught up on new files by a file stream, see `stream_to_delta`.  
+# Rows failing the data quality rules of an entity are quarantined before cleansing, except for `unique` rules, which are checked after cleansing has resolved duplicates, see `apply_data_quality_rules`.  
 
 
 # CELL ********************
@@ -135,20 +139,65 @@ print("→ ", end="")
 create_or_update_date_dimension(start_date = date_dimension_start_date, end_date = date_dimension_end_date, database = destination_lakehose, table = 'dim_date')
 print("")
 
-for entity in meta_data:
-    print(f"→ Processing {entity} from {meta_data[entity]['source']}")
-    df = meta_data[entity]['reader_function']()
+def landing_to_base(entity: str, meta_entity: dict) -> None:
+    print(f"→ Processing {entity} from {meta_entity['source']}")
+    is_incremental = meta_entity['load_mode'] == 'incremental'
+    stage_timings = {}
+
+    if meta_entity['load_mode'] == 'streaming':
+        with timed_stage(stage_timings, "stream"):
+            metrics = stream_to_delta(entity, meta_entity, destination_lakehose)
+        if not metrics:
+            print(f"  - No new files for {entity}. Skipping!")
+            return "Skipped"
+        log_entity_run(destination_lakehose, entity, metrics, stage_timings)
+        return
+
+    with timed_stage(stage_timings, "read"):
+        if is_incremental:
+            files = get_unprocessed_files(entity, meta_entity['source'], destination_lakehose, allowRewrites = bool(meta_entity['key_columns']))
+            if not files:
+                print(f"  - No new files for {entity}. Skipping!")
+                return "Skipped"
+            batch_version = get_ledger_version(entity, destination_lakehose) + 1
+            write_options = get_ledger_write_options(entity, files, batch_version)
+            df = meta_entity['reader_function']([file["path"] for file in files])
+        else:
+            write_options = {}
+            df = meta_entity['reader_function']()
+
+    rules = get_data_quality_rules(entity)
+
+    with timed_stage(stage_timings, "quality"):
+        df, dq_check = apply_data_quality_rules(df, entity, rules, ruleTypes = DQ_PRE_CLEANSE_RULE_TYPES)
+
+    with timed_stage(stage_timings, "cleanse"):
+        df = cleanse_dataframe(df, meta_entity['key_columns'], meta_entity['order_column'], meta_entity['is_unique'])
+
+    with timed_stage(stage_timings, "quality_unique"):
+        df, dq_unique_check = apply_data_quality_rules(df, entity, rules, ruleTypes = DQ_POST_CLEANSE_RULE_TYPES)
+
+    with timed_stage(stage_timings, "write"):
+        metrics = write_entity(df, destination_lakehose, entity, meta_entity, write_options)
+
+    record_data_quality_results(dq_check, destination_lakehose)
+    record_data_quality_results(dq_unique_check, destination_lakehose)
+
+    if is_incremental:
+        record_processed_files(entity, files, destination_lakehose, batch_version)
+
+    log_entity_run(destination_lakehose, entity, metrics, stage_timings)
+
+create_control_tables(destination_lakehose)
 
-    print("  - Dropping duplicated")
-    df = df.dropDuplicates()
+run_report = run_entities_in_parallel(meta_data, landing_to_base, max_parallelism)
+display(spark.createDataFrame(run_report, RUN_REPORT_SCHEMA))
 
-    print("  - Replacing NULL values")
-    df = df.na.fill(0) # Fill all empty numberics with 0 (zero)
-    df = df.na.fill("N/A") # Fill all empty strings with N/A
+create_run_log_summary_view(destination_lakehose)
 
-    print("  - ", end="")
-    write_to_delta_overwrite(df = df, database = destination_lakehose, table = entity, projectedColumns = meta_data[entity]['projection'])
-    print("")
+failed_entities = [result["entity"] for result in run_report if result["status"] == "Failed"]
+if failed_entities:
+    raise Exception(f"Landing to Base failed for entities: {', '.join(failed_entities)}")
 
 # METADATA ********************
 
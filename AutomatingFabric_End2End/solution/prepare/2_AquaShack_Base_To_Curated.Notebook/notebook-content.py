@@ -60,24 +60,24 @@ DAG = {
         { 
             "name": "3_AquaShack_Load_Dimension_Customer", # activity name, must be unique 
             "path": "3_AquaShack_Load_Dimension_Customer", # notebook path 
-            "args": {'useRootDefaultLakehouse': True}, # notebook parameters 
+            "args": {'useRootDefaultLakehouse': True, 'spark_profile': 'small-dims'}, # notebook parameters 
         }, 
         { 
             "name": "3_AquaShack_Load_Dimension_Product", 
             "path": "3_AquaShack_Load_Dimension_Product", 
-            "args": {'useRootDefaultLakehouse': True} 
+            "args": {'useRootDefaultLakehouse': True, 'spark_profile': 'small-dims'} 
         }, 
         { 
             "name": "3_AquaShack_Load_Dimension_Date", 
             "path": "3_AquaShack_Load_Dimension_Date", 
-            "args": {'useRootDefaultLakehouse': True}, 
+            "args": {'useRootDefaultLakehouse': True, 'spark_profile': 'small-dims'}, 
         },
         { 
             "name": "4_AquaShack_Load_Fact_Sales", 
             "path": "4_AquaShack_Load_Fact_Sales", 
-            "args": {'useRootDefaultLakehouse': True}, 
+            "args": {'useRootDefaultLakehouse': True, 'spark_profile': 'large-fact'}, 
             "dependencies": [
-                "3_AquaShack_Load_Dimension_CustomerS", 
+                "3_AquaShack_Load_Dimension_Customer", 
                 "3_AquaShack_Load_Dimension_Product", 
                 "3_AquaShack_Load_Dimension_Date"] # list of activity names that this activity depends on 
         } 
@@ -94,8 +94,11 @@ DAG = {
 # CELL ********************
 
 
+from aquashack_functions import create_control_tables
+
 try:
     notebookutils.notebook.validateDAG(DAG)
+    create_control_tables('Curated') # Created before the notebooks write to them concurrently
     print("\u2705 DAG validated successfully! Running notebooks...")
     run_result = notebookutils.notebook.runMultiple(DAG, {"displayDAGViaGraphviz": True, "showTime": True})
 except Exception as e:  # Catch other unexpected exceptions
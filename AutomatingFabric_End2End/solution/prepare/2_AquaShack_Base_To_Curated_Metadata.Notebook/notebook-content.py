@@ -54,10 +54,11 @@
 # #### **Execute multiple notebooks simultaneously**
 # 
 # Load notebooks defined in metadata. This is based on a utility function which returns the DAG. 
+# Notebooks are ordered by their critical path using durations from the run log, and notebooks sharing a resource class run one at a time. 
 
 # CELL ********************
 
-%run AquaShack_functions
+from aquashack_functions import *
 
 # METADATA ********************
 
@@ -68,6 +69,7 @@
 
 # CELL ********************
 
+create_metadata_snapshot() # Notebooks of this run read metadata from the snapshot instead of the SQL database
 DAG = get_notebook_orchestrator_dag_from_sql()
 print(json.dumps(DAG, indent=4))
 
@@ -81,7 +83,11 @@ print(json.dumps(DAG, indent=4))
 # CELL ********************
 
 try:
+    errors = validate_dag(DAG)
+    if errors:
+        raise ValueError("; ".join(errors))
     notebookutils.notebook.validateDAG(DAG)
+    create_control_tables('Curated') # Created before the notebooks write to them concurrently
     print("\u2705 DAG validated successfully! Running notebooks...")
     run_result = notebookutils.notebook.runMultiple(DAG, {"displayDAGViaGraphviz": True, "showTime": True})
 except Exception as e:  # Catch other unexpected exceptions
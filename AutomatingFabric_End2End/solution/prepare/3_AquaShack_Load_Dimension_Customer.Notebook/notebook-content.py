@@ -33,11 +33,11 @@
 # MARKDOWN ********************
 
 # #### **Load utility function**
-# The notebook utilizes functions defined in AquaShack_functions notebook.  
+# The notebook utilizes functions defined in AquaShack_functions notebook, imported from the `aquashack_functions` library published to the workspace default environment (AquaShack_Environment) by setup and release.  
 
 # CELL ********************
 
-%run AquaShack_functions
+from aquashack_functions import *
 
 # METADATA ********************
 
@@ -57,6 +57,14 @@ destination_lakehouse: str = 'Curated'
 
 dimension_name: str = 'Customer'
 
+business_keys: list = ['CustomerID']
+
+tracked_columns: list = ['FirstName', 'LastName'] # Changes to these columns create a new version of the member (SCD2)
+
+surrogate_key: str = 'DWID_Customer' # Every version of a member gets its own key
+
+spark_profile: str = 'small-dims' # Spark tuning profile, see SPARK_PROFILES. The orchestrator passes the profile from metadata
+
 # METADATA ********************
 
 # META {
@@ -106,7 +114,13 @@ dimension_name: str = 'Customer'
 
 dim_df = spark.table('dim_sales_customers_df')
 
-load_dimension(df = dim_df, database = destination_lakehouse, table = dimension_name)
+apply_spark_profile(spark_profile)
+
+stage_timings = {}
+with timed_stage(stage_timings, "write"):
+    metrics = load_dimension(df = dim_df, database = destination_lakehouse, table = dimension_name, keyColumns = business_keys, trackedColumns = tracked_columns, surrogateKey = surrogate_key)
+
+log_entity_run(destination_lakehouse, dimension_name, metrics, stage_timings)
 
 # METADATA ********************
 
@@ -33,11 +33,11 @@
 # MARKDOWN ********************
 
 # #### **Load utility function**
-# The notebook utilizes functions defined in AquaShack_functions notebook.  
+# The notebook utilizes functions defined in AquaShack_functions notebook, imported from the `aquashack_functions` library published to the workspace default environment (AquaShack_Environment) by setup and release.  
 
 # CELL ********************
 
-%run AquaShack_functions
+from aquashack_functions import *
 
 # METADATA ********************
 
@@ -57,6 +57,10 @@ destination_lakehouse: str = 'Curated'
 
 dimension_name: str = 'Date'
 
+business_keys: list = ['DWID_Date']
+
+spark_profile: str = 'small-dims' # Spark tuning profile, see SPARK_PROFILES. The orchestrator passes the profile from metadata
+
 # METADATA ********************
 
 # META {
@@ -78,8 +82,18 @@ dimension_name: str = 'Date'
 # MAGIC    DateId AS DWID_Date,
 # MAGIC    Date,
 # MAGIC    Year,
-# MAGIC    Month
-# MAGIC    Day
+# MAGIC    Quarter,
+# MAGIC    Month,
+# MAGIC    MonthName,
+# MAGIC    YearMonth,
+# MAGIC    Day,
+# MAGIC    DayOfYear,
+# MAGIC    DayOfWeek,
+# MAGIC    DayName,
+# MAGIC    WeekOfYear,
+# MAGIC    IsWeekend,
+# MAGIC    FirstDayOfMonth,
+# MAGIC    LastDayOfMonth
 # MAGIC FROM    
 # MAGIC    Base.dim_date
 
@@ -99,7 +113,13 @@ dimension_name: str = 'Date'
 
 dim_df = spark.table('dim_date')
 
-load_dimension(df = dim_df, database = destination_lakehouse, table = dimension_name)
+apply_spark_profile(spark_profile)
+
+stage_timings = {}
+with timed_stage(stage_timings, "write"):
+    metrics = load_dimension(df = dim_df, database = destination_lakehouse, table = dimension_name, keyColumns = business_keys)
+
+log_entity_run(destination_lakehouse, dimension_name, metrics, stage_timings)
 
 # METADATA ********************
 
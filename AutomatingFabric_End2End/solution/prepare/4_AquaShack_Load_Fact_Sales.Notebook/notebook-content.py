@@ -33,11 +33,11 @@
 # MARKDOWN ********************
 
 # #### **Load utility function**
-# The notebook utilizes functions defined in AquaShack_functions notebook.  
+# The notebook utilizes functions defined in AquaShack_functions notebook, imported from the `aquashack_functions` library published to the workspace default environment (AquaShack_Environment) by setup and release.  
 
 # CELL ********************
 
-%run AquaShack_functions
+from aquashack_functions import *
 
 # METADATA ********************
 
@@ -57,6 +57,12 @@ destination_lakehouse: str = 'Curated'
 
 fact_name: str = 'Transactions'
 
+reload_from_date_id: int = None # Replace transactions from this DWID_Date (yyyyMMdd) and onwards. None writes days after the latest DWID_Date of the fact, and replaces from the first day with late-arriving transactions
+
+fact_layout: dict = {"cluster_by": ["DWID_Date"], "target_file_size_mb": 128} # Rows are sorted by date within files, so queries on a date range skip files
+
+spark_profile: str = 'large-fact' # Spark tuning profile, see SPARK_PROFILES. The orchestrator passes the profile from metadata
+
 # METADATA ********************
 
 # META {
@@ -77,8 +83,8 @@ fact_name: str = 'Transactions'
 # MAGIC SELECT
 # MAGIC     -- Keys
 # MAGIC    CAST(date_format(TransactionDate,'yMMdd') AS INT) AS DWID_Date,
-# MAGIC    CAST(CustomerId AS INT) AS DWID_Customer,
-# MAGIC    CAST(ProductID AS INT) AS DWID_Product,
+# MAGIC    CAST(CustomerId AS INT) AS CustomerId, -- Looked up as DWID_Customer
+# MAGIC    CAST(ProductID AS INT) AS ProductID, -- Looked up as DWID_Product
 # MAGIC 
 # MAGIC     -- Attributes
 # MAGIC    TransactionID,
@@ -104,9 +110,23 @@ fact_name: str = 'Transactions'
 
 # CELL ********************
 
+apply_spark_profile(spark_profile)
+
 fact_df = spark.table('fact_sales_transactions_df')
 
-load_fact(df = fact_df, database = destination_lakehouse, table = fact_name)
+stage_timings = {}
+with timed_stage(stage_timings, "lookup"):
+    fact_df = lookup_dimension_keys(fact_df, get_fact_lookups(fact_name), destination_lakehouse, dateKey = 'DWID_Date') # Member versions valid at the transaction date
+
+with timed_stage(stage_timings, "write"):
+    # A fact holding business ids as dimension keys, written before the lookups, is rebuilt once with surrogate keys
+    if reload_from_date_id:
+        metrics = load_fact(df = fact_df, database = destination_lakehouse, table = fact_name, replaceWhere = f"DWID_Date >= {reload_from_date_id}", layout = fact_layout, keyScheme = 'surrogate')
+    else:
+        metrics = load_fact(df = fact_df, database = destination_lakehouse, table = fact_name, partitionKey = 'DWID_Date', layout = fact_layout, keyScheme = 'surrogate')
+
+log_entity_run(destination_lakehouse, fact_name, metrics, stage_timings)
+create_run_log_summary_view(destination_lakehouse)
 
 # METADATA ********************
 
@@ -0,0 +1,89 @@
+# Fabric notebook source
+
+# METADATA ********************
+
+# META {
+# META   "kernel_info": {
+# META     "name": "synapse_pyspark"
+# META   },
+# META   "dependencies": {
+# META     "lakehouse": {
+# META       "default_lakehouse_name": "",
+# META       "default_lakehouse_workspace_id": ""
+# META     }
+# META   }
+# META }
+
+# MARKDOWN ********************
+
+# <center>
+# 
+# # **Table Maintenance**
+# </center>
+# 
+# ### **Purpose**  
+# 
+# Overwrite and merge loads leave the Delta tables of Base and Curated with many small files and a growing history. This notebook checks every table with `DESCRIBE DETAIL` and its history, and only runs `OPTIMIZE` (V-Order and optionally Z-Order) or `VACUUM` on tables needing it. Tables are maintained concurrently within a time budget, so the notebook can be scheduled in a fixed maintenance window.
+
+# MARKDOWN ********************
+
+# #### **Load utility function**
+# The notebook utilizes functions defined in AquaShack_functions notebook, imported from the `aquashack_functions` library published to the workspace default environment (AquaShack_Environment) by setup and release.  
+
+# CELL ********************
+
+from aquashack_functions import *
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Defining Settings**  
+# Certain settings apply throughout the notebook and can be easily configured once before the job starts.  
+
+# CELL ********************
+
+databases: list = ['Base', 'Curated']
+
+zorder_columns: dict = {'Curated.Transactions': ['DWID_Date']} # Columns to Z-Order by when optimizing, keyed by database.table
+
+time_budget_seconds: int = 3600 # Tables not started within the budget are skipped until the next run
+
+max_parallelism: int = 4
+
+spark_profile: str = 'maintenance' # Spark tuning profile, see SPARK_PROFILES
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Maintaining the tables**
+# Tables needing no maintenance, or not started within the time budget, are reported as Skipped.
+
+# CELL ********************
+
+apply_spark_profile(spark_profile)
+
+run_report = run_table_maintenance(databases, zorder_columns, time_budget_seconds, max_parallelism)
+display(spark.createDataFrame(run_report, RUN_REPORT_SCHEMA))
+
+failed = [result["entity"] for result in run_report if result["status"] == "Failed"]
+if failed:
+    raise Exception(f"Maintenance failed for: {', '.join(failed)}")
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
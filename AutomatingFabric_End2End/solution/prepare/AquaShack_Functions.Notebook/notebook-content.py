@@ -47,7 +47,16 @@
 
 from pyspark.sql import DataFrame
 from pyspark.sql import functions as F
+from pyspark.sql import Window
+from pyspark.sql.types import LongType, NumericType, StringType, StructField, StructType
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
 import json
+import math
+import threading
+import time
+import uuid
 
 # METADATA ********************
 
@@ -67,38 +76,129 @@ import json
 
 # CELL ********************
 
-def _get_reader_dictionary(source: str, source_format: str):
+def _get_reader_dictionary(source: str, source_format: str, schema: str = None, projection: list = []):
+    # With a schema, CSV files are read without inference and fail fast on rows or headers not matching it.
+    # Without, the schema is inferred as before and all columns are read as strings, and malformed rows are read permissively as before.
+    def reader(spark_reader):
+        return spark_reader.schema(schema) if schema else spark_reader
+
+    csv_options = _get_csv_options(schema)
+
+    # Projected columns are selected right after the read, so unused columns are pruned from the scan
+    def project(df):
+        return df.select(*projection) if projection else df
+
+    # Readers read the whole source by default or only the given list of files, e.g. new files in incremental mode
     readers = {
-        'parquet' : lambda : spark.read.parquet(source),
-        'csv' : lambda : spark.read.options(delimiter=';', header=True).csv(source),
+        'parquet' : lambda paths = None: project(reader(spark.read).parquet(*(paths or [source]))),
+        'csv' : lambda paths = None: project(reader(spark.read.options(**csv_options)).csv(paths or source)),
     }
     return readers[source_format]
 
-def _process_meta_data(meta_entity: dict) -> dict:
-    
-    source = meta_entity["source"]
-    
-    projected_columns = meta_entity["projected_columns"]
+def _get_csv_options(schema: str = None) -> dict:
+    # Failing fast on rows and headers not matching the schema only applies to a schema declared in metadata
+    options = {"delimiter": ';', "header": True}
+    if schema:
+        options.update({"mode": 'FAILFAST', "enforceSchema": False})
+    return options
+
+def _get_stream_reader(source: str, source_format: str, schema: str = None, projection: list = []):
+    # File streams require a schema. Without one in metadata, it is inferred once from the files already landed
+    def reader(max_files_per_trigger = None):
+        stream_reader = spark.readStream.schema(schema or _get_reader_dictionary(source, source_format)().schema)
+        if max_files_per_trigger:
+            stream_reader = stream_reader.option("maxFilesPerTrigger", max_files_per_trigger)
+
+        if source_format == 'csv':
+            df = stream_reader.options(**_get_csv_options(schema)).csv(source)
+        else:
+            df = stream_reader.format(source_format).load(source)
+
+        return df.select(*projection) if projection else df
+
+    return reader
+
+def _parse_schema(schema: str, source: str) -> str:
+
+    if not schema:
+        return None
+
+    try:
+        spark.createDataFrame([], schema) # Validates the DDL string, e.g. `CustomerID INT, FirstName STRING, ModifiedDate TIMESTAMP`
+    except Exception as e:
+        print(f"Schema of {source} must be a valid DDL-string, i.e. `CustomerID INT, FirstName STRING, ModifiedDate TIMESTAMP`")
+        raise e
+
+    return schema
+
+def _parse_column_list(columns, attribute_name: str) -> list:
     
-    if isinstance(projected_columns, str):
+    if columns is None:
+        return []
+
+    if isinstance(columns, str):
         try:
-            projected_columns = json.loads(projected_columns)
+            columns = json.loads(columns)
 
-            if not isinstance(projected_columns, list):
+            if not isinstance(columns, list):
                 raise TypeError()
             
-            if not all(isinstance(item, str) for item in projected_columns):
+            if not all(isinstance(item, str) for item in columns):
                 raise TypeError()
 
         except (json.JSONDecodeError, TypeError) as e:
-            print("""Projected columns must be a valid JSON-string, i.e. `["CustomerNumber","CustomerName","CustomerAddress","ModifiedDate"]`""")
+            print(f"""{attribute_name} must be a valid JSON-string, i.e. `["CustomerNumber","CustomerName","CustomerAddress","ModifiedDate"]`""")
             raise e
 
+    return columns
+
+def _parse_layout(meta_entity: dict, source: str) -> dict:
+
+    partition_columns = _parse_column_list(meta_entity.get("partition_columns"), "Partition columns")
+    cluster_by = _parse_column_list(meta_entity.get("cluster_by"), "Cluster by")
+    target_file_size_mb = meta_entity.get("target_file_size_mb")
+
+    if set(partition_columns) & set(cluster_by):
+        raise ValueError(f"Columns can not be both partition columns and cluster by columns ({source})")
+
+    if target_file_size_mb is not None and int(target_file_size_mb) <= 0:
+        raise ValueError(f"Target file size must be a positive number of MB, found: {target_file_size_mb} ({source})")
+
+    return {
+        'partition_columns': partition_columns,
+        'cluster_by': cluster_by,
+        'target_file_size_mb': int(target_file_size_mb) if target_file_size_mb is not None else None
+    }
+
+def _process_meta_data(meta_entity: dict) -> dict:
+    
+    source = meta_entity["source"]
+    
+    projected_columns = _parse_column_list(meta_entity["projected_columns"], "Projected columns")
+    key_columns = _parse_column_list(meta_entity.get("key_columns"), "Key columns")
+
+    load_mode = (meta_entity.get("load_mode") or "full").lower()
+    if load_mode not in ("full", "incremental", "merge", "streaming"):
+        raise ValueError(f"Load mode must be either full, incremental, merge or streaming, found: {load_mode}")
+
+    if load_mode == "merge" and not key_columns:
+        raise ValueError(f"Key columns must be declared for load mode merge ({source})")
+
+    schema = _parse_schema(meta_entity.get("schema"), source)
+
     return {
         'source': source,
         'destination': meta_entity["source"],
-        'reader_function': _get_reader_dictionary(source, meta_entity["format"]),
-        'projection': projected_columns
+        'reader_function': _get_reader_dictionary(source, meta_entity["format"], schema, projected_columns),
+        'stream_reader_function': _get_stream_reader(source, meta_entity["format"], schema, projected_columns),
+        'schema': schema,
+        'projection': projected_columns,
+        'weight': int(meta_entity.get("weight") or 1),
+        'load_mode': load_mode,
+        'key_columns': key_columns,
+        'order_column': meta_entity.get("order_column"),
+        'is_unique': bool(meta_entity.get("is_unique") or False),
+        'layout': _parse_layout(meta_entity, source)
     }
     
 
@@ -109,33 +209,51 @@ def read_meta_from_sql() -> dict:
     Returns:
         pyspark.sql.DataFrame: The DataFrame with the new audit columns added.
     """
-    df = spark.sql("SELECT source, format, destination, projected_columns FROM Landing.landing_to_base")
-
     processed_meta_data = {}
-    for meta_entity in [row.asDict() for row in df.collect()]:
+    for meta_entity in get_metadata_rows("Landing.landing_to_base"):
         processed_meta_data[meta_entity['destination']] = _process_meta_data(meta_entity)
 
     return processed_meta_data
 
-def get_notebook_orchestrator_dag_from_sql(group_name:str = None) -> dict:
+def _get_notebook_durations(run_log_database: str) -> dict:
+    # Average duration per notebook over its runs. The run log holds one row per entity, logged when it ended, and entities may run in parallel,
+    # so the duration of a run is the span from the first entity started to the last entity ended
+    if not run_log_database or not spark.catalog.tableExists(f"{run_log_database}.{RUN_LOG_TABLE}"):
+        return {}
+
+    df = spark.sql(f"""
+        SELECT notebook, AVG(duration_seconds) AS duration_seconds
+        FROM (
+            SELECT run_id, notebook, MAX(CAST(logged_at AS DOUBLE)) - MIN(CAST(logged_at AS DOUBLE) - COALESCE(duration_seconds, 0)) AS duration_seconds
+            FROM {run_log_database}.{RUN_LOG_TABLE}
+            GROUP BY run_id, notebook)
+        GROUP BY notebook
+    """)
+    return {row["notebook"]: row["duration_seconds"] for row in df.collect()}
+
+def get_notebook_orchestrator_dag_from_sql(group_name:str = None, run_log_database: str = "Curated", concurrency: int = None, cores_per_notebook: int = 4, default_duration: float = 60) -> dict:
     """
     Build a DAG structure for orchestration of notebooks.
+    Activities are ordered by their critical path length, based on the average durations in the run log, so long chains start first.
+    Notebooks sharing a resource class are chained so they never run at the same time. The Spark profile of a notebook is passed as the spark_profile argument.
+
+    Args:
+        group_name (str): Only notebooks of this group. None is all groups.
+        run_log_database (str): Database holding the run log. None ignores historical durations. "Curated" is default.
+        concurrency (int): Max notebooks running at the same time. None sizes it to the cores of the cluster.
+        cores_per_notebook (int): Cores a notebook is expected to use when sizing concurrency. 4 is default.
+        default_duration (float): Seconds used for notebooks without runs in the run log. 60 is default.
 
     Returns:
         Dict: The Dict representing the DAG.
     """
-    filter = f"WHERE group_name = '{group_name}'" if group_name else ""
-    df = spark.sql(
-        f"""
-            SELECT 
-                notebook_name, notebook_path, cell_timeout, retry_count, retry_interval, arguments, dependencies 
-            FROM 
-                Landing.notebook_orchestrator 
-            {filter}
-        """)
+    rows = [
+        row for row in get_metadata_rows("Landing.notebook_orchestrator")
+        if row.get("is_enabled", True) and (not group_name or row.get("group") == group_name)
+    ]
 
     DAG = {"activities": []}
-    rows = df.collect()
+    resource_classes = {}
 
     for row in rows:
         activity = {
@@ -147,9 +265,40 @@ def get_notebook_orchestrator_dag_from_sql(group_name:str = None) -> dict:
             "args": json.loads(row["arguments"]) if row["arguments"] else {},  # Convert JSON string to dict
         }
 
+        spark_profile = row.get("spark_profile")
+        if spark_profile:
+            if spark_profile not in SPARK_PROFILES:
+                raise ValueError(f"Spark profile of {row['notebook_name']} must be one of {', '.join(SPARK_PROFILES)}, found: {spark_profile}")
+            activity["args"]["spark_profile"] = spark_profile # Applied by the notebook with apply_spark_profile
+
         activity["dependencies"] = json.loads(row["dependencies"]) if row["dependencies"] else []
 
+        resource_class = row.get("resource_class")
+        if resource_class:
+            resource_classes.setdefault(resource_class, []).append(activity["name"])
+
         DAG["activities"].append(activity)
+
+    durations = _get_notebook_durations(run_log_database)
+    critical_path_lengths = get_critical_path_lengths(DAG["activities"], durations, default_duration)
+    DAG["activities"] = order_activities(DAG["activities"], critical_path_lengths)
+
+    # Chaining notebooks of a resource class in the dependency-safe order can't create cycles
+    if resource_classes:
+        by_name = {activity["name"]: activity for activity in DAG["activities"]}
+        for names in resource_classes.values():
+            chain = [activity["name"] for activity in DAG["activities"] if activity["name"] in names]
+            for previous, current in zip(chain, chain[1:]):
+                if previous not in by_name[current]["dependencies"]:
+                    by_name[current]["dependencies"].append(previous)
+
+        critical_path_lengths = get_critical_path_lengths(DAG["activities"], durations, default_duration)
+        DAG["activities"] = order_activities(DAG["activities"], critical_path_lengths)
+
+    if not concurrency:
+        concurrency = max(1, spark.sparkContext.defaultParallelism // cores_per_notebook)
+    DAG["concurrency"] = max(1, min(concurrency, len(DAG["activities"])))
+
     return DAG
 
 
@@ -181,6 +330,159 @@ def read_meta_from_json(path) -> dict:
 
 # MARKDOWN ********************
 
+# #### **Layout Functions**  
+# The layout of a table is declared in metadata by `partition_columns`, `cluster_by` and `target_file_size_mb`. Partitioning lets queries filtering on e.g. a date prune whole folders, but only pays off for large tables with few distinct values per column. Clustering sorts rows within the files written, so file statistics let Delta skip files on the cluster columns without creating partitions.  
+#   
+# `repartition_for_write` sizes the number of files written from the estimated size of the DataFrame and the target file size, so a write neither produces a small file per task and partition nor a single huge file.
+
+# CELL ********************
+
+DEFAULT_TARGET_FILE_SIZE_MB = 128
+MAX_FILES_PER_WRITE = 2000
+
+def _estimate_size_in_bytes(df: DataFrame) -> int:
+    # Size estimate of the optimized plan. For file scans it is the size of the files read, e.g. the CSV files, for joins an upper bound
+    try:
+        return int(df._jdf.queryExecution().optimizedPlan().stats().sizeInBytes().toString())
+    except Exception:
+        return None
+
+def _get_table_detail(database: str, table: str):
+    if not spark.catalog.tableExists(f"{database}.{table}"):
+        return None
+    return spark.sql(f"DESCRIBE DETAIL {database}.{table}").select("partitionColumns", "properties").collect()[0]
+
+def repartition_for_write(df: DataFrame, targetFileSizeMb: int = None, partitionColumns: list = [], clusterBy: list = []) -> DataFrame:
+    """
+    Repartitioning a DataFrame before writing, so files written are close to the target file size.
+    With partition columns, the rows of a partition value are spread over as few tasks as its size allows, instead of every task writing a small file to every partition.
+
+    Args:
+        df (pyspark.sql.DataFrame): The DataFrame to write.
+        targetFileSizeMb (int): Target size of the files written. None is DEFAULT_TARGET_FILE_SIZE_MB. None is default
+        partitionColumns (list): Partition columns of the table. [] is default
+        clusterBy (list): Columns to sort rows by within the files written. [] is default
+
+    Returns:
+        pyspark.sql.DataFrame: The repartitioned DataFrame. Returned as is when the size can not be estimated.
+    """
+    estimated_bytes = _estimate_size_in_bytes(df)
+    target_bytes = (targetFileSizeMb or DEFAULT_TARGET_FILE_SIZE_MB) * 1024 * 1024
+
+    if estimated_bytes is not None:
+        num_files = max(1, min(MAX_FILES_PER_WRITE, math.ceil(estimated_bytes / target_bytes)))
+
+        if partitionColumns:
+            # Costs a pass over the partition columns only. Values are assumed to be of similar size
+            num_values = max(1, df.select(*partitionColumns).distinct().count())
+            files_per_value = math.ceil(num_files / num_values)
+            # A deterministic salt, as a random salt may duplicate or lose rows when a task is retried
+            salt = F.pmod(F.xxhash64(*df.columns), F.lit(files_per_value))
+            df = df.repartition(min(MAX_FILES_PER_WRITE, num_values * files_per_value), *[F.col(column) for column in partitionColumns], salt)
+        else:
+            df = df.repartition(num_files)
+
+    if clusterBy:
+        df = df.sortWithinPartitions(*clusterBy)
+
+    return df
+
+def get_table_property(database: str, table: str, key: str) -> str:
+    """
+    Getting a table property of a Delta table.
+
+    Args:
+        database (str): Database name.
+        table (str): Table name.
+        key (str): Property name, e.g. "delta.targetFileSize".
+
+    Returns:
+        str: The value, or None if the table or property does not exist.
+    """
+    detail = _get_table_detail(database, table)
+    return (detail["properties"] or {}).get(key) if detail is not None else None
+
+def set_table_property(database: str, table: str, key: str, value: str) -> None:
+    """
+    Setting a table property of a Delta table. Nothing is written if the property is already set to the value.
+
+    Args:
+        database (str): Database name.
+        table (str): Table name.
+        key (str): Property name.
+        value (str): Property value.
+    """
+    detail = _get_table_detail(database, table)
+    if detail is not None and (detail["properties"] or {}).get(key) != value:
+        spark.sql(f"ALTER TABLE {database}.{table} SET TBLPROPERTIES ('{key}' = '{value}')")
+
+def set_target_file_size(database: str, table: str, targetFileSizeMb: int) -> None:
+    """
+    Setting the delta.targetFileSize table property used when optimizing the table. Nothing is written if the property is already set to the size.
+
+    Args:
+        database (str): Database name.
+        table (str): Table name.
+        targetFileSizeMb (int): Target file size. None leaves the table as is.
+    """
+    if not targetFileSizeMb:
+        return
+
+    set_table_property(database, table, "delta.targetFileSize", str(targetFileSizeMb * 1024 * 1024))
+
+def write_with_layout(df: DataFrame, database: str, table: str, mode: str, layout: dict = {}, options: dict = {}) -> dict:
+    """
+    Writing a DataFrame to Delta with the layout declared in metadata.
+    Partitioning can only change by a full overwrite. Other writes to a table partitioned differently keep the current partitioning until then.
+
+    Args:
+        df (pyspark.sql.DataFrame): The DataFrame to write.
+        database (str): Database name.
+        table (str): Table name.
+        mode (str): Save mode, i.e. overwrite or append.
+        layout (dict): partition_columns, cluster_by and target_file_size_mb. Missing keys are not applied. {} is default
+        options (dict): Additional writer options, e.g. replaceWhere. {} is default
+
+    Returns:
+        dict: Delta operation metrics of the write, read before any later table property commit. See get_last_operation_metrics.
+    """
+    partition_columns = layout.get('partition_columns') or []
+    detail = _get_table_detail(database, table)
+
+    if detail is not None:
+        set_target_file_size(database, table, layout.get('target_file_size_mb')) # Before the write, so the write is the last commit
+    current_partition_columns = list(detail["partitionColumns"]) if detail is not None else None
+    is_full_overwrite = mode == 'overwrite' and 'replaceWhere' not in options
+
+    if current_partition_columns is not None and current_partition_columns != partition_columns and not is_full_overwrite:
+        print(f"  - {database}.{table} is partitioned by {current_partition_columns}. Partitioning by {partition_columns} is applied by the next full load.")
+        partition_columns = current_partition_columns
+
+    df = repartition_for_write(df, layout.get('target_file_size_mb'), partition_columns, layout.get('cluster_by') or [])
+
+    writer = df.write.format('delta').option("mergeSchema", "true").mode(mode).options(**options)
+    if partition_columns:
+        writer = writer.partitionBy(*partition_columns)
+    if is_full_overwrite and current_partition_columns is not None and current_partition_columns != partition_columns:
+        writer = writer.option("overwriteSchema", "true")
+
+    writer.saveAsTable(f"{database}.{table}")
+    metrics = get_last_operation_metrics(database, table)
+
+    if detail is None:
+        set_target_file_size(database, table, layout.get('target_file_size_mb')) # A new table has no properties before its first commit
+
+    return metrics
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
 # #### **Write Functions**  
 # These are functions for writing data. The function `write_to_delta_overwrite` is a low-level function designed for overwriting data. The next step would be to add low-level functions for operations like append, merge, etc. Policies related to IDs, auditing, and others can be incorporated here or at a higher level.  
 #   
@@ -189,9 +491,11 @@ def read_meta_from_json(path) -> dict:
 
 # CELL ********************
 
-def write_to_delta_overwrite(df: DataFrame, database: str, table: str, projectedColumns: list = [], addId: bool = True) -> None:
+def write_to_delta_overwrite(df: DataFrame, database: str, table: str, projectedColumns: list = [], addId: bool = True, keyColumns: list = [], layout: dict = {}, options: dict = {}) -> dict:
     """
     Handling overwriting to Delta. Id can be added if not exists, by adding addId = True.
+    With key columns, Ids are looked up in the key map, so rows keep their Id across reruns. Without, Ids are contiguous from 1.
+    The table is partitioned, clustered and sized as declared by layout. A changed partitioning is applied by the overwrite.
 
     Args:
         df (pyspark.sql.DataFrame): The DataFrame to add audit columns to.
@@ -199,51 +503,333 @@ def write_to_delta_overwrite(df: DataFrame, database: str, table: str, projected
         table (str): Table name.
         projectedColumns (list): Columns to write. [] is all columns. [] is default
         addId (bool): Adding an faux auto identity column if not exists. True is default.
+        keyColumns (list): Business key columns used for stable Ids. [] is default
+        layout (dict): partition_columns, cluster_by and target_file_size_mb of the table. See write_with_layout. {} is default
+        options (dict): Additional writer options, e.g. txnAppId and txnVersion of an idempotent write. {} is default
 
     Returns:
-        None
+        dict: Delta operation metrics of the write. See get_last_operation_metrics.
     """
 
     print(f"Overwriting {database}.{table}")
 
     projectedColumns = projectedColumns if projectedColumns != [] else [column[0] for column in df.dtypes]
 
-    max_id: int = 1 
     if "Id" not in [column[0] for column in df.dtypes] and addId:
-        columns = df.columns.copy()
-        df = df.withColumn("Id", F.monotonically_increasing_id() + 1)
-        #projectedColumns.append('Id')
+        if keyColumns:
+            df = assign_surrogate_keys(df, database, table, keyColumns)
+        else:
+            df = add_contiguous_key(df, 1)
+        df = df.select('Id', *projectedColumns)
+
+    return write_with_layout(df, database, table, 'overwrite', layout, options)
+
+def write_to_delta_append(df: DataFrame, database: str, table: str, projectedColumns: list = [], addId: bool = True, layout: dict = {}, options: dict = {}) -> dict:
+    """
+    Handling appending to Delta. Id can be added if not exists, by adding addId = True. Ids continue contiguously after the current max Id of the table.
+    The files appended are sized and clustered as declared by layout.
+
+    Args:
+        df (pyspark.sql.DataFrame): The DataFrame to append.
+        database (str): Database name.
+        table (str): Table name.
+        projectedColumns (list): Columns to write. [] is all columns. [] is default
+        addId (bool): Adding an faux auto identity column if not exists. True is default.
+        layout (dict): partition_columns, cluster_by and target_file_size_mb of the table. See write_with_layout. {} is default
+        options (dict): Additional writer options, e.g. the idempotent write options of get_ledger_write_options. {} is default
+
+    Returns:
+        dict: Delta operation metrics of the write. See get_last_operation_metrics.
+    """
+
+    print(f"Appending to {database}.{table}")
+
+    projectedColumns = projectedColumns if projectedColumns != [] else [column[0] for column in df.dtypes]
+
+    if "Id" not in [column[0] for column in df.dtypes] and addId:
+        df = add_contiguous_key(df, get_max_key(database, table) + 1)
         df = df.select('Id', *projectedColumns)
 
-    df.write.format('delta').option("mergeSchema", "true").mode('overwrite').saveAsTable(f"{database}.{table}")
+    return write_with_layout(df, database, table, 'append', layout, options)
+
+def write_to_delta_merge(df: DataFrame, database: str, table: str, keyColumns: list, projectedColumns: list = [], addId: bool = True, hashColumn: str = "RowHash", layout: dict = {}, validateKeys: bool = True) -> dict:
+    """
+    Handling upserts to Delta using MERGE on key columns. Id can be added to new rows if not exists, by adding addId = True.
+    With a hash column, a hash of all non-key columns is stored per row, and matched rows are only rewritten when the hash has changed.
+    Key columns must be unique in df, e.g. deduplicated by cleanse_dataframe. Columns missing in the table, e.g. the hash column of a table created before, are added.
+
+    Args:
+        df (pyspark.sql.DataFrame): The DataFrame to merge.
+        database (str): Database name.
+        table (str): Table name.
+        keyColumns (list): Columns identifying a row.
+        projectedColumns (list): Columns to write. [] is all columns. [] is default
+        addId (bool): Adding an faux auto identity column to new rows if not exists. True is default.
+        hashColumn (str): Name of the change detection hash column. None disables change detection. "RowHash" is default.
+        layout (dict): partition_columns, cluster_by and target_file_size_mb used when the table is created. See write_with_layout. {} is default
+        validateKeys (bool): Fail with the duplicate keys before merging, instead of the MERGE failing on multiple matching source rows. Costs a pass over the keys. True is default.
+
+    Returns:
+        dict: Delta operation metrics of the write. See get_last_operation_metrics.
+    """
+    from delta.tables import DeltaTable
+
+    projectedColumns = projectedColumns if projectedColumns != [] else [column[0] for column in df.dtypes]
+    df = df.select(*projectedColumns)
+
+    if hashColumn:
+        value_columns = [column for column in df.columns if column not in keyColumns and column != "Id"]
+        df = df.withColumn(hashColumn, F.sha2(F.to_json(F.struct(*value_columns)), 256))
+
+    if not spark.catalog.tableExists(f"{database}.{table}"):
+        return write_to_delta_overwrite(df, database, table, [], addId, keyColumns, layout)
+
+    print(f"Merging into {database}.{table}")
+
+    if validateKeys:
+        duplicate_keys = df.groupBy(*keyColumns).count().where(F.col("count") > 1).limit(5).collect()
+        if duplicate_keys:
+            raise ValueError(f"Key columns {keyColumns} are not unique in the rows merged into {database}.{table}, e.g. {[row.asDict() for row in duplicate_keys]}")
+
+    if "Id" not in df.columns and addId:
+        df = assign_surrogate_keys(df, database, table, keyColumns) # Only used by inserted rows
+
+    add_missing_columns(database, table, df.schema) # Schema evolution is not enabled for MERGE
+    set_target_file_size(database, table, layout.get('target_file_size_mb')) # Before the MERGE, so the MERGE is the last commit
+
+    merge_condition = " AND ".join(f"target.`{column}` = source.`{column}`" for column in keyColumns)
+    update_set = {f"`{column}`": f"source.`{column}`" for column in df.columns if column not in keyColumns and column != "Id"}
+    update_condition = f"target.`{hashColumn}` IS NULL OR target.`{hashColumn}` <> source.`{hashColumn}`" if hashColumn else None
+
+    (DeltaTable.forName(spark, f"{database}.{table}").alias("target")
+        .merge(df.alias("source"), merge_condition)
+        .whenMatchedUpdate(condition = update_condition, set = update_set)
+        .whenNotMatchedInsertAll()
+        .execute())
+
+    return get_last_operation_metrics(database, table)
+
+def write_to_delta_replace_where(df: DataFrame, database: str, table: str, replaceWhere: str, projectedColumns: list = [], layout: dict = {}) -> dict:
+    """
+    Handling partial overwrites of Delta. Only rows matching replaceWhere are replaced, e.g. the date range of a daily fact load.
+    All rows in df must match replaceWhere. With replaceWhere on partition columns, only the partitions replaced are touched.
+
+    Args:
+        df (pyspark.sql.DataFrame): The DataFrame to write.
+        database (str): Database name.
+        table (str): Table name.
+        replaceWhere (str): Predicate of the rows to replace, e.g. "DWID_Date >= 20230101".
+        projectedColumns (list): Columns to write. [] is all columns. [] is default
+        layout (dict): partition_columns, cluster_by and target_file_size_mb of the table. See write_with_layout. {} is default
+
+    Returns:
+        dict: Delta operation metrics of the write. See get_last_operation_metrics.
+    """
+    if not spark.catalog.tableExists(f"{database}.{table}"):
+        return write_to_delta_overwrite(df, database, table, projectedColumns, False, layout = layout)
+
+    print(f"Overwriting {database}.{table} where {replaceWhere}")
+
+    projectedColumns = projectedColumns if projectedColumns != [] else [column[0] for column in df.dtypes]
+
+    return write_with_layout(df.select(*projectedColumns), database, table, 'overwrite', layout, {"replaceWhere": replaceWhere})
+
+def write_to_delta_scd2(df: DataFrame, database: str, table: str, businessKeys: list, trackedColumns: list = [], hashColumn: str = "RowHash", surrogateKey: str = None) -> dict:
+    """
+    Handling Slowly Changing Dimensions type 2 in Delta. A new version is inserted when a tracked column changes, and the current version is closed.
+    Changed keys are found with a single join of the incoming rows against the current versions, and closing, inserting and updating versions happens in one MERGE.
+    Columns not tracked don't create new versions by themselves, but are updated in place on the current version (SCD1). Keys missing in df are left as they are.
+    Every inserted version gets its own surrogate key after the max key of the table, so the surrogate key stays unique.
+    A table created before without the SCD2 columns is rebuilt with its rows as the first versions.
+    Business keys must be unique in df.
+
+    Args:
+        df (pyspark.sql.DataFrame): The DataFrame holding the current state of the dimension.
+        database (str): Database name.
+        table (str): Table name.
+        businessKeys (list): Columns identifying a member of the dimension.
+        trackedColumns (list): Columns creating a new version when changed. [] is all columns except the business keys. [] is default
+        hashColumn (str): Name of the column holding the hash of the tracked columns. "RowHash" is default.
+        surrogateKey (str): Surrogate key column of the dimension, e.g. "DWID_Customer". None keeps the values of df. None is default
+
+    Returns:
+        dict: Delta operation metrics of the write. See get_last_operation_metrics.
+    """
+    from delta.tables import DeltaTable
+
+    trackedColumns = trackedColumns if trackedColumns != [] else [column for column in df.columns if column not in businessKeys and column != surrogateKey]
+    untracked_columns = [column for column in df.columns if column not in businessKeys and column not in trackedColumns and column != surrogateKey]
+
+    def columns_hash(columns):
+        return F.sha2(F.to_json(F.struct(*columns)), 256) if columns else F.lit(None).cast("string")
+
+    df = df.withColumn(hashColumn, columns_hash(trackedColumns))
 
-def load_dimension(df: DataFrame, database: str, table: str) -> None:
+    if not spark.catalog.tableExists(f"{database}.{table}"):
+        df = df.withColumn("ValidFrom", F.current_timestamp()).withColumn("ValidTo", F.lit(None).cast("timestamp")).withColumn("IsCurrent", F.lit(True))
+        return write_to_delta_overwrite(df, database, table, [], False)
+
+    existing_df = spark.table(f"{database}.{table}")
+    missing_columns = [column for column in (hashColumn, "ValidFrom", "ValidTo", "IsCurrent") if column not in existing_df.columns]
+    if missing_columns:
+        # Dimensions created by an overwrite before, i.e. one row per key, become the first versions
+        print(f"  - {database}.{table} has no {', '.join(missing_columns)}. Rebuilding it with the current rows as the first versions")
+        (existing_df
+            .withColumn(hashColumn, columns_hash(trackedColumns))
+            .withColumn("ValidFrom", F.current_timestamp())
+            .withColumn("ValidTo", F.lit(None).cast("timestamp"))
+            .withColumn("IsCurrent", F.lit(True))
+            .write.format('delta').option("overwriteSchema", "true").mode('overwrite').saveAsTable(f"{database}.{table}"))
+
+    print(f"Merging SCD2 versions into {database}.{table}")
+
+    current_df = (spark.table(f"{database}.{table}").where(F.col("IsCurrent"))
+        .select(*businessKeys, F.col(hashColumn).alias("__current_hash"), columns_hash(untracked_columns).alias("__current_untracked_hash")))
+
+    joined_df = df.withColumn("__untracked_hash", columns_hash(untracked_columns)).join(current_df, businessKeys, "left")
+
+    # New keys have no current hash, changed keys have a different one
+    changed_df = joined_df.where(F.col("__current_hash").isNull() | (F.col("__current_hash") != F.col(hashColumn))).withColumn("__action", F.lit("version"))
+
+    # Unchanged keys with changed untracked columns are updated in place
+    updated_df = (joined_df
+        .where((F.col("__current_hash") == F.col(hashColumn)) & ~F.col("__untracked_hash").eqNullSafe(F.col("__current_untracked_hash")))
+        .withColumn("__action", F.lit("update")))
+
+    if surrogateKey:
+        # Materialized once, as changed_df is read twice below and keys numbered by two evaluations could collide
+        changed_df = add_contiguous_key(changed_df.drop(surrogateKey), get_max_key(database, table, surrogateKey) + 1, surrogateKey).localCheckpoint()
+        updated_df = updated_df.withColumn(surrogateKey, F.col(surrogateKey).cast(LongType()))
+
+    merge_keys = [f"__merge_key_{index}" for index in range(len(businessKeys))]
+    key_types = dict(df.dtypes)
+
+    # Rows with merge keys close the current version of changed keys, insert new keys and update unchanged keys in place.
+    # Rows without merge keys never match, so they insert the new version of changed keys.
+    staged_df = (changed_df.unionByName(updated_df).select("*", *[F.col(key).alias(merge_key) for key, merge_key in zip(businessKeys, merge_keys)])
+        .unionByName(changed_df.where(F.col("__current_hash").isNotNull()).select("*", *[F.lit(None).cast(key_types[key]).alias(merge_key) for key, merge_key in zip(businessKeys, merge_keys)]))
+        .drop("__current_hash", "__current_untracked_hash", "__untracked_hash"))
+
+    merge_condition = " AND ".join(f"target.`{key}` = source.`{merge_key}`" for key, merge_key in zip(businessKeys, merge_keys)) + " AND target.IsCurrent = true"
+    insert_values = {f"`{column}`": f"source.`{column}`" for column in df.columns}
+    insert_values.update({"ValidFrom": "current_timestamp()", "ValidTo": "CAST(NULL AS TIMESTAMP)", "IsCurrent": "true"})
+
+    merge = (DeltaTable.forName(spark, f"{database}.{table}").alias("target")
+        .merge(staged_df.alias("source"), merge_condition))
+    if untracked_columns:
+        merge = merge.whenMatchedUpdate(condition = "source.__action = 'update'", set = {f"`{column}`": f"source.`{column}`" for column in untracked_columns})
+    (merge
+        .whenMatchedUpdate(condition = "source.__action = 'version'", set = {"ValidTo": "current_timestamp()", "IsCurrent": "false"})
+        .whenNotMatchedInsert(condition = "source.__action = 'version'", values = insert_values)
+        .execute())
+
+    return get_last_operation_metrics(database, table)
+
+def load_dimension(df: DataFrame, database: str, table: str, keyColumns: list = [], trackedColumns: list = None, surrogateKey: str = None) -> dict:
     """
-    Handling loading of dimensions.
+    Handling loading of dimensions. With key columns, the dimension is merged so only changed rows are rewritten.
+    With tracked columns as well, the dimension is handled as SCD2, see write_to_delta_scd2.
 
     Args:
         df (pyspark.sql.DataFrame): The DataFrame to add audit columns to.
         database (str): Database name.
         table (str): Table name.
+        keyColumns (list): Business key columns of the dimension. [] overwrites the dimension. [] is default
+        trackedColumns (list): Columns creating a new SCD2 version when changed. [] tracks all columns. None is default, handling the dimension as SCD1.
+        surrogateKey (str): Surrogate key column numbered per SCD2 version. None is default
 
     Returns:
-        None
+        dict: Delta operation metrics of the write. See get_last_operation_metrics.
+    """
+    if keyColumns and trackedColumns is not None:
+        return write_to_delta_scd2(df, database, table, keyColumns, trackedColumns, surrogateKey = surrogateKey)
+    elif keyColumns:
+        return write_to_delta_merge(df, database, table, keyColumns, [], False)
+    else:
+        return write_to_delta_overwrite(df, database, table, [], False)
+
+def write_entity(df: DataFrame, database: str, table: str, meta_entity: dict, writeOptions: dict = {}) -> dict:
+    """
+    Handling writing of an entity as declared by its load mode in metadata.
+    Entities with key columns are merged unless fully loaded. Incremental and streaming entities without are appended.
+
+    Args:
+        df (pyspark.sql.DataFrame): The DataFrame to write.
+        database (str): Database name.
+        table (str): Table name.
+        meta_entity (dict): Metadata of the entity. See _process_meta_data.
+        writeOptions (dict): Writer options of appends and overwrites, e.g. txnAppId and txnVersion of get_ledger_write_options, so a replayed batch is skipped.
+            Merges are idempotent by key and don't need them. {} is default
+
+    Returns:
+        dict: Delta operation metrics of the write. See get_last_operation_metrics.
     """
-    write_to_delta_overwrite(df, database, table, [], False)
+    if meta_entity['key_columns'] and meta_entity['load_mode'] != 'full':
+        # cleanse_dataframe already deduplicated on the key columns, unless the entity is declared unique
+        return write_to_delta_merge(df = df, database = database, table = table, keyColumns = meta_entity['key_columns'], projectedColumns = meta_entity['projection'], layout = meta_entity['layout'], validateKeys = meta_entity['is_unique'])
+    elif meta_entity['load_mode'] in ('incremental', 'streaming'):
+        return write_to_delta_append(df = df, database = database, table = table, projectedColumns = meta_entity['projection'], layout = meta_entity['layout'], options = writeOptions)
+    else:
+        return write_to_delta_overwrite(df = df, database = database, table = table, projectedColumns = meta_entity['projection'], keyColumns = meta_entity['key_columns'], layout = meta_entity['layout'], options = writeOptions)
 
-def load_fact(df: DataFrame, database: str, table: str) -> None:
+FACT_KEY_SCHEME_PROPERTY = 'aquashack.dimensionKeyScheme'
+
+def load_fact(df: DataFrame, database: str, table: str, replaceWhere: str = None, partitionKey: str = None, layout: dict = {}, keyScheme: str = None) -> dict:
     """
-    Handling loading of facts.
+    Handling loading of facts. With replaceWhere, only the matching rows, e.g. the days being reloaded, are replaced.
+    With a partition key, e.g. a date key, only rows with keys after the max key of the fact are written. Late-arriving rows, i.e. keys at or below
+    the max key with another row count in df than in the fact, are handled by replacing the range from the first such key instead.
+    With a key scheme, a fact written with another scheme of dimension keys is rebuilt from df, so the two schemes are never mixed in one table.
 
     Args:
         df (pyspark.sql.DataFrame): The DataFrame to add audit columns to.
         database (str): Database name.
         table (str): Table name.
+        replaceWhere (str): Predicate of the rows to replace. None overwrites the fact. None is default
+        partitionKey (str): Key column to write new partitions by, when replaceWhere is None. None is default
+        layout (dict): partition_columns, cluster_by and target_file_size_mb of the fact. See write_with_layout. {} is default
+        keyScheme (str): Scheme of the dimension keys in df, e.g. "surrogate", stored as the FACT_KEY_SCHEME_PROPERTY table property. None is not checked. None is default
 
     Returns:
-        None
+        dict: Delta operation metrics of the write. See get_last_operation_metrics.
     """
-    write_to_delta_overwrite(df, database, table, [], False)
+    if keyScheme and spark.catalog.tableExists(f"{database}.{table}"):
+        current_scheme = get_table_property(database, table, FACT_KEY_SCHEME_PROPERTY)
+        if current_scheme != keyScheme:
+            print(f"  - {database}.{table} holds {current_scheme or 'business'} keys. Rebuilding it with {keyScheme} keys")
+            metrics = write_to_delta_overwrite(df, database, table, [], False, layout = layout, options = {"overwriteSchema": "true"})
+            set_table_property(database, table, FACT_KEY_SCHEME_PROPERTY, keyScheme)
+            return metrics
+
+    if replaceWhere:
+        metrics = write_to_delta_replace_where(df.where(F.expr(replaceWhere)), database, table, replaceWhere, layout = layout)
+    elif partitionKey and spark.catalog.tableExists(f"{database}.{table}"):
+        max_key = get_max_key(database, table, partitionKey)
+
+        # Comparing row counts per key only shuffles the keys, not the rows
+        source_counts = df.where(F.col(partitionKey) <= max_key).groupBy(partitionKey).agg(F.count("*").alias("source_rows"))
+        target_counts = spark.table(f"{database}.{table}").groupBy(partitionKey).agg(F.count("*").alias("target_rows"))
+        late = (source_counts.join(target_counts, partitionKey, "left")
+            .where(F.col("target_rows").isNull() | (F.col("source_rows") != F.col("target_rows")))
+            .agg(F.min(partitionKey).alias("from_key"), F.count("*").alias("keys"))
+            .collect()[0])
+
+        from_key = late["from_key"] if late["keys"] else None
+        if from_key is not None:
+            print(f"  - {late['keys']} {partitionKey} at or below {max_key} have late-arriving rows. Replacing from {from_key}")
+            return write_to_delta_replace_where(df.where(F.col(partitionKey) >= from_key), database, table, f"`{partitionKey}` >= {from_key}", layout = layout)
+
+        df = df.where(F.col(partitionKey) > max_key)
+        if df.isEmpty():
+            print(f"No new {partitionKey} after {max_key} for {database}.{table}. Skipping!")
+            return None
+        return write_to_delta_replace_where(df, database, table, f"`{partitionKey}` > {max_key}", layout = layout)
+    else:
+        metrics = write_to_delta_overwrite(df, database, table, [], False, layout = layout)
+
+    if keyScheme:
+        set_table_property(database, table, FACT_KEY_SCHEME_PROPERTY, keyScheme) # After reading the metrics of the write
+    return metrics
 
 # METADATA ********************
 
@@ -261,7 +847,8 @@ def load_fact(df: DataFrame, database: str, table: str) -> None:
 
 def create_or_update_date_dimension(start_date: str, end_date: str, database: str, table: str) -> None:
     """
-    Creating a date tabel
+    Creating a date tabel. Only dates missing in an existing table are appended, and nothing is written if the table already covers the range.
+    An existing table missing any of the date attributes is rebuilt over its own range and the requested range.
 
     Args:
         start_date (str): From date
@@ -272,16 +859,1405 @@ def create_or_update_date_dimension(start_date: str, end_date: str, database: st
     Returns:
         None
     """
-    df = spark.createDataFrame([(start_date, end_date)], ["start_date", "end_date"])
-    df = df.selectExpr("explode(sequence(to_date(start_date), to_date(end_date))) as Date")
-    df = df.withColumn("DateId", F.expr("cast(date_format(date, 'yyyyMMdd') as int)"))
-    df = df.select(['DateId', 'Date'])
+    def date_range(start_date, end_date):
+        df = spark.createDataFrame([(start_date, end_date)], ["start_date", "end_date"])
+        return df.selectExpr("explode(sequence(to_date(start_date), to_date(end_date))) as Date")
+
+    def date_attributes(df):
+        return df.select(
+            F.expr("cast(date_format(Date, 'yyyyMMdd') as int)").alias("DateId"),
+            F.col("Date"),
+            F.year("Date").alias("Year"),
+            F.quarter("Date").alias("Quarter"),
+            F.month("Date").alias("Month"),
+            F.date_format("Date", "MMMM").alias("MonthName"),
+            F.expr("cast(date_format(Date, 'yyyyMM') as int)").alias("YearMonth"),
+            F.dayofmonth("Date").alias("Day"),
+            F.dayofyear("Date").alias("DayOfYear"),
+            F.expr("weekday(Date) + 1").alias("DayOfWeek"), # 1 = Monday
+            F.date_format("Date", "EEEE").alias("DayName"),
+            F.weekofyear("Date").alias("WeekOfYear"),
+            (F.expr("weekday(Date)") >= 5).alias("IsWeekend"),
+            F.trunc("Date", "month").alias("FirstDayOfMonth"),
+            F.last_day("Date").alias("LastDayOfMonth"))
+
+    df = date_range(start_date, end_date)
+
+    if spark.catalog.tableExists(f"{database}.{table}"):
+        table_df = spark.table(f"{database}.{table}")
+        missing_columns = [column for column in date_attributes(df).columns if column not in table_df.columns]
+
+        if missing_columns:
+            table_range = table_df.agg(F.min("Date").alias("min_date"), F.max("Date").alias("max_date")).collect()[0]
+            rebuild_start = min(str(table_range["min_date"] or start_date), start_date)
+            rebuild_end = max(str(table_range["max_date"] or end_date), end_date)
+            print(f"{database}.{table} is missing {', '.join(missing_columns)}. Rebuilding {rebuild_start} to {rebuild_end}")
+            write_to_delta_overwrite(df = date_attributes(date_range(rebuild_start, rebuild_end)), database = database, table = table)
+            return
+
+        start_id, end_id = int(start_date.replace("-", "")), int(end_date.replace("-", ""))
+        existing_df = table_df.select("DateId").where(F.col("DateId").between(start_id, end_id))
+
+        existing = existing_df.agg(F.min("DateId").alias("min_id"), F.max("DateId").alias("max_id"), F.count("DateId").alias("days")).collect()[0]
+        if existing["min_id"] == start_id and existing["max_id"] == end_id and existing["days"] == df.count():
+            print(f"{database}.{table} already covers {start_date} to {end_date}. Skipping!")
+            return
+
+        df = df.join(existing_df, F.expr("cast(date_format(Date, 'yyyyMMdd') as int)") == F.col("DateId"), "left_anti")
+
+    write_to_delta_append(df = date_attributes(df), database = database, table = table)
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Orchestration Functions**  
+# Functions for running metadata-driven work concurrently. `run_entities_in_parallel` submits entities from a thread pool, so independent tables are processed concurrently on one Spark session instead of one at a time.  
+#   
+# Each entity gets its own Spark scheduler pool. Spark only shares the cluster fairly between pools when the session runs with `spark.scheduler.mode` set to `FAIR`, which must be set when the session starts (e.g. in the environment or using `%%configure`). With the default FIFO mode entities still run concurrently, but small jobs may queue behind large ones.  
+
+# CELL ********************
+
+RUN_REPORT_SCHEMA = "entity string, status string, weight int, duration_seconds double, error string"
+
+def run_entities_in_parallel(entities: dict, process_entity, max_parallelism: int = 4, scheduler_pool_prefix: str = "aquashack") -> list:
+    """
+    Processing entities concurrently from a thread pool. Every entity occupies a share of the degree of parallelism equal to its weight,
+    so heavy entities leave room for fewer concurrent entities.
+
+    Args:
+        entities (dict): Entities keyed by name, e.g. the meta data structure from read_meta_from_sql. The key 'weight' (int) is used if present, otherwise 1.
+        process_entity (callable): Function processing one entity. Called with the entity name and its meta data. May return a status, e.g. "Skipped", otherwise "Succeeded" is reported.
+        max_parallelism (int): Total weight processed at the same time. 4 is default.
+        scheduler_pool_prefix (str): Prefix of the Spark scheduler pool used per entity. "aquashack" is default.
+
+    Returns:
+        list: The run report. One dict per entity with entity, status, weight, duration_seconds and error. See RUN_REPORT_SCHEMA.
+    """
+    capacity = threading.Condition()
+    in_use = [0]
+
+    def _run(entity: str, meta_entity: dict) -> dict:
+        weight = min(max(int(meta_entity.get('weight', 1)), 1), max_parallelism)
+
+        with capacity:
+            capacity.wait_for(lambda: in_use[0] + weight <= max_parallelism)
+            in_use[0] += weight
+
+        start_time = time.time()
+        spark.sparkContext.setLocalProperty("spark.scheduler.pool", f"{scheduler_pool_prefix}_{entity}")
+        try:
+            status = process_entity(entity, meta_entity) or "Succeeded"
+            return {"entity": entity, "status": status, "weight": weight, "duration_seconds": round(time.time() - start_time, 3), "error": None}
+        except Exception as e:
+            print(f"❌ Processing of {entity} failed: {str(e)}")
+            return {"entity": entity, "status": "Failed", "weight": weight, "duration_seconds": round(time.time() - start_time, 3), "error": str(e)}
+        finally:
+            spark.sparkContext.setLocalProperty("spark.scheduler.pool", None)
+            with capacity:
+                in_use[0] -= weight
+                capacity.notify_all()
+
+    # Heavy entities are submitted first, so they don't end up stretching the run at the end
+    ordered_entities = sorted(entities.items(), key=lambda entity: -int(entity[1].get('weight', 1)))
+
+    with ThreadPoolExecutor(max_workers=max_parallelism) as executor:
+        futures = [executor.submit(_run, entity, meta_entity) for entity, meta_entity in ordered_entities]
+        return [future.result() for future in futures]
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Incremental Functions**  
+# Entities with `load_mode` = `incremental` in the `landing_to_base` metadata only read files they have not processed before. A ledger table in the destination lakehouse records every processed file with its modification time.  
+#   
+# A file rewritten in Landing after it was processed is only read again for entities with key columns, as they are merged by key. Appending it would duplicate its rows, so for other entities it is skipped with a warning until the entity is reloaded in full.  
+#   
+# Every append of files is a numbered batch. The data is written idempotently with `txnAppId`/`txnVersion`, and the files of the batch are stored in the commit info of the write. If the notebook fails after the data is written but before the ledger is, the ledger is recovered from the commit info on the next run, so the files are not ingested twice.  
+
+# CELL ********************
+
+LEDGER_TABLE = 'landing_file_ledger'
+LEDGER_SCHEMA = "entity string, path string, size long, modification_time long, batch_version long, processed_at timestamp"
+
+def create_table_if_not_exists(database: str, table: str, schema: str) -> None:
+    """
+    Creating a Delta table if it doesn't exist. Columns of the schema missing in an existing table are added.
+    Control tables are created up front, as concurrent appends from run_entities_in_parallel would otherwise race on creating them.
+
+    Args:
+        database (str): Database name.
+        table (str): Table name.
+        schema (str): DDL-string of the columns, e.g. "entity string, path string".
+
+    Returns:
+        None
+    """
+    spark.sql(f"CREATE TABLE IF NOT EXISTS {database}.{table} ({schema}) USING DELTA")
+    add_missing_columns(database, table, spark.createDataFrame([], schema).schema)
+
+def add_missing_columns(database: str, table: str, schema: StructType) -> list:
+    """
+    Adding columns of a schema missing in an existing table, e.g. columns added by a newer version of a writer. Existing rows get NULL.
+
+    Args:
+        database (str): Database name.
+        table (str): Table name.
+        schema (pyspark.sql.types.StructType): The columns the table must have.
+
+    Returns:
+        list: Names of the columns added.
+    """
+    existing_columns = {column.lower() for column in spark.table(f"{database}.{table}").columns}
+    missing_columns = [field for field in schema.fields if field.name.lower() not in existing_columns]
+    if missing_columns:
+        print(f"  - Adding columns {', '.join(field.name for field in missing_columns)} to {database}.{table}")
+        spark.sql(f"ALTER TABLE {database}.{table} ADD COLUMNS ({', '.join(f'`{field.name}` {field.dataType.simpleString()}' for field in missing_columns)})")
+    return [field.name for field in missing_columns]
+
+def create_control_tables(database: str) -> None:
+    """
+    Creating the control tables written by the entities and notebooks of a run, before they are processed concurrently.
+
+    Args:
+        database (str): Database holding the control tables.
+
+    Returns:
+        None
+    """
+    create_table_if_not_exists(database, LEDGER_TABLE, LEDGER_SCHEMA)
+    create_table_if_not_exists(database, KEY_MAP_TABLE, KEY_MAP_SCHEMA)
+    create_table_if_not_exists(database, RUN_LOG_TABLE, RUN_LOG_SCHEMA)
+    create_table_if_not_exists(database, DQ_RESULTS_TABLE, DQ_RESULTS_SCHEMA)
+    create_table_if_not_exists(database, DQ_QUARANTINE_TABLE, DQ_QUARANTINE_SCHEMA)
+
+def list_source_files(source: str) -> list:
+    """
+    Listing files of a Landing source. Folders are listed recursively.
+
+    Args:
+        source (str): File or folder path, e.g. Files/data/Sales/Transactions.
+
+    Returns:
+        list: One dict per file with path, size and modification_time (epoch ms).
+    """
+    files = []
+    for file_info in notebookutils.fs.ls(source):
+        if file_info.isDir:
+            files.extend(list_source_files(file_info.path))
+        else:
+            files.append({"path": file_info.path, "size": file_info.size, "modification_time": file_info.modifyTime})
+    return files
+
+def get_ledger_version(entity: str, database: str, ledger_table: str = LEDGER_TABLE) -> int:
+    """
+    Getting the latest batch version recorded in the ledger for an entity.
+
+    Args:
+        entity (str): Entity name, i.e. the destination table.
+        database (str): Database holding the ledger table.
+        ledger_table (str): Ledger table name. LEDGER_TABLE is default.
+
+    Returns:
+        int: The latest batch version. 0 if no batch is recorded.
+    """
+    return spark.table(f"{database}.{ledger_table}").where(F.col("entity") == entity).agg(F.max("batch_version")).collect()[0][0] or 0
+
+def get_ledger_write_options(entity: str, files: list, batchVersion: int, ledger_table: str = LEDGER_TABLE) -> dict:
+    """
+    Getting the writer options appending a batch of files idempotently. The files are stored in the commit info, so the ledger can be recovered from the data write.
+
+    Args:
+        entity (str): Entity name, i.e. the destination table.
+        files (list): The files of the batch. See list_source_files.
+        batchVersion (int): Version of the batch, i.e. get_ledger_version + 1.
+        ledger_table (str): Ledger table name. LEDGER_TABLE is default.
+
+    Returns:
+        dict: txnAppId, txnVersion and userMetadata writer options.
+    """
+    return {
+        "txnAppId": f"{ledger_table}.{entity}",
+        "txnVersion": str(batchVersion),
+        "userMetadata": json.dumps({"ledger_entity": entity, "ledger_version": batchVersion, "files": files})
+    }
+
+def _recover_ledger(entity: str, database: str, ledger_table: str) -> None:
+    # Batches committed to the entity table, but not to the ledger, are recorded from the commit info of the data write
+    if not spark.catalog.tableExists(f"{database}.{entity}"):
+        return
+
+    ledger_version = get_ledger_version(entity, database, ledger_table)
+    commits = spark.sql(f"DESCRIBE HISTORY {database}.{entity}").where(F.col("userMetadata").contains('"ledger_version"')).select("userMetadata").collect()
+
+    for commit in commits:
+        batch = json.loads(commit["userMetadata"])
+        if batch.get("ledger_entity") == entity and batch["ledger_version"] > ledger_version:
+            print(f"  - Recovering ledger of {entity} batch {batch['ledger_version']} from the commit info")
+            record_processed_files(entity, batch["files"], database, batch["ledger_version"], ledger_table)
+
+def get_unprocessed_files(entity: str, source: str, database: str, allowRewrites: bool = False, ledger_table: str = LEDGER_TABLE) -> list:
+    """
+    Finding files of a source not yet processed for an entity according to the ledger.
+    Files rewritten since they were processed are skipped with a warning, unless allowRewrites is True.
+
+    Args:
+        entity (str): Entity name, i.e. the destination table.
+        source (str): File or folder path of the source.
+        database (str): Database holding the ledger table.
+        allowRewrites (bool): Return rewritten files as well, e.g. for entities merged by key. False is default.
+        ledger_table (str): Ledger table name. LEDGER_TABLE is default.
+
+    Returns:
+        list: The unprocessed files. See list_source_files.
+    """
+    files = list_source_files(source)
+    _recover_ledger(entity, database, ledger_table)
+
+    processed_files = {
+        (row["path"], row["modification_time"])
+        for row in spark.table(f"{database}.{ledger_table}").where(F.col("entity") == entity).select("path", "modification_time").collect()
+    }
+    processed_paths = {path for path, _ in processed_files}
+
+    new_files = [file for file in files if file["path"] not in processed_paths]
+    rewritten_files = [file for file in files if file["path"] in processed_paths and (file["path"], file["modification_time"]) not in processed_files]
+
+    if rewritten_files and not allowRewrites:
+        print(f"  - {len(rewritten_files)} file(s) of {entity} were rewritten after they were processed. Skipping, as appending them would duplicate rows. Reload {entity} in full or declare key columns: {', '.join(file['path'] for file in rewritten_files)}")
+        return new_files
+
+    return new_files + rewritten_files
+
+def record_processed_files(entity: str, files: list, database: str, batchVersion: int, ledger_table: str = LEDGER_TABLE) -> None:
+    """
+    Appending a processed batch of files of an entity to the ledger.
+
+    Args:
+        entity (str): Entity name, i.e. the destination table.
+        files (list): The processed files. See list_source_files.
+        database (str): Database holding the ledger table.
+        batchVersion (int): Version of the batch. See get_ledger_write_options.
+        ledger_table (str): Ledger table name. LEDGER_TABLE is default.
+
+    Returns:
+        None
+    """
+    df = spark.createDataFrame(
+        [(entity, file["path"], file["size"], file["modification_time"], batchVersion) for file in files],
+        "entity string, path string, size long, modification_time long, batch_version long")
+    df = df.withColumn("processed_at", F.current_timestamp())
+
+    df.write.format('delta').mode('append').saveAsTable(f"{database}.{ledger_table}")
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Surrogate Key Functions**  
+# Surrogate keys are contiguous and continue after the current max key of the table. Keys are numbered with `zipWithIndex`, which only needs the row count per partition, instead of a `row_number` window that moves all rows to a single partition.  
+# When business keys are known, the key map table in the lakehouse remembers the surrogate key of every business key per table, so a row keeps its key when the table is overwritten or reloaded.  
+# Without business keys, keys are only contiguous. An overwrite numbers the rows from 1 again, so the same row can get another key, and such keys should not be referenced by other tables.
+
+# CELL ********************
+
+KEY_MAP_TABLE = 'surrogate_key_map'
+KEY_MAP_SCHEMA = "entity string, business_key string, key long, created_at timestamp"
+
+def get_max_key(database: str, table: str, keyColumn: str = "Id") -> int:
+    """
+    Getting the current max surrogate key of a table.
+
+    Args:
+        database (str): Database name.
+        table (str): Table name.
+        keyColumn (str): Surrogate key column. "Id" is default.
+
+    Returns:
+        int: The max key, or 0 if the table or column does not exist.
+    """
+    if not spark.catalog.tableExists(f"{database}.{table}"):
+        return 0
+
+    target_df = spark.table(f"{database}.{table}")
+    if keyColumn not in target_df.columns:
+        return 0
+
+    return target_df.agg(F.max(keyColumn)).collect()[0][0] or 0
+
+def add_contiguous_key(df: DataFrame, start: int, keyColumn: str = "Id") -> DataFrame:
+    """
+    Adding a contiguous key to every row, starting at start.
+
+    Args:
+        df (pyspark.sql.DataFrame): The DataFrame to add the key to.
+        start (int): The first key.
+        keyColumn (str): Name of the key column. "Id" is default.
+
+    Returns:
+        pyspark.sql.DataFrame: The DataFrame with the key as first column.
+    """
+    schema = StructType([StructField(keyColumn, LongType(), False)] + df.schema.fields)
+    return spark.createDataFrame(df.rdd.zipWithIndex().map(lambda row_index: (row_index[1] + start, *row_index[0])), schema)
+
+def assign_surrogate_keys(df: DataFrame, database: str, table: str, businessKeys: list, keyColumn: str = "Id", key_map_table: str = KEY_MAP_TABLE) -> DataFrame:
+    """
+    Assigning stable surrogate keys by business key. Business keys already in the key map keep their key.
+    New business keys get contiguous keys after the max key of the map and the table, and are added to the map.
+
+    Args:
+        df (pyspark.sql.DataFrame): The DataFrame to add keys to.
+        database (str): Database name holding the table and the key map.
+        table (str): Table name the keys belong to.
+        businessKeys (list): Columns identifying a row.
+        keyColumn (str): Name of the surrogate key column. "Id" is default.
+        key_map_table (str): Key map table name. KEY_MAP_TABLE is default.
+
+    Returns:
+        pyspark.sql.DataFrame: The DataFrame with the surrogate key column.
+    """
+    business_key = F.to_json(F.struct(*businessKeys))
+    df = df.withColumn("__business_key", business_key)
+
+    max_key = get_max_key(database, table, keyColumn)
+    if spark.catalog.tableExists(f"{database}.{key_map_table}"):
+        key_map_df = spark.table(f"{database}.{key_map_table}").where(F.col("entity") == table).select("business_key", "key")
+        max_key = max(max_key, key_map_df.agg(F.max("key")).collect()[0][0] or 0)
+    else:
+        key_map_df = spark.createDataFrame([], "business_key string, key long")
+
+    new_keys_df = (df.select("__business_key").distinct()
+        .join(key_map_df, F.col("__business_key") == F.col("business_key"), "left_anti")
+        .orderBy("__business_key")) # Deterministic numbering of new keys
+
+    new_keys_df = add_contiguous_key(new_keys_df, max_key + 1, "key").select(F.lit(table).alias("entity"), F.col("__business_key").alias("business_key"), "key")
+    new_keys_df = new_keys_df.withColumn("created_at", F.current_timestamp()).cache()
+
+    if not new_keys_df.isEmpty():
+        new_keys_df.write.format('delta').mode('append').saveAsTable(f"{database}.{key_map_table}")
+        key_map_df = spark.table(f"{database}.{key_map_table}").where(F.col("entity") == table).select("business_key", "key")
+
+    df = (df.join(key_map_df, F.col("__business_key") == F.col("business_key"), "left")
+        .withColumn(keyColumn, F.col("key"))
+        .drop("__business_key", "business_key", "key"))
+
+    new_keys_df.unpersist()
+    return df
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Cleansing Functions**  
+# Cleansing of entities from Landing is done in a single stage. Duplicates are removed on the declared key columns, keeping the latest row by the `order_column` of the metadata, so only the keys are shuffled. Entities flagged with `is_unique` skip deduplication and the shuffle entirely. Nulls are filled by type in one `select` projection, i.e. 0 (zero) for numerics and N/A for strings.
+
+# CELL ********************
+
+def cleanse_dataframe(df: DataFrame, keyColumns: list = [], orderColumn: str = None, isUnique: bool = False) -> DataFrame:
+    """
+    Removing duplicates and filling nulls by type.
+
+    Args:
+        df (pyspark.sql.DataFrame): The DataFrame to cleanse.
+        keyColumns (list): Columns identifying a row. [] removes duplicates over all columns. [] is default
+        orderColumn (str): Column deciding the latest row per key, which is kept. None keeps an arbitrary row per key. None is default
+        isUnique (bool): The rows are already unique, so no duplicates are removed. False is default.
+
+    Returns:
+        pyspark.sql.DataFrame: The cleansed DataFrame.
+    """
+    if isUnique:
+        pass
+    elif keyColumns and orderColumn:
+        latest = Window.partitionBy(*keyColumns).orderBy(F.col(orderColumn).desc_nulls_last())
+        df = df.withColumn("__row_number", F.row_number().over(latest)).where(F.col("__row_number") == 1).drop("__row_number")
+    elif keyColumns:
+        df = df.dropDuplicates(keyColumns)
+    else:
+        df = df.dropDuplicates()
+
+    def fill(field):
+        if isinstance(field.dataType, NumericType):
+            return F.coalesce(F.col(f"`{field.name}`"), F.lit(0).cast(field.dataType)).alias(field.name) # Fill all empty numberics with 0 (zero)
+        if isinstance(field.dataType, StringType):
+            return F.coalesce(F.col(f"`{field.name}`"), F.lit("N/A")).alias(field.name) # Fill all empty strings with N/A
+        return F.col(f"`{field.name}`")
+
+    return df.select(*[fill(field) for field in df.schema.fields])
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Maintenance Functions**  
+# Overwrites and merges leave Delta tables with many small files and a growing history. `plan_table_maintenance` decides from `DESCRIBE DETAIL` and the versions written since the last maintenance in the table history whether a table needs `OPTIMIZE` (with V-Order and optionally Z-Order) or `VACUUM`. Views are not maintained. Tables are maintained concurrently with `run_entities_in_parallel`, and tables not started within the time budget are skipped until the next run.
+
+# CELL ********************
+
+MAINTENANCE_THRESHOLDS = {
+    "min_files": 20,                             # Tables with fewer files are never optimized
+    "min_avg_file_size_bytes": 32 * 1024 * 1024, # Tables with a smaller average file size are optimized
+    "max_versions": 20,                          # Tables with more versions since the last OPTIMIZE or VACUUM are vacuumed
+    "retention_hours": 168                       # Retention of VACUUM. Below 168 hours requires spark.databricks.delta.retentionDurationCheck.enabled = false
+}
+
+def get_table_statistics(database: str, table: str) -> dict:
+    """
+    Getting file and history statistics of a Delta table.
+
+    Args:
+        database (str): Database name.
+        table (str): Table name.
+
+    Returns:
+        dict: num_files, size_in_bytes, avg_file_size_bytes, versions and versions_since_maintenance of the table.
+    """
+    detail = spark.sql(f"DESCRIBE DETAIL {database}.{table}").select("numFiles", "sizeInBytes").collect()[0]
+    history = (spark.sql(f"DESCRIBE HISTORY {database}.{table}")
+        .agg(
+            F.max("version").alias("latest_version"),
+            F.max(F.when(F.col("operation").isin("OPTIMIZE", "VACUUM START", "VACUUM END"), F.col("version"))).alias("maintenance_version"))
+        .collect()[0])
+    latest_version, maintenance_version = history["latest_version"], history["maintenance_version"]
+
+    return {
+        "num_files": detail["numFiles"],
+        "size_in_bytes": detail["sizeInBytes"],
+        "avg_file_size_bytes": detail["sizeInBytes"] / detail["numFiles"] if detail["numFiles"] else 0,
+        "versions": latest_version + 1,
+        "versions_since_maintenance": latest_version - maintenance_version if maintenance_version is not None else latest_version + 1
+    }
+
+def plan_table_maintenance(statistics: dict, thresholds: dict = MAINTENANCE_THRESHOLDS) -> list:
+    """
+    Deciding which maintenance operations a table needs.
+
+    Args:
+        statistics (dict): Statistics of the table. See get_table_statistics.
+        thresholds (dict): Thresholds deciding the operations. MAINTENANCE_THRESHOLDS is default.
+
+    Returns:
+        list: The operations to run in order, i.e. "OPTIMIZE" and/or "VACUUM". Empty if the table needs no maintenance.
+    """
+    operations = []
+
+    if statistics["num_files"] >= thresholds["min_files"] and statistics["avg_file_size_bytes"] < thresholds["min_avg_file_size_bytes"]:
+        operations.append("OPTIMIZE")
+
+    # Optimizing leaves the compacted files behind, so they are vacuumed as well
+    if operations or statistics["versions_since_maintenance"] > thresholds["max_versions"]:
+        operations.append("VACUUM")
+
+    return operations
+
+def maintain_table(database: str, table: str, zorderColumns: list = [], thresholds: dict = MAINTENANCE_THRESHOLDS) -> list:
+    """
+    Running the maintenance operations a table needs. See plan_table_maintenance.
+
+    Args:
+        database (str): Database name.
+        table (str): Table name.
+        zorderColumns (list): Columns to Z-Order by when optimizing. [] is default
+        thresholds (dict): Thresholds deciding the operations. MAINTENANCE_THRESHOLDS is default.
+
+    Returns:
+        list: The operations run.
+    """
+    statistics = get_table_statistics(database, table)
+    operations = plan_table_maintenance(statistics, thresholds)
+
+    print(f"{database}.{table}: {statistics['num_files']} files, {statistics['avg_file_size_bytes'] / 1024 / 1024:.1f} MB on average, {statistics['versions_since_maintenance']} versions since maintenance → {', '.join(operations) or 'no maintenance'}")
+
+    for operation in operations:
+        if operation == "OPTIMIZE":
+            zorder = f" ZORDER BY ({', '.join(f'`{column}`' for column in zorderColumns)})" if zorderColumns else ""
+            spark.sql(f"OPTIMIZE {database}.{table}{zorder} VORDER")
+        elif operation == "VACUUM":
+            spark.sql(f"VACUUM {database}.{table} RETAIN {thresholds['retention_hours']} HOURS")
+
+    return operations
+
+def run_table_maintenance(databases: list, zorderColumns: dict = {}, time_budget_seconds: int = 3600, max_parallelism: int = 4, thresholds: dict = MAINTENANCE_THRESHOLDS) -> list:
+    """
+    Maintaining all Delta tables of the databases concurrently. Tables not started within the time budget are skipped.
+
+    Args:
+        databases (list): Database names, e.g. ["Base", "Curated"].
+        zorderColumns (dict): Columns to Z-Order by keyed by database.table, e.g. {"Curated.Transactions": ["DWID_Date"]}. {} is default
+        time_budget_seconds (int): Seconds from the start in which tables may be started. 3600 is default.
+        max_parallelism (int): Number of tables maintained at the same time. 4 is default.
+        thresholds (dict): Thresholds deciding the operations. MAINTENANCE_THRESHOLDS is default.
+
+    Returns:
+        list: The run report. See run_entities_in_parallel.
+    """
+    deadline = time.time() + time_budget_seconds
+    zorderColumns = {entity.lower(): columns for entity, columns in zorderColumns.items()} # The catalog may list table names in lower case
+
+    tables = {
+        f"{database}.{table.name}": {"database": database, "table": table.name}
+        for database in databases
+        for table in spark.catalog.listTables(database)
+        if table.tableType in ("MANAGED", "EXTERNAL") # Views, such as run_log_summary, have no files to maintain
+    }
+
+    def _maintain(entity: str, meta_entity: dict):
+        if time.time() > deadline:
+            print(f"  - Time budget exceeded. Skipping {entity}!")
+            return "Skipped"
+        operations = maintain_table(meta_entity["database"], meta_entity["table"], zorderColumns.get(entity.lower(), []), thresholds)
+        return "Succeeded" if operations else "Skipped"
+
+    return run_entities_in_parallel(tables, _maintain, max_parallelism, "maintenance")
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Run Log Functions**  
+# Writers return the Delta operation metrics of their write, e.g. rows and files written and the execution time. `log_entity_run` appends them together with the stage timings of an entity to the `run_log` table of the destination lakehouse, keyed by run id, notebook and entity. All notebooks of a DAG share the run id of the root notebook.  
+# Spark evaluates lazily, so most of the work of reading and transforming is timed by the write stage. The `run_log_summary` view shows the latest run of every entity compared with its average, slowest first.
+
+# CELL ********************
+
+RUN_LOG_TABLE = 'run_log'
+
+RUN_LOG_SCHEMA = "run_id string, notebook string, entity string, operation string, version long, num_output_rows long, num_files long, num_output_bytes long, execution_time_ms long, stage_timings map<string,double>, duration_seconds double, logged_at timestamp"
+
+_session_run_id = None
+_session_run_id_lock = threading.Lock()
+
+def _get_session_run_id() -> str:
+    # Run id used when the notebook context has none, generated once per session so all entities of a run share it
+    global _session_run_id
+    with _session_run_id_lock:
+        if _session_run_id is None:
+            _session_run_id = str(uuid.uuid4())
+        return _session_run_id
+
+def _get_run_context() -> tuple:
+    try:
+        context = notebookutils.runtime.context
+        return context.get("rootActivityId") or context.get("activityId") or _get_session_run_id(), context.get("currentNotebookName") or "unknown"
+    except Exception:
+        return _get_session_run_id(), "unknown"
+
+def get_last_operation_metrics(database: str, table: str) -> dict:
+    """
+    Getting the operation metrics of the latest Delta operation on a table.
+
+    Args:
+        database (str): Database name.
+        table (str): Table name.
+
+    Returns:
+        dict: operation, version, num_output_rows, num_files, num_output_bytes and execution_time_ms. Metrics not reported by the operation are None.
+    """
+    history = spark.sql(f"DESCRIBE HISTORY {database}.{table} LIMIT 1").select("version", "operation", "operationMetrics").collect()[0]
+    metrics = history["operationMetrics"] or {}
+
+    def metric(*names):
+        values = [int(metrics[name]) for name in names if metrics.get(name) is not None]
+        return sum(values) if values else None
+
+    return {
+        "operation": history["operation"],
+        "version": history["version"],
+        "num_output_rows": metric("numOutputRows") if "numOutputRows" in metrics else metric("numTargetRowsInserted", "numTargetRowsUpdated"),
+        "num_files": metric("numFiles") if "numFiles" in metrics else metric("numTargetFilesAdded"),
+        "num_output_bytes": metric("numOutputBytes") if "numOutputBytes" in metrics else metric("numTargetBytesAdded"),
+        "execution_time_ms": metric("executionTimeMs")
+    }
+
+@contextmanager
+def timed_stage(stage_timings: dict, stage: str):
+    """
+    Timing a stage of processing an entity, e.g. read or write.
+
+    Args:
+        stage_timings (dict): The timings of the entity. The duration of the stage in seconds is added to it.
+        stage (str): Stage name.
+    """
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        stage_timings[stage] = round(time.time() - start_time, 3)
+
+def log_entity_run(database: str, entity: str, metrics: dict, stage_timings: dict = {}, run_id: str = None, notebook: str = None, run_log_table: str = RUN_LOG_TABLE) -> None:
+    """
+    Appending the statistics of processing an entity to the run log.
+
+    Args:
+        database (str): Database holding the run log.
+        entity (str): Entity name, i.e. the destination table.
+        metrics (dict): Delta operation metrics of the write. See get_last_operation_metrics.
+        stage_timings (dict): Seconds per stage. See timed_stage. {} is default
+        run_id (str): Run id. None uses the run id of the root notebook.
+        notebook (str): Notebook name. None uses the name of the current notebook.
+        run_log_table (str): Run log table name. RUN_LOG_TABLE is default.
+
+    Returns:
+        None
+    """
+    metrics = metrics or {}
+    context_run_id, context_notebook = _get_run_context() # Resolved per call, as an imported library is shared by the notebooks of a session
+    row = (
+        run_id or context_run_id, notebook or context_notebook, entity,
+        metrics.get("operation"), metrics.get("version"), metrics.get("num_output_rows"), metrics.get("num_files"), metrics.get("num_output_bytes"), metrics.get("execution_time_ms"),
+        stage_timings, round(sum(stage_timings.values()), 3), datetime.now(timezone.utc)
+    )
+    spark.createDataFrame([row], RUN_LOG_SCHEMA).write.format('delta').mode('append').saveAsTable(f"{database}.{run_log_table}")
+
+def create_run_log_summary_view(database: str, run_log_table: str = RUN_LOG_TABLE, view_name: str = "run_log_summary") -> None:
+    """
+    Creating a view of the latest run of every entity compared with its average over all runs, slowest first.
+
+    Args:
+        database (str): Database holding the run log.
+        run_log_table (str): Run log table name. RUN_LOG_TABLE is default.
+        view_name (str): View name. "run_log_summary" is default.
+
+    Returns:
+        None
+    """
+    spark.sql(f"""
+        CREATE OR REPLACE VIEW {database}.{view_name} AS
+        SELECT
+            notebook,
+            entity,
+            run_id AS last_run_id,
+            logged_at AS last_logged_at,
+            duration_seconds AS last_duration_seconds,
+            num_output_rows AS last_num_output_rows,
+            avg_duration_seconds,
+            max_duration_seconds,
+            runs,
+            ROUND(duration_seconds / NULLIF(avg_duration_seconds, 0), 2) AS duration_trend
+        FROM (
+            SELECT
+                *,
+                ROW_NUMBER() OVER (PARTITION BY notebook, entity ORDER BY logged_at DESC) AS run_number,
+                AVG(duration_seconds) OVER (PARTITION BY notebook, entity) AS avg_duration_seconds,
+                MAX(duration_seconds) OVER (PARTITION BY notebook, entity) AS max_duration_seconds,
+                COUNT(*) OVER (PARTITION BY notebook, entity) AS runs
+            FROM {database}.{run_log_table}
+        )
+        WHERE run_number = 1
+        ORDER BY last_duration_seconds DESC
+    """)
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **DAG Validation Functions**  
+# Pure Python functions for the DAG format of `notebookutils.notebook.runMultiple`. The cell has no dependency on Spark or notebookutils, so the CI pipeline runs it with `solution_validate_dags.py` to catch unknown dependencies, cycles and duplicate names before anything is deployed.
+
+# CELL ********************
+
+def validate_dag(DAG: dict, known_notebooks: list = None) -> list:
+    """
+    Validating a runMultiple DAG without a Spark session.
+
+    Args:
+        DAG (dict): The DAG with a list of activities.
+        known_notebooks (list): Names of existing notebooks the activity paths are checked against. None skips the check.
+
+    Returns:
+        list: Error messages. Empty if the DAG is valid.
+    """
+    errors = []
+    activities = DAG.get("activities")
+
+    if not isinstance(activities, list) or not activities:
+        return ["DAG must have a non-empty list of activities"]
+
+    if "concurrency" in DAG and (not isinstance(DAG["concurrency"], int) or DAG["concurrency"] < 1):
+        errors.append(f"Concurrency must be a positive integer, found: {DAG['concurrency']}")
+
+    names = [activity.get("name") for activity in activities]
+    for name in sorted({name for name in names if names.count(name) > 1}):
+        errors.append(f"Activity name {name} is not unique")
+
+    for activity in activities:
+        name = activity.get("name")
+        if not name or not activity.get("path"):
+            errors.append(f"Activity {name or '<unnamed>'} must have a name and a path")
+        if known_notebooks is not None and activity.get("path") and activity["path"] not in known_notebooks:
+            errors.append(f"Activity {name} refers to unknown notebook {activity['path']}")
+        for dependency in activity.get("dependencies", []):
+            if dependency == name:
+                errors.append(f"Activity {name} depends on itself")
+            elif dependency not in names:
+                errors.append(f"Activity {name} depends on unknown activity {dependency}")
+
+    if not errors:
+        try:
+            order_activities(activities, {})
+        except ValueError as e:
+            errors.append(str(e))
+
+    return errors
+
+def get_critical_path_lengths(activities: list, durations: dict, default_duration: float = 60) -> dict:
+    """
+    Calculating the critical path length of every activity, i.e. its own duration plus the longest chain of activities depending on it.
+
+    Args:
+        activities (list): Activities of a runMultiple DAG.
+        durations (dict): Expected seconds per activity name.
+        default_duration (float): Seconds used for activities without a duration. 60 is default.
+
+    Returns:
+        dict: Critical path length in seconds per activity name.
+    """
+    dependents = {activity["name"]: [] for activity in activities}
+    for activity in activities:
+        for dependency in activity.get("dependencies", []):
+            if dependency in dependents:
+                dependents[dependency].append(activity["name"])
+
+    lengths = {}
+    def _length(name: str, visiting: frozenset = frozenset()) -> float:
+        if name in visiting:
+            raise ValueError(f"Circular dependency involving {name}")
+        if name not in lengths:
+            lengths[name] = durations.get(name, default_duration) + max((_length(dependent, visiting | {name}) for dependent in dependents[name]), default=0)
+        return lengths[name]
+
+    for name in dependents:
+        _length(name)
+    return lengths
+
+def order_activities(activities: list, critical_path_lengths: dict) -> list:
+    """
+    Ordering activities so every activity comes after its dependencies, and ready activities with the longest critical path come first.
+
+    Args:
+        activities (list): Activities of a runMultiple DAG.
+        critical_path_lengths (dict): Critical path length per activity name. See get_critical_path_lengths.
+
+    Returns:
+        list: The ordered activities.
+    """
+    by_name = {activity["name"]: activity for activity in activities}
+    remaining = {name: {dependency for dependency in activity.get("dependencies", []) if dependency in by_name} for name, activity in by_name.items()}
+
+    ordered = []
+    while remaining:
+        ready = [name for name, dependencies in remaining.items() if not dependencies]
+        if not ready:
+            raise ValueError(f"Circular dependency between {', '.join(sorted(remaining))}")
+        name = max(ready, key=lambda name: critical_path_lengths.get(name, 0))
+        ordered.append(by_name[name])
+        del remaining[name]
+        for dependencies in remaining.values():
+            dependencies.discard(name)
+    return ordered
+
+def get_critical_path(DAG: dict, durations: dict = {}, default_duration: float = 60) -> tuple:
+    """
+    Finding the critical path of a DAG, i.e. the chain of activities deciding the total duration when concurrency is unlimited.
+
+    Args:
+        DAG (dict): The DAG with a list of activities.
+        durations (dict): Expected seconds per activity name, e.g. from historical runs. {} is default
+        default_duration (float): Seconds used for activities without a duration. 60 is default.
+
+    Returns:
+        tuple: The length of the critical path in seconds and the list of activity names on it.
+    """
+    activities = DAG["activities"]
+    lengths = get_critical_path_lengths(activities, durations, default_duration)
+    dependents = {activity["name"]: [other["name"] for other in activities if activity["name"] in other.get("dependencies", [])] for activity in activities}
+
+    name = max((activity["name"] for activity in activities if not activity.get("dependencies")), key=lambda name: lengths[name])
+    path = [name]
+    while dependents[name]:
+        name = max(dependents[name], key=lambda dependent: lengths[dependent])
+        path.append(name)
+
+    return lengths[path[0]], path
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Metadata Snapshot Functions**  
+# Every notebook reading metadata would otherwise query the SQL database shortcut tables again. `create_metadata_snapshot` is called once by the orchestrator and saves the metadata tables as JSON under `Files/runs/{run_id}` of the default lakehouse. Notebooks of the same run read the snapshot instead through `get_metadata_rows`. The Delta version of every source table is stored with the snapshot and compared on read, so metadata changed during the run is detected and queried again.
+
+# CELL ********************
+
+METADATA_TABLES = ['Landing.landing_to_base', 'Landing.notebook_orchestrator', 'Landing.fact_lookup', 'Landing.data_quality_rules']
+METADATA_SNAPSHOT_FOLDER = 'Files/runs'
+
+_metadata_snapshots = {} # run_id -> snapshot, so a notebook reads its snapshot file once
+
+def _get_table_version(table: str) -> int:
+    return spark.sql(f"DESCRIBE HISTORY {table} LIMIT 1").select("version").collect()[0][0]
+
+def _get_metadata_snapshot_path(run_id: str) -> str:
+    return f"{METADATA_SNAPSHOT_FOLDER}/{run_id}/metadata_snapshot.json"
+
+def create_metadata_snapshot(run_id: str = None, tables: list = METADATA_TABLES) -> str:
+    """
+    Saving the rows and Delta versions of the metadata tables as a snapshot for the notebooks of a run.
+
+    Args:
+        run_id (str): Run id. None uses the run id of the root notebook.
+        tables (list): Metadata tables to include. METADATA_TABLES is default.
+
+    Returns:
+        str: The path of the snapshot file.
+    """
+    run_id = run_id or _get_run_context()[0]
+    snapshot = {
+        "run_id": run_id,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "tables": {
+            table: {"version": _get_table_version(table), "rows": [row.asDict() for row in spark.table(table).collect()]}
+            for table in tables
+        }
+    }
+
+    path = _get_metadata_snapshot_path(run_id)
+    notebookutils.fs.put(path, json.dumps(snapshot, default=str), True)
+    _metadata_snapshots[run_id] = snapshot
+
+    print(f"Metadata snapshot of {', '.join(tables)} saved to {path}")
+    return path
+
+def load_metadata_snapshot(run_id: str = None) -> dict:
+    """
+    Loading the metadata snapshot of a run.
+
+    Args:
+        run_id (str): Run id. None uses the run id of the root notebook.
+
+    Returns:
+        dict: The snapshot, or None if the run has no snapshot.
+    """
+    run_id = run_id or _get_run_context()[0]
+
+    if run_id not in _metadata_snapshots:
+        path = _get_metadata_snapshot_path(run_id)
+        if not notebookutils.fs.exists(path):
+            return None
+        _metadata_snapshots[run_id] = json.loads(notebookutils.fs.head(path, 100 * 1024 * 1024))
+
+    return _metadata_snapshots[run_id]
+
+def get_metadata_rows(table: str, run_id: str = None, check_version: bool = True) -> list:
+    """
+    Getting the rows of a metadata table from the snapshot of the run, or from the table if the run has no snapshot or the snapshot is stale.
+
+    Args:
+        table (str): Metadata table, e.g. "Landing.landing_to_base".
+        run_id (str): Run id. None uses the run id of the root notebook.
+        check_version (bool): Compare the Delta version of the table with the snapshot. True is default.
+
+    Returns:
+        list: One dict per row.
+    """
+    snapshot = load_metadata_snapshot(run_id)
+    snapshot_table = (snapshot or {}).get("tables", {}).get(table)
+
+    if snapshot_table is not None:
+        if not check_version or _get_table_version(table) == snapshot_table["version"]:
+            return snapshot_table["rows"]
+        print(f"Metadata snapshot of {table} is stale. Reading the table instead!")
+
+    return [row.asDict() for row in spark.table(table).collect()] # Optional columns such as weight may not exist in older metadata databases
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Fact Functions**  
+# Dimension lookups of a fact are declared in the `fact_lookup` metadata: the business key columns of the fact, the matching columns of the dimension and the surrogate key to look up. Dimensions smaller than the broadcast threshold are broadcast, so the fact is joined without being shuffled. Late-arriving facts, i.e. business keys not yet in the dimension, get the unknown member key -1, and the dimension gets an unknown member row.  
+# For SCD2 dimensions, a fact row gets the version of the member valid at its date, so late-arriving rows and reloads of past days don't get today's version.
+
+# CELL ********************
+
+UNKNOWN_MEMBER_KEY = -1
+BROADCAST_THRESHOLD_BYTES = 64 * 1024 * 1024
+
+def get_fact_lookups(fact_name: str) -> list:
+    """
+    Getting the dimension lookups of a fact from the fact_lookup metadata.
+
+    Args:
+        fact_name (str): Fact name, e.g. "Transactions".
+
+    Returns:
+        list: One dict per lookup with dimension, fact_columns, dimension_columns and surrogate_key.
+    """
+    return [
+        {
+            "dimension": row["dimension_name"],
+            "fact_columns": _parse_column_list(row["fact_columns"], "Fact columns"),
+            "dimension_columns": _parse_column_list(row["dimension_columns"], "Dimension columns"),
+            "surrogate_key": row["surrogate_key"]
+        }
+        for row in get_metadata_rows("Landing.fact_lookup")
+        if row["fact_name"] == fact_name and row.get("is_enabled", True)
+    ]
+
+def ensure_unknown_member(database: str, dimension: str, surrogateKey: str) -> None:
+    """
+    Adding the unknown member to a dimension if missing. Strings are "Unknown", and other attributes are null.
+
+    Args:
+        database (str): Database name.
+        dimension (str): Dimension table name.
+        surrogateKey (str): Surrogate key column of the dimension.
+
+    Returns:
+        None
+    """
+    dim_df = spark.table(f"{database}.{dimension}")
+    if not dim_df.where(F.col(surrogateKey) == UNKNOWN_MEMBER_KEY).isEmpty():
+        return
+
+    def value(field):
+        if field.name == surrogateKey:
+            return F.lit(UNKNOWN_MEMBER_KEY).cast(field.dataType).alias(field.name)
+        if field.name == "IsCurrent":
+            return F.lit(True).alias(field.name)
+        if isinstance(field.dataType, StringType):
+            return F.lit("Unknown").alias(field.name)
+        return F.lit(None).cast(field.dataType).alias(field.name)
+
+    print(f"Adding unknown member to {database}.{dimension}")
+    spark.range(1).select(*[value(field) for field in dim_df.schema.fields]).write.format('delta').mode('append').saveAsTable(f"{database}.{dimension}")
+
+def lookup_dimension_keys(df: DataFrame, lookups: list, database: str, broadcastThreshold: int = BROADCAST_THRESHOLD_BYTES, dateKey: str = None) -> DataFrame:
+    """
+    Replacing business keys of a fact with the surrogate keys of its dimensions.
+    With a date key, the version of an SCD2 dimension valid at the date of the fact row is used, i.e. ValidFrom <= date < ValidTo.
+    The first version of a member is valid from the beginning, so facts dated before the member was loaded still find it. Without, current versions are used.
+
+    Args:
+        df (pyspark.sql.DataFrame): The fact DataFrame holding the business keys.
+        lookups (list): Dimension lookups. See get_fact_lookups.
+        database (str): Database holding the dimensions.
+        broadcastThreshold (int): Dimensions smaller than this number of bytes are broadcast. BROADCAST_THRESHOLD_BYTES is default.
+        dateKey (str): Date key column of the fact as yyyyMMdd, e.g. "DWID_Date". None is default
+
+    Returns:
+        pyspark.sql.DataFrame: The fact with a surrogate key per lookup instead of the business keys. Unmatched keys get UNKNOWN_MEMBER_KEY.
+    """
+    for lookup in lookups:
+        dimension, surrogate_key = lookup["dimension"], lookup["surrogate_key"]
+        ensure_unknown_member(database, dimension, surrogate_key)
+
+        dim_df = spark.table(f"{database}.{dimension}")
+        is_versioned = dateKey is not None and {"ValidFrom", "ValidTo"} <= set(dim_df.columns)
+        if "IsCurrent" in dim_df.columns and not is_versioned:
+            dim_df = dim_df.where(F.col("IsCurrent"))
+
+        lookup_columns = [f"__lookup_{index}" for index in range(len(lookup["fact_columns"]))]
+        validity_columns = []
+        if is_versioned:
+            first_version = F.col("ValidFrom") == F.min("ValidFrom").over(Window.partitionBy(*lookup["dimension_columns"]))
+            validity_columns = [F.when(~first_version, F.col("ValidFrom")).alias("__valid_from"), F.col("ValidTo").alias("__valid_to")]
+        dim_df = dim_df.select(*[F.col(column).alias(lookup_column) for column, lookup_column in zip(lookup["dimension_columns"], lookup_columns)], F.col(surrogate_key).alias("__surrogate_key"), *validity_columns)
+
+        size_in_bytes = spark.sql(f"DESCRIBE DETAIL {database}.{dimension}").select("sizeInBytes").collect()[0][0]
+        if size_in_bytes < broadcastThreshold:
+            dim_df = F.broadcast(dim_df)
+
+        condition = [F.col(fact_column) == F.col(lookup_column) for fact_column, lookup_column in zip(lookup["fact_columns"], lookup_columns)]
+        if is_versioned:
+            valid_at = F.to_timestamp(F.col(dateKey).cast("string"), "yyyyMMdd")
+            condition.append((F.col("__valid_from").isNull() | (F.col("__valid_from") <= valid_at)) & (F.col("__valid_to").isNull() | (valid_at < F.col("__valid_to"))))
+
+        df = (df.drop(surrogate_key)
+            .join(dim_df, condition, "left")
+            .withColumn(surrogate_key, F.coalesce(F.col("__surrogate_key"), F.lit(UNKNOWN_MEMBER_KEY)))
+            .drop("__surrogate_key", "__valid_from", "__valid_to", *lookup_columns, *lookup["fact_columns"]))
+
+    return df
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Streaming Functions**  
+# Entities with `load_mode` = `streaming` in the `landing_to_base` metadata are read as a file stream. The checkpoint under `Files/checkpoints/{entity}` of the destination lakehouse keeps track of the files processed, so the ledger of incremental entities is not used.  
+#   
+# Each micro-batch is cleansed and written by the same functions as batch loads through `foreachBatch`. With `trigger(availableNow=True)`, a scheduled run catches up on all new files and stops, while a processing time keeps the stream running for near-real-time loads.
+
+# CELL ********************
+
+CHECKPOINT_FOLDER = 'Files/checkpoints'
+
+def _combine_operation_metrics(metrics_list: list) -> dict:
+    # Metrics of a stream are the sums over its micro-batches. Operation and version are those of the latest batch
+    metrics_list = [metrics for metrics in metrics_list if metrics]
+    if not metrics_list:
+        return None
+
+    def total(name):
+        values = [metrics[name] for metrics in metrics_list if metrics.get(name) is not None]
+        return sum(values) if values else None
+
+    return {
+        "operation": metrics_list[-1]["operation"],
+        "version": metrics_list[-1]["version"],
+        "num_output_rows": total("num_output_rows"),
+        "num_files": total("num_files"),
+        "num_output_bytes": total("num_output_bytes"),
+        "execution_time_ms": total("execution_time_ms")
+    }
+
+def stream_to_delta(entity: str, meta_entity: dict, database: str, checkpointFolder: str = CHECKPOINT_FOLDER, processingTime: str = None, maxFilesPerTrigger: int = None) -> dict:
+    """
+    Handling streaming of new Landing files to Delta. Micro-batches are checked by apply_data_quality_rules, cleansed by cleanse_dataframe and written by write_entity.
+    Appends and overwrites are idempotent by batch id, so a batch replayed from the checkpoint is not written twice.
+
+    Args:
+        entity (str): Entity name, i.e. the destination table.
+        meta_entity (dict): Metadata of the entity. See _process_meta_data.
+        database (str): Database name.
+        checkpointFolder (str): Folder holding a checkpoint per entity. CHECKPOINT_FOLDER is default.
+        processingTime (str): Trigger interval of a continuously running stream, e.g. "1 minute". None processes all new files and stops. None is default
+        maxFilesPerTrigger (int): Max files per micro-batch. None is all new files in one batch. None is default
+
+    Returns:
+        dict: Delta operation metrics summed over the micro-batches. None if there were no new files.
+    """
+    batch_metrics = []
+
+    rules = get_data_quality_rules(entity)
+
+    def process_batch(batch_df: DataFrame, batch_id: int) -> None:
+        batch_df, dq_check = apply_data_quality_rules(batch_df, entity, rules, ruleTypes = DQ_PRE_CLEANSE_RULE_TYPES)
+        batch_df = cleanse_dataframe(batch_df, meta_entity['key_columns'], meta_entity['order_column'], meta_entity['is_unique'])
+        batch_df, dq_unique_check = apply_data_quality_rules(batch_df, entity, rules, ruleTypes = DQ_POST_CLEANSE_RULE_TYPES)
+        # A batch replayed after a failure before the checkpoint commit is skipped by Delta, like the incremental file batches
+        batch_metrics.append(write_entity(batch_df, database, entity, meta_entity, {"txnAppId": f"{database}_{entity}_stream", "txnVersion": batch_id}))
+        record_data_quality_results(dq_check, database)
+        record_data_quality_results(dq_unique_check, database)
+
+    writer = (meta_entity['stream_reader_function'](maxFilesPerTrigger).writeStream
+        .queryName(f"{database}_{entity}")
+        .foreachBatch(process_batch)
+        .option("checkpointLocation", f"{checkpointFolder}/{entity}"))
+
+    writer = writer.trigger(processingTime=processingTime) if processingTime else writer.trigger(availableNow=True)
+
+    query = writer.start()
+    query.awaitTermination()
+
+    return _combine_operation_metrics(batch_metrics)
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Data Quality Functions**  
+# Data quality rules are declared per entity in the `data_quality_rules` metadata. A rule has a `rule_type` of `not_null`, `range`, `regex`, `referential` or `unique`, a column, optional JSON `rule_parameters`, e.g. `{"min": 1}`, `{"pattern": "^[0-9]+$"}` or `{"table": "Base.sales_customers", "column": "CustomerID"}`, and an `action`. Rows failing a `quarantine` rule are kept out of the load, while `warn` rules are only counted.  
+#   
+# Rules are evaluated before cleansing fills nulls, except `unique` rules, which are evaluated after cleansing has resolved duplicates by keeping the latest row per key. Entities without rules are loaded without any extra pass.  
+# `apply_data_quality_rules` adds a failure flag per rule as a column, so all rules of an entity are evaluated together, and persists the flagged rows. The counts per rule are computed by a single aggregate, which also fills the cache, so the joins of `referential` rules and the windows of `unique` rules run once, and neither the load nor the quarantine evaluates the source again. After the write, `record_data_quality_results` appends the counts to `dq_results`, writes rows failing quarantine rules to `dq_quarantine` as JSON, and releases the cache.
+
+# CELL ********************
+
+DQ_RESULTS_TABLE = 'dq_results'
+DQ_QUARANTINE_TABLE = 'dq_quarantine'
+DQ_RULE_TYPES = ('not_null', 'range', 'regex', 'referential', 'unique')
+DQ_PRE_CLEANSE_RULE_TYPES = ('not_null', 'range', 'regex', 'referential') # Before nulls are filled by cleansing
+DQ_POST_CLEANSE_RULE_TYPES = ('unique',) # After duplicates are resolved by cleansing, so only keys still duplicated fail
+DQ_RESULTS_SCHEMA = "run_id string, entity string, rule_name string, rule_type string, column_name string, action string, failed_rows long, total_rows long, logged_at timestamp"
+DQ_QUARANTINE_SCHEMA = "run_id string, entity string, failed_rules array<string>, row string, quarantined_at timestamp"
+
+def get_data_quality_rules(entity: str) -> list:
+    """
+    Getting the data quality rules of an entity from the data_quality_rules metadata.
+
+    Args:
+        entity (str): Entity name, i.e. the destination table.
+
+    Returns:
+        list: One dict per rule with name, type, column, parameters and action.
+    """
+    rules = []
+    for row in get_metadata_rows("Landing.data_quality_rules"):
+        if row["entity"] != entity or not row.get("is_enabled", True):
+            continue
+
+        rule_type = row["rule_type"].lower()
+        action = (row.get("action") or "quarantine").lower()
+        if rule_type not in DQ_RULE_TYPES:
+            raise ValueError(f"Rule type must be one of {', '.join(DQ_RULE_TYPES)}, found: {rule_type} ({row['rule_name']})")
+        if action not in ("quarantine", "warn"):
+            raise ValueError(f"Action must be either quarantine or warn, found: {action} ({row['rule_name']})")
+
+        rules.append({
+            "name": row["rule_name"],
+            "type": rule_type,
+            "column": row["column_name"],
+            "parameters": json.loads(row["rule_parameters"]) if row.get("rule_parameters") else {},
+            "action": action
+        })
+    return rules
+
+def _get_rule_failure(df: DataFrame, rule: dict, index: int, broadcastThreshold: int) -> tuple:
+    # Returns the DataFrame, with the reference keys joined for referential rules, and a condition true for failing rows
+    column = F.col(f"`{rule['column']}`")
+    parameters = rule["parameters"]
+
+    if rule["type"] == "not_null":
+        return df, column.isNull()
+
+    if rule["type"] == "range":
+        value = column.cast("double")
+        failure = column.isNotNull() & value.isNull() # Not a number
+        if parameters.get("min") is not None:
+            failure = failure | (value < parameters["min"])
+        if parameters.get("max") is not None:
+            failure = failure | (value > parameters["max"])
+        return df, failure
+
+    if rule["type"] == "regex":
+        return df, column.isNotNull() & ~column.cast("string").rlike(parameters["pattern"])
+
+    if rule["type"] == "referential":
+        if not spark.catalog.tableExists(parameters["table"]):
+            print(f"  - Reference table {parameters['table']} of {rule['name']} does not exist. Skipping rule!")
+            return df, F.lit(False)
+        reference_column = f"__dq_reference_{index}"
+        reference_df = spark.table(parameters["table"]).select(F.col(f"`{parameters['column']}`").alias(reference_column)).distinct()
+        size_in_bytes = _estimate_size_in_bytes(reference_df)
+        if size_in_bytes is not None and size_in_bytes < broadcastThreshold:
+            reference_df = F.broadcast(reference_df)
+        df = df.join(reference_df, column == F.col(reference_column), "left")
+        return df, column.isNotNull() & F.col(reference_column).isNull()
+
+    # unique
+    return df, F.count(F.lit(1)).over(Window.partitionBy(column)) > 1
+
+def apply_data_quality_rules(df: DataFrame, entity: str, rules: list = None, broadcastThreshold: int = BROADCAST_THRESHOLD_BYTES, ruleTypes: tuple = DQ_RULE_TYPES) -> tuple:
+    """
+    Evaluating the data quality rules of an entity. Rows failing a quarantine rule are removed from the DataFrame returned.
+    The flagged rows are persisted and counted per rule by one aggregate, so the DataFrame returned is read from the cache.
+    record_data_quality_results must be called after the write, as it releases the cache. Without rules, df is returned as is.
+
+    Args:
+        df (pyspark.sql.DataFrame): The DataFrame to check.
+        entity (str): Entity name, i.e. the destination table.
+        rules (list): Rules to evaluate. None reads the rules of the entity. See get_data_quality_rules. None is default
+        broadcastThreshold (int): Reference tables smaller than this number of bytes are broadcast. BROADCAST_THRESHOLD_BYTES is default.
+        ruleTypes (tuple): Only rules of these types are evaluated, e.g. DQ_PRE_CLEANSE_RULE_TYPES. DQ_RULE_TYPES is default.
+
+    Returns:
+        tuple: The DataFrame of rows passing the quarantine rules, and the check to pass to record_data_quality_results. The check is None without rules.
+    """
+    rules = get_data_quality_rules(entity) if rules is None else rules
+    rules = [rule for rule in rules if rule["type"] in ruleTypes]
+    if not rules:
+        return df, None
+
+    columns = df.columns
+    flags = []
+    for index, rule in enumerate(rules):
+        df, failure = _get_rule_failure(df, rule, index, broadcastThreshold)
+        flags.append(f"__dq_{index}")
+        df = df.withColumn(flags[-1], F.coalesce(failure, F.lit(False)))
+
+    quarantine_flags = [F.col(flag) for flag, rule in zip(flags, rules) if rule["action"] == "quarantine"]
+    quarantined = quarantine_flags[0] if quarantine_flags else F.lit(False)
+    for flag in quarantine_flags[1:]:
+        quarantined = quarantined | flag
+    flagged_df = df.withColumn("__dq_quarantined", quarantined).persist()
+
+    # Fills the cache, so the load and the quarantine don't evaluate the source and the rules again
+    metrics = flagged_df.agg(F.count(F.lit(1)).alias("total_rows"), *[F.sum(F.col(flag).cast("long")).alias(flag) for flag in flags]).collect()[0].asDict()
+
+    return flagged_df.where(~F.col("__dq_quarantined")).select(*[F.col(f"`{column}`") for column in columns]), {
+        "entity": entity,
+        "rules": rules,
+        "flags": flags,
+        "columns": columns,
+        "metrics": metrics,
+        "flagged_df": flagged_df
+    }
+
+def record_data_quality_results(dq_check: dict, database: str, run_id: str = None, results_table: str = DQ_RESULTS_TABLE, quarantine_table: str = DQ_QUARANTINE_TABLE) -> list:
+    """
+    Appending the counts per rule of a data quality check to the results table, and rows failing quarantine rules to the quarantine table.
+    The flagged rows persisted by apply_data_quality_rules are released.
+
+    Args:
+        dq_check (dict): The check returned by apply_data_quality_rules. None records nothing.
+        database (str): Database holding the results and quarantine tables.
+        run_id (str): Run id. None uses the run id of the root notebook.
+        results_table (str): Results table name. DQ_RESULTS_TABLE is default.
+        quarantine_table (str): Quarantine table name. DQ_QUARANTINE_TABLE is default.
+
+    Returns:
+        list: One dict per rule with rule_name, action and failed_rows.
+    """
+    if not dq_check:
+        return []
+
+    metrics = dq_check["metrics"]
+    run_id = run_id or _get_run_context()[0]
+    total_rows = metrics.get("total_rows") or 0
+    logged_at = datetime.now(timezone.utc)
+
+    rows = [
+        (run_id, dq_check["entity"], rule["name"], rule["type"], rule["column"], rule["action"], metrics.get(flag) or 0, total_rows, logged_at)
+        for flag, rule in zip(dq_check["flags"], dq_check["rules"])
+    ]
+    spark.createDataFrame(rows, DQ_RESULTS_SCHEMA).write.format('delta').mode('append').saveAsTable(f"{database}.{results_table}")
+
+    for row in rows:
+        if row[6]:
+            print(f"  - {dq_check['entity']}: {row[6]} of {total_rows} rows failed {row[2]} ({row[5]})")
+
+    # Read from the cache, and only when rows were quarantined
+    if any(row[6] and row[5] == "quarantine" for row in rows):
+        failed_rules = F.filter(F.array(*[F.when(F.col(flag), F.lit(rule["name"])) for flag, rule in zip(dq_check["flags"], dq_check["rules"])]), lambda rule_name: rule_name.isNotNull())
+        (dq_check["flagged_df"].where(F.col("__dq_quarantined"))
+            .select(
+                F.lit(run_id).alias("run_id"),
+                F.lit(dq_check["entity"]).alias("entity"),
+                failed_rules.alias("failed_rules"),
+                F.to_json(F.struct(*[F.col(f"`{column}`") for column in dq_check["columns"]])).alias("row"),
+                F.lit(logged_at).alias("quarantined_at"))
+            .write.format('delta').mode('append').saveAsTable(f"{database}.{quarantine_table}"))
+
+    dq_check["flagged_df"].unpersist()
+
+    return [{"rule_name": row[2], "action": row[5], "failed_rows": row[6]} for row in rows]
+
+# METADATA ********************
+
+# META {
+# META   "language": "python",
+# META   "language_group": "synapse_pyspark"
+# META }
+
+# MARKDOWN ********************
+
+# #### **Spark Profile Functions**  
+# None of the notebooks need the same Spark configuration: dimensions are small and benefit from few shuffle partitions and broadcast joins, the fact benefits from optimized writes of fewer, larger files, and maintenance only rewrites files. `SPARK_PROFILES` holds a named tuning profile per kind of workload, which a notebook applies to its session with `apply_spark_profile`. The orchestrator passes the profile of each notebook from the `spark_profile` column of the `notebook_orchestrator` metadata.  
+#   
+# `SPARK_PROFILES` is the only place the profiles are declared. The setup script reads it from this notebook (`spark_profiles_notebook` of `infrastructure.json`) to deploy a profile to an environment, so keep its values literals or `str()` of arithmetic.
+
+# CELL ********************
+
+SPARK_PROFILES = {
+    "small-dims": {
+        "spark.sql.shuffle.partitions": "16",
+        "spark.sql.adaptive.enabled": "true",
+        "spark.sql.adaptive.coalescePartitions.enabled": "true",
+        "spark.sql.autoBroadcastJoinThreshold": str(128 * 1024 * 1024),
+        "spark.microsoft.delta.optimizeWrite.enabled": "false", # Small writes don't need the extra shuffle
+        "spark.sql.parquet.vorder.default": "true"
+    },
+    "large-fact": {
+        "spark.sql.shuffle.partitions": "200",
+        "spark.sql.adaptive.enabled": "true",
+        "spark.sql.adaptive.coalescePartitions.enabled": "true",
+        "spark.sql.adaptive.skewJoin.enabled": "true",
+        "spark.sql.autoBroadcastJoinThreshold": str(64 * 1024 * 1024),
+        "spark.microsoft.delta.optimizeWrite.enabled": "true",
+        "spark.sql.parquet.vorder.default": "true"
+    },
+    "maintenance": {
+        "spark.sql.shuffle.partitions": "64",
+        "spark.sql.adaptive.enabled": "true",
+        "spark.sql.adaptive.coalescePartitions.enabled": "true",
+        "spark.sql.autoBroadcastJoinThreshold": "-1", # OPTIMIZE and VACUUM don't join
+        "spark.microsoft.delta.optimizeWrite.enabled": "false", # OPTIMIZE sizes the files itself
+        "spark.sql.parquet.vorder.default": "true"
+    }
+}
+
+def apply_spark_profile(profile: str, profiles: dict = SPARK_PROFILES) -> dict:
+    """
+    Applying a Spark tuning profile to the session of the notebook.
+
+    Args:
+        profile (str): Profile name, e.g. "large-fact". None leaves the session as is.
+        profiles (dict): Spark properties keyed by profile name. SPARK_PROFILES is default.
+
+    Returns:
+        dict: The previous values of the properties set, so the profile can be reverted. None for properties not set before.
+    """
+    if not profile:
+        return {}
+
+    if profile not in profiles:
+        raise ValueError(f"Spark profile must be one of {', '.join(profiles)}, found: {profile}")
 
-    df = df.withColumn("Year", F.year(F.col("Date")))
-    df = df.withColumn("Month", F.month(F.col("Date")))
-    df = df.withColumn("Day", F.dayofmonth(F.col("Date")))
+    previous = {}
+    for key, value in profiles[profile].items():
+        previous[key] = spark.conf.get(key, None)
+        spark.conf.set(key, value)
 
-    write_to_delta_overwrite(df = df, database = database, table = table)
+    print(f"Spark profile {profile} applied")
+    return previous
 
 # METADATA ********************
 
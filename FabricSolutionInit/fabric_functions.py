@@ -244,6 +244,41 @@ def delete_workspace(access_token, workspace_id):
         print(f"Failed to remove workspace ({workspace_id}): {error_details}")
 
 
+def get_definition_parts(item_type, definition):
+    """
+    Returns the definition parts for an item definition.
+
+    Parameters:
+    ----------
+    item_type : str
+        The type of the item, such as "DataPipeline" or "Notebook".
+    definition : str or list
+        Either a base64-encoded string holding the single part of a DataPipeline or Notebook, 
+        or a list of definition parts which is returned as is.
+
+    Returns:
+    -------
+    list
+        The list of definition parts.
+    """
+    if isinstance(definition, list):
+        return definition
+
+    item_path = ""
+    if item_type == "DataPipeline":
+        item_path = "pipeline-content.json"
+    elif item_type == "Notebook":
+        item_path = "notebook-content.py"
+
+    return [
+        {
+            "path": item_path,
+            "payload": definition,
+            "payloadType": "InlineBase64"
+        }
+    ]
+
+
 def create_fabric_item(access_token, workspace_id, item_name, item_type, definition_base64, enable_schema):
     """
     Creates a new item in a specified Microsoft Fabric workspace.
@@ -258,8 +293,9 @@ def create_fabric_item(access_token, workspace_id, item_name, item_type, definit
         The name of the item to be created in the workspace.
     item_type : str
         The type of the item, such as "Lakehouse", "DataPipeline" or "Notebook".
-    definition_base64 : str or None
-        A base64-encoded string containing the item's definition, if required. 
+    definition_base64 : str, list or None
+        A base64-encoded string containing the item's definition, if required, or a list of definition parts
+        (dicts with path, payload and payloadType) for items with multiple parts. 
         If None, the definition is not included in the request.
     enable_schema : bool, optional
         Indicates whether the lakehouse should be schema-enabled.
@@ -288,20 +324,8 @@ def create_fabric_item(access_token, workspace_id, item_name, item_type, definit
 
     
     if not definition_base64 is None:
-        item_path = ""
-        if item_type == "DataPipeline":
-            item_path = "pipeline-content.json"
-        elif item_type == "Notebook":
-            item_path = "notebook-content.py"
-
         body["definition"] = {
-            "parts": [
-                {
-                    "path": item_path,
-                    "payload": definition_base64,
-                    "payloadType": "InlineBase64"
-                }
-            ]
+            "parts": get_definition_parts(item_type, definition_base64)
         }
     
     response = requests.post(f"{fabric_baseurl}/workspaces/{workspace_id}/items", headers=headers, json=body)
@@ -323,8 +347,9 @@ def update_fabric_item_definition(access_token, workspace_id, item_id, item_type
         The unique identifier of the item to update.
     item_type : str
         The type of the item (e.g., "DataPipeline" or "Notebook").
-    definition_base64 : str or None
-        A base64-encoded string containing the item's updated definition. If None, the update will not proceed.
+    definition_base64 : str, list or None
+        A base64-encoded string containing the item's updated definition or a list of definition parts 
+        (dicts with path, payload and payloadType). If None, the update will not proceed.
 
     Returns:
     -------
@@ -339,21 +364,9 @@ def update_fabric_item_definition(access_token, workspace_id, item_id, item_type
     }
 
     if not definition_base64 is None:
-        item_path = ""
-        if item_type == "DataPipeline":
-            item_path = "pipeline-content.json"
-        elif item_type == "Notebook":
-            item_path = "notebook-content.py"
-
         body = {
             "definition": {
-                "parts": [
-                    {
-                        "path": item_path,
-                        "payload": definition_base64,
-                        "payloadType": "InlineBase64"
-                    }
-                ]
+                "parts": get_definition_parts(item_type, definition_base64)
             }
         }
     